@@ -1,10 +1,13 @@
 import streamlit as st
 from datetime import date
-from services.crud import criar_usuario, autenticar_usuario, adicionar_movimento, ler_movimentos
-from views.dashboard import show_dashboard
-from views.assinaturas import show_assinaturas
+from services.crud import criar_usuario, autenticar_usuario, adicionar_movimento, materializar_recorrencias
+from services.autenticacao import criar_token, encerrar_sessao, renovar_token, validar_token
+from services.fila_escrita import falhas as falhas_escrita, descartar_falhas
+from services.instrumentacao import inicio_rerun, fim_rerun
+from views.debug import debug_ativo, show_painel_debug
 
 st.set_page_config(page_title="Finanças Multi-User", layout="wide")
+inicio_rerun()
 
 # --- GERENCIAMENTO DE SESSÃO ---
 if 'logado' not in st.session_state:
@@ -18,14 +21,31 @@ def login_sucesso(id, nome):
     st.session_state['logado'] = True
     st.session_state['usuario_id'] = id
     st.session_state['usuario_nome'] = nome
+    # O token assinado na URL reabre a sessão depois de um F5 sem consultar o banco
+    st.query_params["sessao"] = criar_token(id, nome)
     st.rerun()
 
 def logout():
+    # Revoga no banco todos os tokens do usuário: um que vazou da URL não reabre a sessão
+    encerrar_sessao(st.query_params.pop("sessao", None), st.session_state['usuario_id'])
     st.session_state['logado'] = False
     st.session_state['usuario_id'] = None
     st.session_state['usuario_nome'] = ""
     st.rerun()
 
+if not st.session_state['logado'] and "sessao" in st.query_params:
+    sessao = validar_token(st.query_params["sessao"])
+    if sessao:
+        st.session_state['logado'] = True
+        st.session_state['usuario_id'], st.session_state['usuario_nome'] = sessao
+    else:
+        st.query_params.pop("sessao", None)  # adulterado ou vencido: volta ao login
+elif st.session_state['logado'] and "sessao" in st.query_params:
+    # Validade curta (o token fica exposto na URL): quem está usando ganha um token novo na metade dela
+    novo_token = renovar_token(st.query_params["sessao"])
+    if novo_token:
+        st.query_params["sessao"] = novo_token
+
 # --- TELA DE LOGIN / REGISTRO ---
 if not st.session_state['logado']:
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -79,7 +99,8 @@ st.sidebar.button("Sair", on_click=logout)
 st.sidebar.markdown("---")
 
 st.sidebar.title("Menu")
-navegacao = st.sidebar.radio("Ir para:", ["Dashboard", "Assinaturas"])
+navegacao = st.sidebar.radio("Ir para:", ["Dashboard", "Tendências", "Assinaturas", "Buscar", "Relatórios"],
+                             key="navegacao")
 st.sidebar.markdown("---")
 
 LISTA_CATEGORIAS = ["Alimentação", "Moradia", "Transporte", "Assinaturas/Streaming", "Lazer", "Saúde", "Receita (Salário)", "Outros"]
@@ -101,10 +122,55 @@ with st.sidebar.expander("➕ Nova Transação"):
             st.success("Salvo!")
             st.rerun()
 
-# --- CARREGA DADOS DO USUÁRIO ESPECÍFICO ---
-df = ler_movimentos(user_id)
+with st.sidebar.expander("📥 Importar Extrato"):
+    arquivo = st.file_uploader("Arquivo do banco (CSV ou OFX)", type=["csv", "ofx"])
+    if arquivo is not None and st.button("Importar"):
+        from services.importacao import importar_extrato
+        barra = st.progress(0.0, text="Importando...")
+        try:
+            stats = importar_extrato(user_id, arquivo, arquivo.name,
+                                     progresso=lambda n, fracao: barra.progress(fracao, text=f"{n:,} linhas lidas..."))
+        except ValueError as e:
+            st.error(f"Arquivo não reconhecido: {e}")
+        else:
+            barra.progress(1.0, text="Concluído")
+            st.success(f"{stats['inseridas']} lançamentos importados "
+                       f"({stats['duplicadas']} já existiam, {stats['linhas_por_segundo']:,.0f} linhas/s)")
+
+# --- ESCRITAS QUE A FILA NÃO CONSEGUIU GRAVAR (só com a escrita assíncrona ligada) ---
+falhas = falhas_escrita(user_id)
+if falhas:
+    with st.sidebar.expander(f"⚠️ {len(falhas)} alteração(ões) não gravada(s)", expanded=True):
+        for falha in falhas:
+            st.caption(f"{falha['criado_em']:%d/%m %H:%M} · {falha['operacao']}: {falha['erro']}")
+        if st.button("Dispensar aviso"):
+            descartar_falhas(user_id)
+            st.rerun()
 
+# --- RECORRÊNCIAS DO MÊS ---
+# Só lê as regras (em cache) e sai; na virada do mês grava os lançamentos delas em lote
+materializar_recorrencias(user_id)
+
+# --- CADA TELA CARREGA SÓ O MÊS QUE VAI MOSTRAR ---
+# As views são importadas só quando abertas: o login e a primeira tela não pagam
+# o import das outras (o Python guarda o módulo, as próximas reruns não reimportam)
 if navegacao == "Dashboard":
-    show_dashboard(user_id, df, LISTA_CATEGORIAS)
+    from views.dashboard import show_dashboard
+    show_dashboard(user_id, LISTA_CATEGORIAS)
+elif navegacao == "Tendências":
+    from views.tendencias import show_tendencias
+    show_tendencias(user_id)
 elif navegacao == "Assinaturas":
-    show_assinaturas(df)
\ No newline at end of file
+    from views.assinaturas import show_assinaturas
+    show_assinaturas(user_id)
+elif navegacao == "Buscar":
+    from views.busca import show_busca
+    show_busca(user_id)
+elif navegacao == "Relatórios":
+    from views.relatorios import show_relatorios
+    show_relatorios(user_id)
+
+# --- MÉTRICAS DA RERUN ---
+if debug_ativo():
+    show_painel_debug()
+fim_rerun(usuario=user_id, tela=navegacao)
@@ -0,0 +1,9 @@
+"""Benchmarks headless (sem servidor Streamlit) das funções do crud e da preparação de dados das telas.
+
+    python -m benchmarks.executar                              # SQLite temporário, 1k/10k/100k movimentos
+    python -m benchmarks.executar --tamanhos 1000 1000000      # até 1M movimentos
+    python -m benchmarks.executar --backend postgresql         # usa o banco do secrets.toml
+    python -m benchmarks.executar --comparar antigo.json novo.json
+
+O relatório JSON sai em benchmarks/resultados/<commit>.json.
+"""
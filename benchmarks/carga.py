@@ -0,0 +1,283 @@
+"""Teste de carga: centenas de usuários simultâneos em vários processos.
+
+    python -m benchmarks.carga [--usuarios 200] [--processos 4] [--duracao 20] [--conexoes-max 8]
+                               [--modos isolado compartilhado] [--saida carga.json]
+
+Cada processo faz o papel de um `streamlit run` atrás do balanceador e roda uma
+thread por usuário. O usuário faz login (hash da senha + token), e então repete
+o que a rerun do dashboard busca no crud, com um tempo de "leitura" entre as
+reruns; uma parte das reruns também muda o status de um lançamento. Uma fração
+das reruns atende um usuário de outro processo (o F5 que o balanceador mandou
+para cá): a sessão vem só do token e o dashboard dele sai do cache deste
+processo, do nível 2 compartilhado ou do banco.
+
+Modos:
+- isolado: cada processo com o seu cache e o seu pool (até pool_max conexões cada);
+- compartilhado: services/compartilhado ligado num arquivo comum, com cache de
+  dois níveis, sessões e chave dos tokens na loja (sem [auth] segredo) e no
+  máximo --conexoes-max conexões somando todos.
+
+O banco é um SQLite temporário (ou o Postgres configurado, com --backend).
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+RAIZ = Path(__file__).resolve().parent.parent
+MODOS = ["isolado", "compartilhado"]
+OPERACOES = ["login", "dashboard", "escrita", "outro_processo"]
+SEGREDO = "benchmark-carga"   # só no modo isolado: sem a loja, a chave dos tokens precisa ser configurada
+PENSAR_S = 0.5          # intervalo médio entre duas reruns de um usuário
+FRACAO_ESCRITAS = 0.1   # reruns que também gravam
+FRACAO_OUTRO_PROCESSO = 0.1   # reruns que atendem um usuário logado em outro processo
+
+
+# --- PROCESSO FILHO (um "worker") ---
+
+def _percentis(ms):
+    if not ms:
+        return {"n": 0}
+    ms = np.array(ms)
+    return {"n": len(ms), "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "max_ms": float(ms.max())}
+
+
+def _worker(config):
+    from benchmarks.dados_sinteticos import SENHA
+    from benchmarks.executar import _silenciar_streamlit
+    from services import autenticacao, compartilhado, crud
+    from services.cache import estatisticas_cache
+    from services.database import estatisticas_pool
+
+    _silenciar_streamlit()
+    if config["compartilhado"]:
+        compartilhado.ligar(config["compartilhado"], conexoes_max=config["conexoes_max"])
+    loja = compartilhado.get_loja()
+
+    medidas = {operacao: [] for operacao in OPERACOES}
+    erros = []
+    lock = threading.Lock()
+    pico = {"conexoes_processo": 0, "conexoes_total": 0}
+    fim = time.monotonic() + config["duracao"]
+
+    def medir(nome, funcao):
+        inicio = time.perf_counter()
+        try:
+            resultado = funcao()
+        except Exception as e:
+            with lock:
+                erros.append(f"{nome}: {type(e).__name__}: {e}")
+            return None
+        with lock:
+            medidas[nome].append((time.perf_counter() - inicio) * 1000)
+        return resultado
+
+    def rerun_dashboard(user_id, mes):
+        crud.listar_meses(user_id)
+        crud.resumo_mes(user_id, mes)
+        gastos = crud.gastos_por_categoria(user_id, mes)
+        pagina, _ = crud.ler_extrato_pagina(user_id, mes)
+        crud.contar_extrato(user_id, mes)
+        crud.ler_metas(user_id)
+        return pagina, gastos
+
+    visitas = config["visitas"]
+
+    def visitar(token):
+        sessao = autenticacao.validar_token(token)
+        if sessao is None:
+            raise RuntimeError("token de outro processo recusado")
+        meses = crud.listar_meses(sessao[0]) or [None]
+        return rerun_dashboard(sessao[0], meses[0])
+
+    def usuario(email, semente):
+        rng = random.Random(semente)
+        time.sleep(rng.uniform(0, PENSAR_S))  # chegadas espalhadas, não todas no mesmo instante
+        login = medir("login", lambda: crud.autenticar_usuario(email, SENHA))
+        if not login:
+            with lock:
+                erros.append(f"login: {email} não autenticou")
+            return
+        user_id, nome = login
+        autenticacao.criar_token(user_id, nome)
+        meses = crud.listar_meses(user_id) or [None]
+        while time.monotonic() < fim:
+            if visitas and rng.random() < FRACAO_OUTRO_PROCESSO:
+                medir("outro_processo", lambda: visitar(rng.choice(visitas)))
+                time.sleep(rng.expovariate(1 / PENSAR_S))
+                continue
+            resultado = medir("dashboard", lambda: rerun_dashboard(user_id, meses[0]))
+            if resultado is not None and rng.random() < FRACAO_ESCRITAS and not resultado[0].empty:
+                linha = resultado[0].iloc[rng.randrange(len(resultado[0]))]
+                medir("escrita", lambda: crud.mudar_status_pago(int(linha["id"]), user_id, not bool(linha["pago"])))
+            time.sleep(rng.expovariate(1 / PENSAR_S))
+
+    def monitorar():
+        while time.monotonic() < fim:
+            stats = estatisticas_pool()
+            pico["conexoes_processo"] = max(pico["conexoes_processo"], stats["abertas"])
+            if loja is not None:
+                pico["conexoes_total"] = max(pico["conexoes_total"], sum(loja.conexoes_abertas().values()))
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=usuario, args=(email, hash(email) ^ config["indice"]), daemon=True)
+               for email in config["emails"]]
+    threads.append(threading.Thread(target=monitorar, daemon=True))
+    inicio = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=config["duracao"] + 60)
+
+    print(json.dumps({
+        "segundos": time.monotonic() - inicio,
+        "medidas": medidas,
+        "erros": erros[:20],
+        "total_erros": len(erros),
+        "pico": pico,
+        "pool": estatisticas_pool(),
+        "cache": estatisticas_cache(),
+    }, default=str))
+
+
+# --- PROCESSO PRINCIPAL ---
+
+def _preparar_banco(backend, usuarios, movimentos):
+    """Cria os usuários (todos com o mesmo hash, calculado uma vez) e os movimentos de cada um: [(email, id)]."""
+    from benchmarks.dados_sinteticos import SENHA, email_sintetico, gerar_movimentos
+    from benchmarks.executar import _preparar_backend, _silenciar_streamlit
+    from services.autenticacao import hash_senha
+    from services.crud import copiar_movimentos
+    from services.database import conexao, fechar_pool
+
+    _silenciar_streamlit()
+    _preparar_backend(backend)
+    senha_hash = hash_senha(SENHA)
+    emails = [email_sintetico(10_000 + i) for i in range(usuarios)]
+    with conexao() as conn:
+        cursor = conn.cursor()
+        for i, email in enumerate(emails):
+            cursor.execute("SELECT id FROM usuarios WHERE email = %s", (email,))
+            if cursor.fetchone() is None:
+                cursor.execute("INSERT INTO usuarios (nome, email, senha) VALUES (%s, %s, %s)",
+                               (f"Carga {i}", email, senha_hash))
+        cursor.execute("SELECT email, id FROM usuarios WHERE email IN (" + ", ".join(["%s"] * len(emails)) + ")",
+                       emails)
+        ids = dict(cursor.fetchall())
+    for user_id in ids.values():
+        copiar_movimentos(user_id, gerar_movimentos(movimentos, semente=user_id))
+    fechar_pool()
+    return [(email, ids[email]) for email in emails]
+
+
+def _tokens(usuarios, caminho_compartilhado):
+    """Tokens já logados (para as visitas vindas de outro processo), registrados na loja se houver."""
+    from services import compartilhado
+    from services.autenticacao import criar_token
+    if caminho_compartilhado:
+        compartilhado.ligar(caminho_compartilhado)
+    return [criar_token(user_id, email) for email, user_id in usuarios]
+
+
+def _rodar_modo(modo, usuarios, args, pasta):
+    # No compartilhado os processos (e este, que emite os tokens das visitas) usam a chave da loja
+    if modo == "isolado":
+        os.environ["FINANCAS_AUTH_SEGREDO"] = SEGREDO
+    else:
+        os.environ.pop("FINANCAS_AUTH_SEGREDO", None)
+    ambiente = dict(os.environ)
+    compartilhado = str(pasta / f"compartilhado-{time.time_ns()}.db") if modo == "compartilhado" else None
+    tokens = _tokens(usuarios, compartilhado)
+    emails = [email for email, _ in usuarios]
+    processos = []
+    for indice in range(args.processos):
+        # Visitas: os usuários que fizeram login nos outros processos
+        visitas = [t for i, t in enumerate(tokens) if i % args.processos != indice]
+        config = {"indice": indice, "emails": emails[indice::args.processos], "visitas": visitas,
+                  "duracao": args.duracao, "compartilhado": compartilhado, "conexoes_max": args.conexoes_max}
+        processos.append(subprocess.Popen([sys.executable, "-m", "benchmarks.carga", "--worker", json.dumps(config)],
+                                          cwd=RAIZ, env=ambiente, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                          text=True))
+    saidas = []
+    for processo in processos:
+        stdout, stderr = processo.communicate()
+        if processo.returncode != 0:
+            raise RuntimeError(f"worker falhou:\n{stderr[-3000:]}")
+        saidas.append(json.loads(stdout.strip().splitlines()[-1]))
+
+    resultado = {"modo": modo, "processos": args.processos, "usuarios": len(emails)}
+    for operacao in OPERACOES:
+        resultado[operacao] = _percentis([ms for s in saidas for ms in s["medidas"][operacao]])
+    segundos = max(s["segundos"] for s in saidas)
+    resultado["reruns_por_s"] = (resultado["dashboard"]["n"] + resultado["outro_processo"]["n"]) / segundos
+    resultado["erros"] = sum(s["total_erros"] for s in saidas)
+    resultado["exemplos_erro"] = [e for s in saidas for e in s["erros"]][:5]
+    resultado["esgotamentos_pool"] = sum(s["pool"]["esgotamentos"] for s in saidas)
+    resultado["conexoes_abertas_max"] = (max(s["pico"]["conexoes_total"] for s in saidas) if compartilhado
+                                         else sum(s["pico"]["conexoes_processo"] for s in saidas))
+    resultado["conexoes_criadas"] = sum(s["pool"]["conexoes"] for s in saidas)
+    acertos = sum(s["cache"]["hits"] + s["cache"]["hits_nivel2"] for s in saidas)
+    leituras = acertos + sum(s["cache"]["misses"] for s in saidas)
+    resultado["taxa_acerto_cache"] = acertos / leituras if leituras else 0.0
+    resultado["hits_nivel2"] = sum(s["cache"]["hits_nivel2"] for s in saidas)
+    return resultado
+
+
+def _imprimir(r):
+    print(f"\n[{r['modo']}] {r['usuarios']} usuários em {r['processos']} processos: "
+          f"{r['reruns_por_s']:.1f} reruns/s, {r['erros']} erros, {r['esgotamentos_pool']} pools esgotados",
+          file=sys.stderr)
+    for operacao in OPERACOES:
+        m = r[operacao]
+        if m["n"]:
+            print(f"  {operacao:<14} n={m['n']:>6}  p50={m['p50_ms']:8.1f}  p95={m['p95_ms']:8.1f}  "
+                  f"p99={m['p99_ms']:8.1f}  max={m['max_ms']:8.1f} ms", file=sys.stderr)
+    print(f"  conexões abertas (pico, todos os processos): {r['conexoes_abertas_max']}, "
+          f"criadas: {r['conexoes_criadas']}", file=sys.stderr)
+    print(f"  cache: {r['taxa_acerto_cache']:.0%} de acerto ({r['hits_nivel2']} vindos de outro processo)",
+          file=sys.stderr)
+    for exemplo in r["exemplos_erro"]:
+        print(f"  erro: {exemplo}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga com vários processos")
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--processos", type=int, default=4)
+    parser.add_argument("--duracao", type=float, default=20.0, help="segundos de navegação")
+    parser.add_argument("--movimentos", type=int, default=300, help="movimentos por usuário")
+    parser.add_argument("--conexoes-max", type=int, default=8, help="orçamento somado (modo compartilhado)")
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=MODOS)
+    parser.add_argument("--backend", choices=["sqlite", "postgresql"], default="sqlite")
+    parser.add_argument("--saida", help="arquivo JSON do relatório")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        _worker(json.loads(args.worker))
+        return 0
+
+    usuarios = _preparar_banco(args.backend, args.usuarios, args.movimentos)
+    pasta = Path(tempfile.mkdtemp(prefix="bench-carga-"))
+    resultados = []
+    for modo in args.modos:
+        resultado = _rodar_modo(modo, usuarios, args, pasta)
+        _imprimir(resultado)
+        resultados.append(resultado)
+    if args.saida:
+        Path(args.saida).write_text(json.dumps({"resultados": resultados}, indent=2, ensure_ascii=False),
+                                    encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
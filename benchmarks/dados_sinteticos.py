@@ -0,0 +1,70 @@
+"""Usuários e movimentos sintéticos para os benchmarks (gerados com NumPy, sem loop por linha)."""
+import math
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from services.crud import autenticar_usuario, copiar_movimentos, criar_usuario
+
+# Mesma lista do app.py
+CATEGORIAS = ["Alimentação", "Moradia", "Transporte", "Assinaturas/Streaming", "Lazer", "Saúde", "Receita (Salário)", "Outros"]
+CATEGORIAS_DESPESA = [c for c in CATEGORIAS if "Receita" not in c]
+PESOS_DESPESA = [0.35, 0.05, 0.2, 0.05, 0.15, 0.05, 0.15]
+
+POR_MES = 80        # densidade típica de lançamentos por mês
+MAX_MESES = 360     # acima de 30 anos a densidade cresce em vez do histórico
+BLOCO_CARGA = 50_000
+SENHA = "benchmark"
+
+
+def email_sintetico(indice):
+    return f"bench-{indice}@benchmark.local"
+
+
+def gerar_movimentos(n, semente=0, fim=None):
+    """DataFrame com `n` movimentos espalhados pelos meses que terminam em `fim` (mês atual)."""
+    rng = np.random.default_rng(semente)
+    fim = fim or date.today()
+    meses = min(max(math.ceil(n / POR_MES), 1), MAX_MESES)
+    ultimo = fim.year * 12 + fim.month - 1
+    ordinal = ultimo - rng.integers(0, meses, n)
+    datas = pd.to_datetime(pd.DataFrame({"year": ordinal // 12, "month": ordinal % 12 + 1,
+                                         "day": rng.integers(1, 29, n)}))
+
+    receita = rng.random(n) < 0.08
+    categoria = np.where(receita, "Receita (Salário)", rng.choice(CATEGORIAS_DESPESA, n, p=PESOS_DESPESA))
+    valor = np.where(receita, rng.uniform(3000, 8000, n), -rng.lognormal(4.0, 1.0, n)).round(2)
+    return pd.DataFrame({
+        "data": datas.dt.date,
+        "categoria": categoria,
+        "descricao": np.char.add("Lançamento ", rng.integers(0, 5000, n).astype(str)),
+        "tipo": np.where(receita, "Receita", "Despesa"),
+        "valor": valor,
+        "fixo": rng.random(n) < 0.15,
+        "pago": rng.random(n) < 0.85,
+        # Hash único: a carga passa pelo mesmo caminho de COPY da importação de extratos
+        "hash_importacao": np.arange(n, dtype=np.int64) + semente * 10_000_000_000,
+    })
+
+
+def criar_usuario_sintetico(indice, n, semente=None):
+    """Cria (ou reaproveita) o usuário `indice` e carrega `n` movimentos. Devolve (user_id, stats da carga)."""
+    email = email_sintetico(indice)
+    usuario = autenticar_usuario(email, SENHA)
+    if usuario is None:
+        criar_usuario(f"Benchmark {indice}", email, SENHA)
+        usuario = autenticar_usuario(email, SENHA)
+    user_id = usuario[0]
+
+    df = gerar_movimentos(n, semente=indice if semente is None else semente)
+    inseridas = 0
+    segundos = 0.0
+    for inicio in range(0, n, BLOCO_CARGA):
+        bloco = df.iloc[inicio:inicio + BLOCO_CARGA]
+        inicio_bloco = time.perf_counter()
+        inseridas += copiar_movimentos(user_id, bloco)
+        segundos += time.perf_counter() - inicio_bloco
+    return user_id, {"inseridas": inseridas, "segundos": segundos,
+                     "linhas_por_s": inseridas / segundos if segundos else 0.0}
@@ -0,0 +1,368 @@
+"""Executa o benchmark completo e grava o relatório JSON (ver benchmarks/__init__.py)."""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+import warnings
+from datetime import date, datetime
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.dados_sinteticos import CATEGORIAS_DESPESA, SENHA, criar_usuario_sintetico
+from benchmarks.medicao import ORCAMENTO_S, REPETICOES, medir
+from services import autenticacao, crud, exportacao, fila_escrita, recorrencias
+from services.cache import cache
+from services.database import conexao, dialeto, estatisticas_pool, fechar_pool
+from services.migracoes import aplicar_migracoes
+from views.assinaturas import resumo_assinaturas, resumo_recorrentes
+from views.dashboard import calcular_metas, montar_grafico_gastos, preparar_extrato
+from views.figuras import figura_em_cache
+from views.tendencias import gastos_categoria_moveis, montar_series, projetar_fixos
+
+PASTA_RESULTADOS = Path(__file__).parent / "resultados"
+TAMANHOS_PADRAO = [1_000, 10_000, 100_000]
+
+
+def _commit_atual():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, check=True).stdout.strip()
+        sujo = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                              text=True, cwd=Path(__file__).parent).stdout.strip()
+        return commit + ("-sujo" if sujo else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+def _preparar_backend(backend):
+    if backend == "sqlite":
+        os.environ["FINANCAS_BACKEND"] = "sqlite"
+        os.environ["FINANCAS_SQLITE_PATH"] = str(Path(tempfile.mkdtemp(prefix="bench-financas-")) / "bench.db")
+    else:
+        os.environ["FINANCAS_BACKEND"] = backend
+    fechar_pool(trocar_backend=True)
+    cache.limpar()
+    aplicar_migracoes()
+
+
+def _limpar_usuarios_sinteticos():
+    with conexao() as conn:
+        if conn:
+            conn.cursor().execute("DELETE FROM usuarios WHERE email LIKE %s", ("bench-%@benchmark.local",))
+
+
+def _id_por_descricao(user_id, descricao):
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM movimentos WHERE user_id = %s AND descricao = %s", (user_id, descricao))
+        return cursor.fetchone()[0]
+
+
+def _operacoes(user_id):
+    """(nome, função, antes) de cada operação medida. Leituras rodam com o cache vazio."""
+    meses = crud.listar_meses(user_id)
+    mes = meses[0]
+    hoje = date.today()
+    for categoria in CATEGORIAS_DESPESA[:3]:
+        crud.salvar_meta(user_id, categoria, 500.0)
+    # Regras de recorrência começando há dois anos (as mensais já gravam ~24 meses cada)
+    inicio_regras = hoje.replace(day=1, year=hoje.year - 2)
+    for i in range(20):
+        crud.criar_recorrencia(user_id, inicio_regras.replace(day=1 + i), CATEGORIAS_DESPESA[i % len(CATEGORIAS_DESPESA)],
+                               f"bench-recorrencia {i}", "Despesa", -10.0 - i, "anual" if i % 5 == 0 else "mensal",
+                               1 + i % 3, retroativo=True)
+    regras = crud.ler_recorrencias(user_id)
+
+    df_mes = crud.ler_movimentos_mes(user_id, mes)
+    df_gastos = crud.gastos_por_categoria(user_id, mes)
+    df_metas = crud.ler_metas(user_id)
+
+    crud.adicionar_movimento(user_id, hoje, "Outros", "bench-alvo", "Despesa", -1.0, False, False)
+    id_alvo = _id_por_descricao(user_id, "bench-alvo")
+    estado = {"pago": False, "clone": 0, "excluir": None, "virada": 0, "conversoes": 0, "mes_conversao": None}
+
+    def alternar_status():
+        estado["pago"] = not estado["pago"]
+        crud.mudar_status_pago(id_alvo, user_id, estado["pago"])
+
+    def ligar_fila():
+        if not fila_escrita.ativa():
+            fila_escrita.ligar(str(Path(tempfile.mkdtemp(prefix="bench-fila-")) / "fila.db"))
+
+    def escrever_e_ler():
+        # Uma sequência de cliques seguida da rerun que precisa enxergar todos
+        for _ in range(50):
+            alternar_status()
+        return crud.resumo_mes(user_id, mes)
+
+    def preparar_exclusao():
+        cache.limpar()
+        crud.adicionar_movimento(user_id, hoje, "Outros", "bench-excluir", "Despesa", -1.0, False, True)
+        estado["excluir"] = _id_por_descricao(user_id, "bench-excluir")
+
+    def clonar():
+        # Cada execução clona para um mês ainda vazio, para medir inserção de verdade
+        estado["clone"] += 1
+        return crud.clonar_fixos(user_id, mes, meses=estado["clone"])
+
+    def preparar_conversao():
+        # Um mês novo (bem no futuro) com fixos, dois deles iguais na mesma data: só um
+        # pode ir para a regra (índice único (recorrencia_id, data)), o outro fica avulso
+        cache.limpar()
+        estado["conversoes"] += 1
+        dia = date(hoje.year + 50, 1, 10) + pd.DateOffset(months=estado["conversoes"])
+        estado["mes_conversao"] = dia.strftime("%Y-%m")
+        for descricao in ("bench-fixo", "bench-fixo", "bench-fixo 2"):
+            crud.adicionar_movimento(user_id, dia.date(), "Moradia", descricao, "Despesa", -50.0, True, False)
+
+    def virar_mes():
+        # Cada execução avança um mês: todas as regras atrasadas entram num lote
+        estado["virada"] += 1
+        return crud.materializar_recorrencias(user_id, pd.Timestamp(hoje) + pd.DateOffset(months=estado["virada"]))
+
+    df_hist = crud.ler_movimentos(user_id)
+    segunda_pagina = crud.ler_extrato_pagina(user_id, mes, "valor", True)[1]
+    df_serie = crud.serie_mensal(user_id)
+    df_fixos = crud.ler_fixos_recentes(user_id)
+
+    def rerun_tendencias():
+        serie = crud.serie_mensal(user_id)
+        series = montar_series(serie)
+        gastos_categoria_moveis(serie)
+        return projetar_fixos(crud.ler_fixos_recentes(user_id), series, 12, crud.ler_recorrencias(user_id))
+
+    def gastos_por_mes():
+        # Agregação sobre o histórico inteiro: chave de mês inteira + categorias
+        despesas = df_hist[df_hist["valor_centavos"] < 0]
+        return despesas.groupby(["mes", "categoria"], observed=True)["valor_centavos"].sum()
+
+    def busca_sem_indice():
+        # O que a busca em todos os meses custaria com o ILIKE do extrato, sem o índice de busca
+        with conexao() as conn:
+            return pd.read_sql_query(f"SELECT {crud.COLUNAS_MOVIMENTO} FROM movimentos WHERE user_id = %s "
+                                     "AND (descricao ILIKE %s OR categoria ILIKE %s) ORDER BY data DESC, id DESC "
+                                     "LIMIT 100", conn, params=(user_id, "%bench-alvo%", "%bench-alvo%"))
+
+    def rerun_dashboard():
+        # O que uma rerun do show_dashboard busca (sem desenhar nada)
+        crud.listar_meses(user_id)
+        crud.resumo_mes(user_id, mes)
+        gastos = crud.gastos_por_categoria(user_id, mes)
+        pagina, _ = crud.ler_extrato_pagina(user_id, mes)
+        crud.contar_extrato(user_id, mes)
+        calcular_metas(crud.ler_metas(user_id), gastos)
+        return preparar_extrato(pagina)[0]
+
+    with conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT email FROM usuarios WHERE id = %s", (user_id,))
+        email = cursor.fetchone()[0]
+    token = autenticacao.criar_token(user_id, "Benchmark")
+
+    ano = mes[:4]
+
+    frio = cache.limpar
+    return [
+        ("crud.ler_movimentos", lambda: crud.ler_movimentos(user_id), frio),
+        ("crud.autenticar_usuario", lambda: crud.autenticar_usuario(email, SENHA), frio),
+        ("crud.autenticar_usuario (usuário em cache)", lambda: crud.autenticar_usuario(email, SENHA), None),
+        ("autenticacao.validar_token", lambda: autenticacao.validar_token(token), None),
+        # Custo do hash por N: escolher o [auth] scrypt_n que cabe no tempo de login aceitável
+        *[(f"autenticacao.hash_senha (N=2^{n.bit_length() - 1})", lambda n=n: autenticacao.hash_senha(SENHA, n), None)
+          for n in (2 ** 12, 2 ** 14, 2 ** 15)],
+        ("crud.listar_meses", lambda: crud.listar_meses(user_id), frio),
+        ("crud.resumo_mes", lambda: crud.resumo_mes(user_id, mes), frio),
+        ("crud.gastos_por_categoria", lambda: crud.gastos_por_categoria(user_id, mes), frio),
+        ("crud.ler_movimentos_mes", lambda: crud.ler_movimentos_mes(user_id, mes), frio),
+        ("crud.ler_extrato_pagina", lambda: crud.ler_extrato_pagina(user_id, mes)[0], frio),
+        ("crud.ler_extrato_pagina (valor, 2ª página)",
+         lambda: crud.ler_extrato_pagina(user_id, mes, "valor", True, apos=segunda_pagina)[0], frio),
+        ("crud.ler_extrato_pagina (busca)", lambda: crud.ler_extrato_pagina(user_id, mes, busca="lançamento 1")[0], frio),
+        ("crud.buscar_movimentos (termo raro)", lambda: crud.buscar_movimentos(user_id, "bench-alvo"), frio),
+        ("crud.buscar_movimentos (termo comum)", lambda: crud.buscar_movimentos(user_id, "lançamento"), frio),
+        ("crud.buscar_movimentos (aproximada)", lambda: crud.buscar_movimentos(user_id, "bench alvu", aproximada=True),
+         frio),
+        ("crud.buscar_movimentos (só faixa de valor)",
+         lambda: crud.buscar_movimentos(user_id, valor_min=100.0, valor_max=110.0), frio),
+        ("sql.busca por ILIKE sem índice (termo raro)", busca_sem_indice, None),
+        ("crud.relatorio_anual", lambda: crud.relatorio_anual(user_id, ano), frio),
+        ("exportacao.exportar_movimentos (csv, um ano)",
+         lambda: exportacao.exportar_movimentos(user_id, io.BytesIO(), "csv", ano), None),
+        ("crud.ler_metas", lambda: crud.ler_metas(user_id), frio),
+        ("crud.salvar_meta", lambda: crud.salvar_meta(user_id, "Lazer", 300.0), None),
+        ("crud.adicionar_movimento",
+         lambda: crud.adicionar_movimento(user_id, hoje, "Outros", "bench-novo", "Despesa", -2.0, False, True), None),
+        ("crud.mudar_status_pago", alternar_status, None),
+        ("fila.mudar_status_pago (só enfileirar)", alternar_status, ligar_fila),
+        ("fila.50 escritas + leitura", escrever_e_ler, ligar_fila),
+        ("crud.50 escritas + leitura (síncrono)", escrever_e_ler, fila_escrita.desligar),
+        ("crud.atualizar_movimento",
+         lambda: crud.atualizar_movimento(id_alvo, user_id, hoje, "Lazer", "bench-alvo", -3.0, False), None),
+        ("crud.excluir_movimento", lambda: crud.excluir_movimento(estado["excluir"], user_id), preparar_exclusao),
+        ("crud.clonar_fixos", clonar, frio),
+        ("crud.converter_fixos_em_recorrencias",
+         lambda: crud.converter_fixos_em_recorrencias(user_id, estado["mes_conversao"]), preparar_conversao),
+        ("crud.materializar_recorrencias (em dia)", lambda: crud.materializar_recorrencias(user_id, hoje), None),
+        ("crud.materializar_recorrencias (virada do mês)", virar_mes, frio),
+        ("recorrencias.ocorrencias (10 anos)",
+         lambda: recorrencias.ocorrencias(regras, hoje, pd.Timestamp(hoje) + pd.DateOffset(years=10)), None),
+        ("views.assinaturas.resumo_recorrentes", lambda: resumo_recorrentes(regras), None),
+        ("views.dashboard.preparar_extrato", lambda: preparar_extrato(df_mes)[0], None),
+        ("views.dashboard.calcular_metas", lambda: calcular_metas(df_metas, df_gastos), None),
+        ("views.dashboard.montar_grafico_gastos", lambda: montar_grafico_gastos(df_gastos), None),
+        ("views.figuras.figura_em_cache (gastos do mês)",
+         lambda: figura_em_cache(montar_grafico_gastos, df_gastos), None),
+        ("views.assinaturas.resumo_assinaturas", lambda: resumo_assinaturas(df_gastos), None),
+        ("crud.serie_mensal", lambda: crud.serie_mensal(user_id), frio),
+        ("crud.ler_fixos_recentes", lambda: crud.ler_fixos_recentes(user_id), frio),
+        ("views.tendencias.montar_series", lambda: montar_series(df_serie), None),
+        ("views.tendencias.gastos_categoria_moveis", lambda: gastos_categoria_moveis(df_serie), None),
+        ("views.tendencias.projetar_fixos", lambda: projetar_fixos(df_fixos, montar_series(df_serie), 12, regras), None),
+        ("tendencias.rerun_frio", rerun_tendencias, frio),
+        ("pandas.filtro_mes", lambda: df_hist[df_hist["mes"] == df_hist["mes"].max()], None),
+        ("pandas.gastos_por_mes_categoria", gastos_por_mes, None),
+        ("dashboard.rerun_frio", rerun_dashboard, frio),
+        ("dashboard.rerun_quente", rerun_dashboard, None),
+    ]
+
+
+def _memoria_frame(user_id):
+    """Bytes (deep) do histórico no frame tipado do crud contra o read_sql_query cru."""
+    with conexao() as conn:
+        cru = pd.read_sql_query("SELECT * FROM movimentos WHERE user_id = %s", conn, params=(user_id,))
+    cache.limpar()
+    tipado = crud.ler_movimentos(user_id)
+    return {"bytes_cru": int(cru.memory_usage(deep=True).sum()),
+            "bytes": int(tipado.memory_usage(deep=True).sum()), "linhas": len(tipado)}
+
+
+def _exportacoes(user_id):
+    """Vazão e pico de memória de exportar o histórico inteiro em cada formato.
+
+    O pico sai de uma segunda passada: com o tracemalloc ligado a exportação fica várias vezes mais lenta.
+    """
+    registros = []
+    for formato in exportacao.formatos_disponiveis():
+        with tempfile.TemporaryFile() as destino:
+            stats = exportacao.exportar_movimentos(user_id, destino, formato)
+        with tempfile.TemporaryFile() as destino:
+            tracemalloc.start()
+            exportacao.exportar_movimentos(user_id, destino, formato)
+            pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        registros.append({"operacao": f"exportacao.exportar_movimentos ({formato})", "linhas": stats["linhas"],
+                          "segundos": stats["segundos"], "linhas_por_s": stats["linhas_por_segundo"],
+                          "bytes_arquivo": stats["bytes"], "bytes_pico": pico})
+    return registros
+
+
+def executar(tamanhos, backend="sqlite", usuarios_extra=1, repeticoes=REPETICOES, orcamento_s=ORCAMENTO_S):
+    _preparar_backend(backend)
+    resultados = []
+    proximo_indice = 0
+    try:
+        for n in tamanhos:
+            # Outros usuários no mesmo banco: o filtro por user_id precisa do índice de verdade
+            for _ in range(usuarios_extra):
+                criar_usuario_sintetico(proximo_indice, max(n // 4, 1))
+                proximo_indice += 1
+            user_id, carga = criar_usuario_sintetico(proximo_indice, n)
+            proximo_indice += 1
+            resultados.append({"tamanho": n, "operacao": "crud.copiar_movimentos (carga)",
+                               "linhas": carga["inseridas"], "segundos": carga["segundos"],
+                               "linhas_por_s": carga["linhas_por_s"]})
+            print(f"[{n:>9,} movimentos] carga: {carga['linhas_por_s']:,.0f} linhas/s", file=sys.stderr)
+
+            memoria = _memoria_frame(user_id)
+            resultados.append({"tamanho": n, "operacao": "crud.ler_movimentos (memória)", **memoria})
+            print(f"[{n:>9,} movimentos] memória do histórico: {memoria['bytes_cru'] / 1024:,.0f} KB cru -> "
+                  f"{memoria['bytes'] / 1024:,.0f} KB tipado", file=sys.stderr)
+
+            for exportado in _exportacoes(user_id):
+                resultados.append({"tamanho": n, **exportado})
+                print(f"[{n:>9,} movimentos] {exportado['operacao']}: {exportado['linhas_por_s']:,.0f} linhas/s, "
+                      f"{exportado['bytes_arquivo'] / 1024:,.0f} KB, pico de {exportado['bytes_pico'] / 1024:,.0f} KB "
+                      "em memória", file=sys.stderr)
+
+            for nome, funcao, antes in _operacoes(user_id):
+                medida = medir(funcao, antes, repeticoes=repeticoes, orcamento_s=orcamento_s)
+                resultados.append({"tamanho": n, "operacao": nome, **medida})
+                print(f"[{n:>9,} movimentos] {nome:<40} p50={medida['p50_ms']:9.2f} ms  "
+                      f"p95={medida['p95_ms']:9.2f} ms", file=sys.stderr)
+    finally:
+        if backend != "sqlite":
+            _limpar_usuarios_sinteticos()
+
+    return {
+        "commit": _commit_atual(),
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "backend": dialeto(),
+        "ambiente": {"python": platform.python_version(), "pandas": pd.__version__,
+                     "plataforma": platform.platform()},
+        "pool": estatisticas_pool(),
+        "resultados": resultados,
+    }
+
+
+def comparar(caminho_antes, caminho_depois):
+    """Tabela de p50 (ou linhas/s da carga e das exportações) entre dois relatórios."""
+    antes, depois = (json.loads(Path(c).read_text(encoding="utf-8")) for c in (caminho_antes, caminho_depois))
+    chave = lambda r: (r["tamanho"], r["operacao"])
+    base = {chave(r): r for r in antes["resultados"]}
+    print(f"{antes['commit']} -> {depois['commit']}")
+    for r in depois["resultados"]:
+        a = base.get(chave(r))
+        if a is None:
+            continue
+        if "p50_ms" in r:
+            razao = r["p50_ms"] / a["p50_ms"] if a["p50_ms"] else float("inf")
+            print(f"{r['tamanho']:>9,} {r['operacao']:<40} {a['p50_ms']:9.2f} -> {r['p50_ms']:9.2f} ms  ({razao:.2f}x)")
+        elif "bytes" in r:
+            print(f"{r['tamanho']:>9,} {r['operacao']:<40} {a['bytes'] / 1024:9,.0f} -> {r['bytes'] / 1024:9,.0f} KB")
+        else:
+            print(f"{r['tamanho']:>9,} {r['operacao']:<40} {a['linhas_por_s']:9,.0f} -> {r['linhas_por_s']:9,.0f} linhas/s")
+
+
+def _silenciar_streamlit():
+    # Fora do `streamlit run` cada st.* avisa que não há ScriptRunContext
+    warnings.filterwarnings("ignore")
+    for nome in list(logging.root.manager.loggerDict):
+        if nome.startswith("streamlit"):
+            logging.getLogger(nome).setLevel(logging.ERROR)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do controle financeiro")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO,
+                        help="movimentos do usuário medido (ex.: 1000 10000 1000000)")
+    parser.add_argument("--backend", choices=["sqlite", "postgresql"], default="sqlite")
+    parser.add_argument("--usuarios-extra", type=int, default=1,
+                        help="usuários de ruído (com 1/4 dos movimentos) por tamanho")
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES)
+    parser.add_argument("--orcamento", type=float, default=ORCAMENTO_S, help="segundos máximos por operação")
+    parser.add_argument("--saida", help="arquivo JSON (padrão: benchmarks/resultados/<commit>.json)")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DEPOIS"), help="compara dois relatórios")
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return 0
+
+    _silenciar_streamlit()
+    relatorio = executar(args.tamanhos, args.backend, args.usuarios_extra, args.repeticoes, args.orcamento)
+    saida = Path(args.saida) if args.saida else PASTA_RESULTADOS / f"{relatorio['commit']}.json"
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Relatório: {saida}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
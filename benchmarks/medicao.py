@@ -0,0 +1,62 @@
+"""Cronometragem com percentis, linhas por segundo e pico de memória (tracemalloc)."""
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+REPETICOES = 20
+ORCAMENTO_S = 2.0  # para de repetir uma operação depois disso (com no mínimo 3 amostras)
+
+
+def contar_linhas(resultado):
+    if isinstance(resultado, (pd.DataFrame, pd.Series, list, tuple)):
+        return len(resultado)
+    if isinstance(resultado, int) and not isinstance(resultado, bool):
+        return resultado
+    return 1 if resultado is not None else 0
+
+
+def medir(funcao, antes=None, repeticoes=REPETICOES, orcamento_s=ORCAMENTO_S, memoria=True):
+    """Roda `funcao` várias vezes (`antes` roda antes de cada uma, fora do cronômetro).
+
+    O pico de memória vem de uma execução extra com tracemalloc ligado, para o
+    overhead dele não contaminar as latências.
+    """
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        if antes:
+            antes()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+        if sum(tempos) > orcamento_s and len(tempos) >= 3:
+            break
+
+    pico_kb = None
+    if memoria:
+        if antes:
+            antes()
+        tracemalloc.start()
+        try:
+            funcao()
+            pico_kb = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+
+    ms = np.array(tempos) * 1000
+    linhas = contar_linhas(resultado)
+    p50 = float(np.percentile(ms, 50))
+    return {
+        "repeticoes": len(tempos),
+        "p50_ms": p50,
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "media_ms": float(ms.mean()),
+        "min_ms": float(ms.min()),
+        "max_ms": float(ms.max()),
+        "linhas": linhas,
+        "linhas_por_s": linhas / (p50 / 1000) if p50 else 0.0,
+        "memoria_pico_kb": pico_kb,
+    }
@@ -0,0 +1,164 @@
+"""Partida a frio e reruns de cada tela, cada medida num processo Python novo.
+
+    python -m benchmarks.partida [--movimentos 10000] [--repeticoes 5] [--saida partida.json]
+    python -m benchmarks.partida --comparar ANTES.json DEPOIS.json
+
+O processo filho já começa com streamlit e pandas importados (o servidor do
+`streamlit run` também), roda o app.py pelo AppTest e mede a primeira execução
+da tela (imports das views, primeiros gráficos) e as reruns seguintes. Também
+lista quais módulos pesados cada tela acabou carregando e, com --imports, o
+perfil de `python -X importtime` de cada módulo de view.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+TELAS = ["login", "Dashboard", "Tendências", "Assinaturas", "Buscar", "Relatórios"]
+RERUNS = 3
+# Módulos cujo carregamento (ou não) interessa acompanhar
+MODULOS_PESADOS = ["plotly.express", "plotly.graph_objs", "views.dashboard", "views.tendencias",
+                   "views.assinaturas", "views.busca", "views.relatorios",
+                   "services.importacao", "services.exportacao"]
+MODULOS_VIEWS = ["views.dashboard", "views.tendencias", "views.assinaturas", "views.busca", "views.relatorios",
+                 "views.debug"]
+SEGREDO = "benchmark-partida"
+
+
+# --- PROCESSO FILHO ---
+
+def _filho(tela, token):
+    inicio = time.perf_counter()
+    import streamlit  # noqa: F401  (já carregados no servidor: ficam fora da medida)
+    import pandas  # noqa: F401
+    from streamlit.testing.v1 import AppTest
+    base_ms = (time.perf_counter() - inicio) * 1000
+    # A primeira rerun do AppTest varre os componentes instalados (~0,5 s); no servidor isso
+    # acontece uma vez na subida. Um script vazio paga esse custo fora da medida.
+    AppTest.from_string("import streamlit as st").run()
+
+    at = AppTest.from_file(str(RAIZ / "app.py"), default_timeout=120)
+    if tela != "login":
+        at.query_params["sessao"] = token
+        at.session_state["navegacao"] = tela
+    tempos = []
+    for _ in range(1 + RERUNS):
+        inicio = time.perf_counter()
+        at.run()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        if at.exception:
+            raise RuntimeError(f"{tela}: {at.exception[0].value}")
+    print(json.dumps({"tela": tela, "base_ms": base_ms, "primeira_ms": tempos[0], "reruns_ms": tempos[1:],
+                      "modulos": [m for m in MODULOS_PESADOS if m in sys.modules]}))
+
+
+def _rodar_filho(tela, token, ambiente):
+    saida = subprocess.run([sys.executable, "-m", "benchmarks.partida", "--filho", tela, token],
+                           cwd=RAIZ, env=ambiente, capture_output=True, text=True, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+# --- PERFIL DE IMPORTS ---
+
+def perfil_imports(modulo, top=8):
+    """(ms do módulo, [(ms acumulado, nome)] dos `top` mais caros) com streamlit e pandas já carregados."""
+    saida = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import streamlit, pandas; import {modulo}"],
+                           cwd=RAIZ, capture_output=True, text=True, check=True).stderr
+    # Só o que veio depois do import de streamlit/pandas é custo do módulo
+    linhas = saida.splitlines()
+    ultimo_base = max(i for i, l in enumerate(linhas) if l.rstrip().endswith(("| streamlit", "| pandas")))
+    medidas = []
+    for linha in linhas[ultimo_base + 1:]:
+        partes = linha.split("|")
+        if len(partes) == 3 and partes[1].strip().isdigit():
+            medidas.append((int(partes[1]) / 1000, partes[2].strip()))
+    total = next((ms for ms, nome in medidas if nome == modulo), 0.0)
+    return total, sorted(medidas, reverse=True)[:top]
+
+
+# --- PROCESSO PRINCIPAL ---
+
+def _preparar_banco(movimentos):
+    os.environ["FINANCAS_BACKEND"] = "sqlite"
+    os.environ["FINANCAS_SQLITE_PATH"] = str(Path(tempfile.mkdtemp(prefix="bench-partida-")) / "bench.db")
+    os.environ["FINANCAS_AUTH_SEGREDO"] = SEGREDO
+    from benchmarks.dados_sinteticos import criar_usuario_sintetico
+    from benchmarks.executar import _silenciar_streamlit
+    from services.autenticacao import criar_token
+    from services.migracoes import aplicar_migracoes
+    _silenciar_streamlit()
+    aplicar_migracoes()
+    user_id, _ = criar_usuario_sintetico(0, movimentos)
+    return criar_token(user_id, "Benchmark")
+
+
+def executar(movimentos, repeticoes, imports=False):
+    token = _preparar_banco(movimentos)
+    ambiente = dict(os.environ)
+    resultados = []
+    for tela in TELAS:
+        medidas = [_rodar_filho(tela, token, ambiente) for _ in range(repeticoes)]
+        resultado = {
+            "tela": tela,
+            "primeira_ms": statistics.median(m["primeira_ms"] for m in medidas),
+            "rerun_ms": statistics.median(ms for m in medidas for ms in m["reruns_ms"]),
+            "modulos": medidas[-1]["modulos"],
+        }
+        resultados.append(resultado)
+        print(f"{tela:<12} primeira={resultado['primeira_ms']:8.1f} ms  rerun={resultado['rerun_ms']:7.1f} ms  "
+              f"carregou: {', '.join(resultado['modulos']) or '-'}", file=sys.stderr)
+
+    relatorio = {"movimentos": movimentos, "repeticoes": repeticoes, "telas": resultados}
+    if imports:
+        relatorio["imports"] = {}
+        for modulo in MODULOS_VIEWS:
+            total, caros = perfil_imports(modulo)
+            relatorio["imports"][modulo] = {"ms": total, "mais_caros": caros}
+            print(f"\nimport {modulo}: {total:.1f} ms", file=sys.stderr)
+            for ms, nome in caros:
+                print(f"  {ms:8.1f} ms  {nome}", file=sys.stderr)
+    return relatorio
+
+
+def comparar(caminho_antes, caminho_depois):
+    antes, depois = (json.loads(Path(c).read_text(encoding="utf-8")) for c in (caminho_antes, caminho_depois))
+    base = {t["tela"]: t for t in antes["telas"]}
+    for t in depois["telas"]:
+        a = base.get(t["tela"])
+        if a is None:
+            continue
+        print(f"{t['tela']:<12} primeira {a['primeira_ms']:8.1f} -> {t['primeira_ms']:8.1f} ms   "
+              f"rerun {a['rerun_ms']:7.1f} -> {t['rerun_ms']:7.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Partida a frio e reruns das telas")
+    parser.add_argument("--movimentos", type=int, default=10_000)
+    parser.add_argument("--repeticoes", type=int, default=5, help="processos novos por tela")
+    parser.add_argument("--imports", action="store_true", help="perfil de -X importtime de cada view")
+    parser.add_argument("--saida", help="arquivo JSON do relatório")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DEPOIS"))
+    parser.add_argument("--filho", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.filho:
+        _filho(*args.filho)
+        return 0
+    if args.comparar:
+        comparar(*args.comparar)
+        return 0
+
+    relatorio = executar(args.movimentos, args.repeticoes, args.imports)
+    if args.saida:
+        Path(args.saida).write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
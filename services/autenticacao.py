@@ -0,0 +1,252 @@
+"""Senhas com hash (scrypt) e tokens de sessão assinados, sem ir ao banco.
+
+As senhas ficam em usuarios.senha como "scrypt$N$r$p$sal$hash". O custo é
+configurável e deve ser calibrado na máquina do servidor:
+
+    python -m services.autenticacao calibrar 100    # maior N que fica em ~100 ms
+
+    [auth]
+    scrypt_n = 16384            # potência de 2
+    segredo = "..."             # chave dos tokens (ou FINANCAS_AUTH_SEGREDO)
+    validade_horas = 2          # curta: o token vai na URL (ver abaixo)
+
+Senhas antigas (texto puro, ou com outro custo) continuam entrando e são
+regravadas no formato atual no primeiro login (crud.autenticar_usuario).
+
+O token de sessão vai na URL (?sessao=...), já que o Streamlit não grava
+cookies, e carrega id, nome, validade e a versão das sessões do usuário,
+assinados com HMAC: um F5 reabre a sessão conferindo a assinatura e a versão
+(usuarios.sessao_versao, lida pelo cache do crud). O "Sair" sobe a versão, e todo token já emitido para o usuário deixa de
+valer, inclusive um que vazou pelo histórico ou por um link copiado (em outro
+processo sem o modo compartilhado, depois que a versão sai do cache). Sem
+`segredo` configurado a chave é sorteada: no modo compartilhado uma vez, na
+loja, para todos os processos; sem ele, por processo (cada restart desloga todo
+mundo e processos diferentes não aceitam o token um do outro).
+
+Risco: o que está na URL fica no histórico do navegador, em links copiados e
+nos logs de proxies. Quem tiver o token entra como o usuário até ele vencer
+ou até o "Sair". Por isso a validade é curta e o app troca o token na URL
+por um novo quando a metade dela passa (`renovar_token`): quem está usando
+não é deslogado, e um token copiado vale no máximo `validade_horas`.
+
+Com o modo compartilhado (services/compartilhado.py) o token também leva o id de
+uma sessão registrada na loja: qualquer processo a reabre e `encerrar_sessao`
+(o "Sair") derruba o token em todos eles.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sys
+import time
+
+import streamlit as st
+from services.compartilhado import get_loja
+
+logger = logging.getLogger("financas.auth")
+
+# --- CONFIGURAÇÃO (pode ser sobrescrita em [auth] no secrets.toml) ---
+SCRYPT_N = 2 ** 14      # custo de CPU/memória (128 * N * r bytes por hash: 16 MB)
+SCRYPT_R = 8
+SCRYPT_P = 1
+TOKEN_VALIDADE_H = 2
+
+_PREFIXO = "scrypt"
+
+
+def _config(chave, padrao):
+    try:
+        return type(padrao)(st.secrets["auth"].get(chave, padrao))
+    except Exception:
+        return padrao
+
+
+def custo_configurado():
+    return _config("scrypt_n", SCRYPT_N)
+
+
+def normalizar_email(email):
+    return (email or "").strip().lower()
+
+
+# --- SENHAS ---
+
+def _b64(dados):
+    return base64.urlsafe_b64encode(dados).rstrip(b"=").decode()
+
+
+def _de_b64(texto):
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def _scrypt(senha, sal, n, r, p):
+    return hashlib.scrypt(senha.encode(), salt=sal, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+
+def hash_senha(senha, n=None):
+    n = n or custo_configurado()
+    sal = secrets.token_bytes(16)
+    return f"{_PREFIXO}${n}${SCRYPT_R}${SCRYPT_P}${_b64(sal)}${_b64(_scrypt(senha, sal, n, SCRYPT_R, SCRYPT_P))}"
+
+
+def verificar_senha(senha, armazenado):
+    """(confere, precisa_regravar). Aceita o texto puro antigo, que sempre precisa regravar."""
+    partes = (armazenado or "").split("$")
+    if len(partes) != 6 or partes[0] != _PREFIXO:
+        return hmac.compare_digest((senha or "").encode(), (armazenado or "").encode()), True
+    _, n, r, p, sal, esperado = partes
+    n, r, p = int(n), int(r), int(p)
+    confere = hmac.compare_digest(_scrypt(senha or "", _de_b64(sal), n, r, p), _de_b64(esperado))
+    return confere, (n, r, p) != (custo_configurado(), SCRYPT_R, SCRYPT_P)
+
+
+# Login de email inexistente gasta o mesmo tempo de um existente
+_HASH_FALSO = None
+
+
+def gastar_tempo_de_hash(senha):
+    global _HASH_FALSO
+    if _HASH_FALSO is None:
+        _HASH_FALSO = hash_senha("")
+    verificar_senha(senha, _HASH_FALSO)
+
+
+# --- TOKENS DE SESSÃO ---
+
+_segredo_processo = None
+
+
+def _segredo():
+    global _segredo_processo
+    configurado = os.environ.get("FINANCAS_AUTH_SEGREDO") or _config("segredo", "")
+    if configurado:
+        return configurado.encode()
+    if _segredo_processo is None:
+        loja = get_loja()
+        if loja is not None:
+            # Vários processos: a chave sorteada pelo primeiro fica na loja e vale para todos
+            _segredo_processo = loja.segredo("auth", secrets.token_bytes(32))
+        else:
+            logger.warning("Sem [auth] segredo configurado: tokens de sessão valem só até o próximo restart")
+            _segredo_processo = secrets.token_bytes(32)
+    return _segredo_processo
+
+
+def _assinar(corpo):
+    return _b64(hmac.new(_segredo(), corpo.encode(), hashlib.sha256).digest())
+
+
+# Versão das sessões no banco: o crud liga as funções dele ao ser importado (definir_sessoes),
+# sem este módulo importar o crud (que importa este)
+_versao_sessao = None
+_revogar_sessoes = None
+
+
+def definir_sessoes(versao, revogar):
+    """`versao(user_id)` lê usuarios.sessao_versao; `revogar(user_id)` a incrementa."""
+    global _versao_sessao, _revogar_sessoes
+    _versao_sessao, _revogar_sessoes = versao, revogar
+
+
+def criar_token(user_id, nome, validade_h=None):
+    validade_h = validade_h or _config("validade_horas", TOKEN_VALIDADE_H)
+    dados = {"u": int(user_id), "n": nome, "exp": int(time.time() + validade_h * 3600)}
+    if _versao_sessao is not None:
+        dados["v"] = _versao_sessao(dados["u"]) or 0
+    loja = get_loja()
+    if loja is not None:
+        dados["s"] = secrets.token_urlsafe(12)
+        loja.abrir_sessao(dados["s"], dados["u"], dados["exp"])
+    corpo = _b64(json.dumps(dados, separators=(",", ":"), ensure_ascii=False).encode())
+    return f"{corpo}.{_assinar(corpo)}"
+
+
+def _dados_assinados(token):
+    try:
+        corpo, assinatura = token.split(".")
+        if not hmac.compare_digest(assinatura, _assinar(corpo)):
+            return None
+        return json.loads(_de_b64(corpo))
+    except (AttributeError, ValueError):
+        return None
+
+
+def validar_token(token):
+    """(user_id, nome) de um token íntegro, dentro da validade e não revogado; None caso contrário."""
+    dados = _dados_assinados(token)
+    if dados is None or dados.get("exp", 0) < time.time():
+        return None
+    loja = get_loja()
+    if loja is not None and not loja.sessao_ativa(dados.get("s", ""), dados["u"]):
+        return None
+    if _versao_sessao is not None and dados.get("v", 0) != _versao_sessao(dados["u"]):
+        return None
+    return dados["u"], dados["n"]
+
+
+def renovar_token(token):
+    """Token novo para uma sessão válida que já passou da metade da validade; None se não é o caso."""
+    dados = _dados_assinados(token)
+    # Só a assinatura na maioria das reruns; a validação completa quando vai renovar
+    validade_h = _config("validade_horas", TOKEN_VALIDADE_H)
+    if dados is None or dados.get("exp", 0) - time.time() > validade_h * 3600 / 2:
+        return None
+    if validar_token(token) is None:
+        return None
+    loja = get_loja()
+    if loja is not None:
+        loja.encerrar_sessao(dados.get("s", ""))
+    return criar_token(dados["u"], dados["n"])
+
+
+def encerrar_sessao(token, user_id=None):
+    """Logout: revoga todos os tokens do usuário (o do `token`, ou `user_id` de uma sessão já autenticada)."""
+    dados = _dados_assinados(token) if token else None
+    if dados is not None:
+        loja = get_loja()
+        if loja is not None:
+            loja.encerrar_sessao(dados.get("s", ""))
+        # Só um token com assinatura válida revoga: um forjado não desloga ninguém
+        user_id = user_id if user_id is not None else dados["u"]
+    if user_id is not None and _revogar_sessoes is not None:
+        _revogar_sessoes(user_id)
+
+
+# --- CALIBRAÇÃO ---
+
+def calibrar(alvo_ms=100.0, repeticoes=3):
+    """Tempo (ms, melhor de `repeticoes`) de um hash para cada N; para no primeiro acima do alvo."""
+    medidas = []
+    n = 2 ** 12
+    while n <= 2 ** 20:
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            hash_senha("calibragem", n)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        medidas.append((n, min(tempos)))
+        if min(tempos) > alvo_ms:
+            break
+        n *= 2
+    return medidas
+
+
+def _main(args):
+    if not args or args[0] != "calibrar":
+        print(__doc__)
+        return 1
+    alvo = float(args[1]) if len(args) > 1 else 100.0
+    medidas = calibrar(alvo)
+    for n, ms in medidas:
+        print(f"N = 2^{n.bit_length() - 1:<2} ({n:>8}): {ms:8.1f} ms")
+    dentro = [n for n, ms in medidas if ms <= alvo]
+    if dentro:
+        print(f"\nSugestão para ~{alvo:.0f} ms por login:\n\n[auth]\nscrypt_n = {dentro[-1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
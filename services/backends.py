@@ -0,0 +1,194 @@
+"""Backends de armazenamento por trás do services.database.
+
+O backend é escolhido pela variável de ambiente FINANCAS_BACKEND ou pela chave
+`backend` no topo do .streamlit/secrets.toml ("postgresql", o padrão, ou "sqlite"):
+
+    backend = "sqlite"
+
+    [connections.sqlite]
+    path = "financas.db"     # ou FINANCAS_SQLITE_PATH
+
+O crud escreve SQL no dialeto do psycopg2 (placeholders %s, to_char, COPY ...
+FROM STDIN, tabelas temporárias ON COMMIT DROP). A conexão SQLite traduz isso na
+hora, então o mesmo crud roda nos dois bancos.
+"""
+import csv
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+
+def _secret(*caminho, padrao=None):
+    try:
+        valor = st.secrets
+        for chave in caminho:
+            valor = valor[chave]
+        return valor
+    except Exception:
+        return padrao
+
+
+# --- POSTGRESQL ---
+
+class BackendPostgres:
+    nome = "postgresql"
+
+    def conectar(self):
+        import psycopg2
+        # Pega a URL do arquivo .streamlit/secrets.toml
+        return psycopg2.connect(st.secrets["connections"]["postgresql"]["url"])
+
+
+# --- SQLITE ---
+
+SQLITE_CACHE_STATEMENTS = 256  # statements preparados mantidos por conexão
+
+# Tipos que o sqlite3 não sabe gravar sozinho. Datas viram "AAAA-MM-DD" para que
+# as comparações de intervalo (data >= ? AND data < ?) funcionem como texto.
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+sqlite3.register_adapter(pd.Timestamp, lambda t: t.date().isoformat() if t == t.normalize() else t.isoformat(" "))
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+sqlite3.register_adapter(np.float64, float)
+sqlite3.register_adapter(np.bool_, bool)
+
+_PERCENT = re.compile(r"%(%|s)")
+_TEMP_ON_COMMIT_DROP = re.compile(r"CREATE\s+TEMP(?:ORARY)?\s+TABLE\s+(\w+)(.*?)\s+ON\s+COMMIT\s+DROP", re.I | re.S)
+_COPY_STDIN = re.compile(r"COPY\s+(\w+)\s*(?:\(([^)]*)\))?\s+FROM\s+STDIN", re.I)
+_COPY_NULL = re.compile(r"\bNULL\s+'([^']*)'", re.I)
+_ILIKE = re.compile(r"\bILIKE\b", re.I)
+_FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE\b", re.I)
+_TO_CHAR_MES = re.compile(r"to_char\((\w+),\s*'YYYY-MM'\)", re.I)
+
+
+@lru_cache(maxsize=1024)
+def traduzir_sql(sql):
+    """%s -> ?, %% -> %, ILIKE -> LIKE (que no SQLite já ignora maiúsculas em ASCII).
+
+    to_char(coluna, 'YYYY-MM') vira substr(coluna, 1, 7): as datas ficam gravadas
+    como "AAAA-MM-DD" e o resumo mensal agrupa por isso sem chamar Python por linha.
+    FOR UPDATE sai: o SQLite tem um escritor por vez, e quem leu antes do commit
+    de outro falha ao escrever (SQLITE_BUSY) em vez de sobrescrever.
+
+    Com cache: a mesma string de entrada gera sempre o mesmo objeto de saída e o
+    sqlite3 reaproveita o statement já preparado.
+    """
+    sql = _PERCENT.sub(lambda m: "%" if m.group(1) == "%" else "?", sql)
+    sql = _TO_CHAR_MES.sub(r"substr(\1, 1, 7)", sql)
+    return _FOR_UPDATE.sub("", _ILIKE.sub("LIKE", sql))
+
+
+def _to_char(valor, formato):
+    # Só os formatos de data que o crud usa ('YYYY-MM', 'YYYY', ...)
+    if valor is None:
+        return None
+    d = datetime.fromisoformat(str(valor)[:10])
+    return d.strftime(formato.replace("YYYY", "%Y").replace("MM", "%m").replace("DD", "%d"))
+
+
+def _valor_copy(campo, nulo=""):
+    if campo == nulo:
+        return None
+    if campo in ("True", "true", "t"):
+        return 1
+    if campo in ("False", "false", "f"):
+        return 0
+    return campo
+
+
+class CursorSQLite(sqlite3.Cursor):
+    """Cursor que aceita o SQL do crud (dialeto psycopg2)."""
+
+    def execute(self, sql, params=()):
+        temporaria = _TEMP_ON_COMMIT_DROP.search(sql)
+        if temporaria:
+            # Emula ON COMMIT DROP: a conexão apaga a tabela no commit/rollback
+            self.connection._temporarias.add(temporaria.group(1))
+            sql = _TEMP_ON_COMMIT_DROP.sub(r"CREATE TEMP TABLE \1\2", sql)
+        return super().execute(traduzir_sql(sql), params or ())
+
+    def executemany(self, sql, seq_params):
+        return super().executemany(traduzir_sql(sql), seq_params)
+
+    def copy_expert(self, sql, arquivo):
+        """Emula `COPY tabela [(colunas)] FROM STDIN WITH (FORMAT csv[, NULL '...'])` com executemany."""
+        m = _COPY_STDIN.search(sql)
+        if not m:
+            raise sqlite3.OperationalError(f"COPY não suportado: {sql}")
+        tabela, colunas = m.group(1), m.group(2)
+        if colunas:
+            colunas = [c.strip() for c in colunas.split(",")]
+        else:
+            colunas = [linha[1] for linha in super().execute(f"PRAGMA table_info({tabela})").fetchall()]
+        marcadores = ", ".join("?" * len(colunas))
+        nulo = _COPY_NULL.search(sql)
+        nulo = nulo.group(1) if nulo else ""
+        linhas = ([_valor_copy(c, nulo) for c in registro] for registro in csv.reader(arquivo))
+        super().executemany(f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({marcadores})", linhas)
+
+
+class ConexaoSQLite(sqlite3.Connection):
+    """Conexão sqlite3 de verdade (o pandas a reconhece) com cursor tradutor."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._temporarias = set()
+
+    def cursor(self, factory=CursorSQLite):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def commit(self):
+        super().commit()
+        self._apagar_temporarias()
+
+    def rollback(self):
+        super().rollback()
+        self._apagar_temporarias()
+
+    def _apagar_temporarias(self):
+        while self._temporarias:
+            super().execute(f"DROP TABLE IF EXISTS temp.{self._temporarias.pop()}")
+
+
+class BackendSQLite:
+    nome = "sqlite"
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+    def conectar(self):
+        conn = sqlite3.connect(self.caminho, factory=ConexaoSQLite, check_same_thread=False,
+                               cached_statements=SQLITE_CACHE_STATEMENTS, timeout=10.0)
+        # WAL: leitores não bloqueiam o escritor (várias sessões do Streamlit ao mesmo tempo)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.create_function("to_char", 2, _to_char, deterministic=True)
+        return conn
+
+
+# --- ESCOLHA DO BACKEND ---
+
+BACKENDS = {"postgresql": BackendPostgres, "sqlite": BackendSQLite}
+
+
+def backend_configurado():
+    nome = os.environ.get("FINANCAS_BACKEND") or _secret("backend", padrao="postgresql")
+    if nome == "sqlite":
+        caminho = os.environ.get("FINANCAS_SQLITE_PATH") or _secret("connections", "sqlite", "path", padrao="financas.db")
+        return BackendSQLite(caminho)
+    if nome not in BACKENDS:
+        raise ValueError(f"Backend desconhecido: {nome} (use {', '.join(BACKENDS)})")
+    return BackendPostgres()
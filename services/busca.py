@@ -0,0 +1,227 @@
+"""Busca de lançamentos em todos os meses, por descrição/categoria, com índice no banco.
+
+- PostgreSQL: extensão pg_trgm e um índice GIN de trigramas sobre TEXTO_BUSCA.
+  O ILIKE '%palavra%' e o operador de semelhança (<%) usam o índice.
+- SQLite: tabela FTS5 com o tokenizador trigram (movimentos_busca), que espelha
+  descricao/categoria de movimentos por triggers. MATCH '"palavra"' acha a
+  palavra em qualquer posição do texto.
+
+Cada palavra digitada precisa aparecer (em qualquer ordem, sem diferenciar
+maiúsculas). Palavras com menos de 3 letras não têm trigramas e viram um LIKE
+comum sobre as linhas do usuário.
+
+A busca aproximada tolera erros de digitação: a semelhança é a fração dos
+trigramas de cada palavra buscada que aparece na palavra mais parecida do texto
+(a ideia do word_similarity do pg_trgm). No Postgres o banco filtra e ordena; no
+SQLite o FTS traz os candidatos que dividem trigramas com a busca e a
+semelhança é calculada aqui.
+
+Aqui só se monta o SQL e se calcula a semelhança: as consultas rodam na
+conexão de crud.buscar_movimentos.
+"""
+import re
+
+BUSCA_LIMITE = 100          # linhas devolvidas por busca
+LIMIAR_APROXIMADA = 0.5     # semelhança mínima na busca aproximada (0 a 1)
+CANDIDATOS_APROXIMADA = 2000  # SQLite: candidatos do FTS avaliados por busca aproximada
+FTS_TETO = 20_000           # SQLite: termo em mais linhas que isso é comum (ver planejar)
+
+# O índice do Postgres é sobre esta expressão: as consultas precisam repeti-la igual
+TEXTO_BUSCA = "(COALESCE(descricao, '') || ' ' || categoria)"
+
+_PALAVRA = re.compile(r"\w+")
+
+
+# --- ÍNDICES (migração 7, ver services/migracoes.py) ---
+
+INDICE_TRIGRAMAS = f"CREATE INDEX IF NOT EXISTS movimentos_busca_trgm_idx ON movimentos USING gin ({TEXTO_BUSCA} gin_trgm_ops)"
+
+INDICES = {
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        INDICE_TRIGRAMAS,
+    ],
+    "sqlite": [
+        # Conteúdo externo: o FTS guarda só o índice e lê o texto de movimentos pelo id
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS movimentos_busca USING fts5(
+            descricao, categoria, content='movimentos', content_rowid='id', tokenize='trigram'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS movimentos_busca_ai AFTER INSERT ON movimentos BEGIN
+            INSERT INTO movimentos_busca (rowid, descricao, categoria) VALUES (new.id, new.descricao, new.categoria);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS movimentos_busca_ad AFTER DELETE ON movimentos BEGIN
+            INSERT INTO movimentos_busca (movimentos_busca, rowid, descricao, categoria)
+            VALUES ('delete', old.id, old.descricao, old.categoria);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS movimentos_busca_au AFTER UPDATE OF descricao, categoria ON movimentos BEGIN
+            INSERT INTO movimentos_busca (movimentos_busca, rowid, descricao, categoria)
+            VALUES ('delete', old.id, old.descricao, old.categoria);
+            INSERT INTO movimentos_busca (rowid, descricao, categoria) VALUES (new.id, new.descricao, new.categoria);
+        END
+        """,
+        # Indexa o que já existia
+        "INSERT INTO movimentos_busca (movimentos_busca) VALUES ('rebuild')",
+    ],
+}
+
+
+# --- TEXTO ---
+
+def palavras(texto):
+    return [p.lower() for p in _PALAVRA.findall(texto or "")]
+
+
+def trigramas(palavra):
+    """Trigramas como o pg_trgm: a palavra com dois espaços antes e um depois."""
+    palavra = f"  {palavra.lower()} "
+    return {palavra[i:i + 3] for i in range(len(palavra) - 2)}
+
+
+def semelhanca(busca, texto):
+    """Média, entre as palavras da busca, da fração dos seus trigramas presentes na palavra mais parecida do texto."""
+    alvo = [trigramas(p) for p in palavras(texto)]
+    notas = []
+    for palavra in palavras(busca):
+        tri = trigramas(palavra)
+        notas.append(max((len(tri & t) for t in alvo), default=0) / len(tri))
+    return sum(notas) / len(notas) if notas else 0.0
+
+
+def _escapar_like(palavra):
+    return "%" + palavra.replace("!", "!!").replace("%", "!%").replace("_", "!_") + "%"
+
+
+def _frase_fts(termo):
+    # Entre aspas o FTS5 trata tudo como texto (aspas internas são dobradas)
+    return '"' + termo.replace('"', '""') + '"'
+
+
+# --- CONSULTA ---
+
+def _filtros(user_id, de, ate, valor_min, valor_max, prefixo=""):
+    where = [f"{prefixo}user_id = %s"]
+    params = [user_id]
+    if de is not None:
+        where.append(f"{prefixo}data >= %s")
+        params.append(de)
+    if ate is not None:
+        where.append(f"{prefixo}data <= %s")
+        params.append(ate)
+    # Valores em módulo: a despesa de R$ 50 está gravada como -50
+    if valor_min is not None:
+        where.append(f"ABS({prefixo}valor) >= %s")
+        params.append(valor_min)
+    if valor_max is not None:
+        where.append(f"ABS({prefixo}valor) <= %s")
+        params.append(valor_max)
+    return where, params
+
+
+def consulta(dialeto, colunas, user_id, texto, de=None, ate=None, valor_min=None, valor_max=None,
+             aproximada=False, limite=BUSCA_LIMITE, plano=None):
+    """(sql, params) da busca. `colunas` são as de crud.COLUNAS_MOVIMENTO.
+
+    Na aproximada o Postgres já devolve a coluna "semelhanca", filtrada e
+    ordenada; o SQLite devolve só candidatos (ver `ordenar_aproximada`), a
+    partir do `plano` de `planejar` (sem plano, usa o FTS com todos os termos).
+    """
+    termos = palavras(texto)
+    if dialeto == "sqlite":
+        return _consulta_sqlite(colunas, user_id, termos, de, ate, valor_min, valor_max, aproximada, limite, plano)
+    where, params = _filtros(user_id, de, ate, valor_min, valor_max)
+    if aproximada and termos:
+        busca = " ".join(termos)
+        where.append(f"%s <%% {TEXTO_BUSCA}")
+        sql = (f"SELECT {colunas}, word_similarity(%s, {TEXTO_BUSCA}) AS semelhanca FROM movimentos "
+               f"WHERE {' AND '.join(where)} ORDER BY semelhanca DESC, data DESC, id DESC LIMIT %s")
+        return sql, [busca] + params + [busca, limite]
+    for termo in termos:
+        where.append(f"{TEXTO_BUSCA} ILIKE %s ESCAPE '!'")
+        params.append(_escapar_like(termo))
+    return (f"SELECT {colunas} FROM movimentos WHERE {' AND '.join(where)} ORDER BY data DESC, id DESC LIMIT %s",
+            params + [limite])
+
+
+def _trigramas_fts(termos):
+    # O trigram do FTS5 não tem o preenchimento com espaços do pg_trgm
+    return sorted({t for termo in termos for t in trigramas(termo) if " " not in t})
+
+
+def _contar_fts(cursor, expressao, teto):
+    # Para de contar no teto: saber que é comum basta, e contar tudo custaria o mesmo que buscar
+    cursor.execute("SELECT COUNT(*) FROM (SELECT rowid FROM movimentos_busca WHERE movimentos_busca MATCH %s "
+                   "LIMIT %s)", (expressao, teto))
+    return cursor.fetchone()[0]
+
+
+def planejar(cursor, texto, aproximada):
+    """SQLite: como usar o FTS nesta busca (o `plano` de `consulta`), contando as linhas de cada termo.
+
+    Exata: com um termo raro o FTS conduz e só as linhas dele são lidas; com um
+    termo que está em quase tudo ("lazer") sai mais barato percorrer as linhas
+    do usuário da mais recente para trás, conferindo o texto, até encher a página.
+
+    Aproximada: um OR com todos os trigramas de "lancamento" casa com todas as
+    linhas de "Lançamento ..." e ranquear isso passa de um segundo. Ficam só os
+    trigramas raros; se nenhum for, os candidatos saem dos comuns sem ranquear.
+    """
+    termos = palavras(texto)
+    if not aproximada:
+        longos = [t for t in termos if len(t) >= 3]
+        comum = bool(longos) and _contar_fts(cursor, " ".join(map(_frase_fts, longos)), FTS_TETO) >= FTS_TETO
+        return {"varrer": comum}
+    contagem = {t: _contar_fts(cursor, _frase_fts(t), CANDIDATOS_APROXIMADA) for t in _trigramas_fts(termos)}
+    raros = [t for t, n in contagem.items() if 0 < n < CANDIDATOS_APROXIMADA]
+    if raros:
+        return {"trigramas": raros, "ranquear": True}
+    return {"trigramas": [t for t, n in contagem.items() if n], "ranquear": False}
+
+
+def _consulta_sqlite(colunas, user_id, termos, de, ate, valor_min, valor_max, aproximada, limite, plano):
+    if aproximada and termos:
+        plano = plano or {"trigramas": _trigramas_fts(termos), "ranquear": True}
+        if not plano["trigramas"]:
+            return f"SELECT {colunas} FROM movimentos WHERE 0 = 1", []
+        where, params = _filtros(user_id, de, ate, valor_min, valor_max, prefixo="m.")
+        ordem = "ORDER BY movimentos_busca.rank " if plano["ranquear"] else ""
+        sql = (f"SELECT {colunas} FROM movimentos WHERE id IN ("
+               "SELECT movimentos_busca.rowid FROM movimentos_busca JOIN movimentos m ON m.id = movimentos_busca.rowid "
+               f"WHERE movimentos_busca MATCH %s AND {' AND '.join(where)} {ordem}LIMIT %s)")
+        return sql, [" OR ".join(map(_frase_fts, plano["trigramas"]))] + params + [CANDIDATOS_APROXIMADA]
+    longos = [t for t in termos if len(t) >= 3]
+    varrer = not longos or (plano or {}).get("varrer", False)
+    # Sem varrer, o FTS conduz: o +user_id tira o índice (user_id, data) do plano, que senão
+    # percorreria todas as linhas do usuário conferindo cada id na lista do FTS
+    where, params = _filtros(user_id, de, ate, valor_min, valor_max, prefixo="" if varrer else "+")
+    for termo in (termos if varrer else [t for t in termos if len(t) < 3]):
+        where.append(f"{TEXTO_BUSCA} LIKE %s ESCAPE '!'")
+        params.append(_escapar_like(termo))
+    if not varrer:
+        where.append("id IN (SELECT rowid FROM movimentos_busca WHERE movimentos_busca MATCH %s)")
+        params.append(" ".join(map(_frase_fts, longos)))
+    return (f"SELECT {colunas} FROM movimentos WHERE {' AND '.join(where)} ORDER BY data DESC, id DESC LIMIT %s",
+            params + [limite])
+
+
+def ordenar_aproximada(df, texto, limite=BUSCA_LIMITE, limiar=LIMIAR_APROXIMADA):
+    """SQLite: calcula a semelhança dos candidatos, descarta os abaixo do limiar e ordena."""
+    if df.empty:
+        return df
+    textos = df["descricao"].fillna("").astype(str) + " " + df["categoria"].astype(str)
+    # Descrições se repetem muito: uma conta por texto distinto
+    notas = {t: semelhanca(texto, t) for t in textos.unique()}
+    df = df.assign(semelhanca=textos.map(notas).astype(float))
+    df = df[df["semelhanca"] >= limiar]
+    return df.sort_values(["semelhanca", "data", "id"], ascending=False).head(limite).reset_index(drop=True)
+
+
+def ajustar_limiar(cursor, limiar=LIMIAR_APROXIMADA):
+    """Postgres: o operador <% usa o limiar da sessão; vale só até o fim da transação."""
+    cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", (str(limiar),))
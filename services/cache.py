@@ -0,0 +1,339 @@
+import ast
+import datetime as dt
+import json
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # sem o pyarrow os DataFrames ficam só no nível 1
+    pa = None
+
+# --- CONFIGURAÇÃO ---
+CACHE_TTL = 300.0                  # segundos até uma leitura em cache expirar
+CACHE_MAX_BYTES = 64 * 1024 * 1024 # teto de memória estimada; acima disso sai o menos usado
+INVALIDACOES_MAX = 10_000          # tags invalidadas lembradas para recusar leituras lentas
+
+
+def tamanho_estimado(valor):
+    """Bytes aproximados de um valor em cache (DataFrames contam as strings de verdade)."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamanho_estimado(k) + tamanho_estimado(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple, set)):
+        return sys.getsizeof(valor) + sum(tamanho_estimado(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+# --- SERIALIZAÇÃO DO NÍVEL 2 ---
+# O arquivo da loja é lido por todos os processos: nada de pickle, só dados.
+# Formato: tamanho do cabeçalho (4 bytes) + cabeçalho JSON + blocos Arrow IPC
+# (um por DataFrame). No JSON todo objeto é uma marca de tipo: {"t": [...]}
+# tupla, {"d": [[k, v], ...]} dict, {"data": ...}/{"datahora": ...} datas e
+# {"df": i} o i-ésimo bloco. Valor fora disso (ex.: figuras) não vai à loja.
+
+def _para_json(valor, blocos):
+    if valor is None or isinstance(valor, (bool, int, float, str)):
+        return valor
+    if isinstance(valor, np.generic) and isinstance(valor, (np.bool_, np.integer, np.floating)):
+        return valor.item()
+    if isinstance(valor, list):
+        return [_para_json(v, blocos) for v in valor]
+    if isinstance(valor, tuple):
+        return {"t": [_para_json(v, blocos) for v in valor]}
+    if isinstance(valor, dict):
+        return {"d": [[_para_json(k, blocos), _para_json(v, blocos)] for k, v in valor.items()]}
+    if isinstance(valor, dt.datetime):
+        return {"datahora": valor.isoformat()}
+    if isinstance(valor, dt.date):
+        return {"data": valor.isoformat()}
+    if isinstance(valor, pd.DataFrame) and pa is not None:
+        tabela = pa.Table.from_pandas(valor)
+        saida = pa.BufferOutputStream()
+        with pa.ipc.new_stream(saida, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+        blocos.append(saida.getvalue().to_pybytes())
+        return {"df": len(blocos) - 1}
+    raise TypeError(f"tipo fora do nível 2: {type(valor).__name__}")
+
+
+def _de_json(valor, blocos):
+    if isinstance(valor, list):
+        return [_de_json(v, blocos) for v in valor]
+    if not isinstance(valor, dict):
+        return valor
+    if "t" in valor:
+        return tuple(_de_json(v, blocos) for v in valor["t"])
+    if "d" in valor:
+        return {_de_json(k, blocos): _de_json(v, blocos) for k, v in valor["d"]}
+    if "datahora" in valor:
+        return dt.datetime.fromisoformat(valor["datahora"])
+    if "data" in valor:
+        return dt.date.fromisoformat(valor["data"])
+    if "df" in valor and pa is not None:
+        return pa.ipc.open_stream(blocos[valor["df"]]).read_all().to_pandas()
+    raise ValueError(f"marca desconhecida no nível 2: {sorted(valor)}")
+
+
+def serializar(valor):
+    """Bytes do valor para a loja compartilhada, ou None se ele não é só dados."""
+    blocos = []
+    try:
+        estrutura = _para_json(valor, blocos)
+    except (TypeError, ValueError):  # inclui ArrowTypeError/ArrowInvalid
+        return None
+    cabecalho = json.dumps({"v": estrutura, "b": [len(b) for b in blocos]}).encode()
+    return struct.pack(">I", len(cabecalho)) + cabecalho + b"".join(blocos)
+
+
+def desserializar(dados):
+    """Inverso de `serializar`; ValueError se os bytes não estão no formato."""
+    try:
+        (n,) = struct.unpack_from(">I", dados)
+        cabecalho = json.loads(dados[4:4 + n])
+        blocos, inicio = [], 4 + n
+        for tamanho in cabecalho["b"]:
+            blocos.append(dados[inicio:inicio + tamanho])
+            inicio += tamanho
+        return _de_json(cabecalho["v"], blocos)
+    except (struct.error, KeyError, TypeError, IndexError) as erro:
+        raise ValueError(f"valor inválido no nível 2: {erro}") from erro
+
+
+def _copiar(valor):
+    # As telas alteram os DataFrames que recebem; cada leitura ganha sua própria cópia
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy()
+    if isinstance(valor, list):
+        return list(valor)
+    if isinstance(valor, tuple):
+        return tuple(_copiar(v) for v in valor)
+    if isinstance(valor, dict):
+        return dict(valor)
+    return valor
+
+
+class CacheLRU:
+    """Cache em memória com TTL, despejo LRU limitado por bytes e invalidação por tags.
+
+    Cada entrada leva um conjunto de tags (ex.: ("movimentos", user_id, "2025-01")).
+    Uma escrita invalida só as tags que afetou. Para uma leitura lenta não gravar
+    dado velho depois de uma escrita concorrente, quem lê pega uma `marca()` antes
+    de ir ao banco e a passa para `guardar`, que recusa o valor se alguma das tags
+    foi invalidada nesse meio tempo.
+
+    Com `compartilhar(loja)` (services/compartilhado.py) vira o nível 1 de um
+    cache entre processos: faltas consultam a loja, gravações e invalidações vão
+    para ela, e as invalidações dos outros processos chegam pelo log da loja.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES, invalidacoes_max=INVALIDACOES_MAX):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.invalidacoes_max = invalidacoes_max
+        self._dados = OrderedDict()  # chave -> (valor, expira_em, bytes, tags)
+        self._por_tag = {}           # tag -> {chaves}
+        self._invalidada_em = OrderedDict()  # tag -> relógio da última invalidação (mais antiga primeiro)
+        self._relogio = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "hits_nivel2": 0, "misses": 0, "expirados": 0, "despejos": 0,
+                       "invalidacoes": 0, "recusados": 0}
+        # Modo compartilhado (desligado: _loja None)
+        self._loja = None
+        self._seq = 0                 # último seq do log de invalidações já aplicado aqui
+        self._proprias = set()        # seq das invalidações deste processo (já aplicadas)
+        self._sincronizado_em = 0.0
+        self._limpo_em = 0            # marcas anteriores a este relógio são recusadas (limpezas)
+        self.sincronia_s = 0.0
+        self.valor_max_bytes = 0
+
+    def compartilhar(self, loja, sincronia_s, valor_max_bytes):
+        self._loja = loja
+        self.sincronia_s = sincronia_s
+        self.valor_max_bytes = valor_max_bytes
+        self._seq = loja.ultima_invalidacao()
+
+    def obter(self, chave, local=False):
+        """Devolve (True, valor) num hit ou (False, None).
+
+        `local=True` não consulta a loja compartilhada (ver `guardar`).
+        """
+        if self._loja is not None:
+            self._sincronizar()
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is not None and item[1] < time.monotonic():
+                self._remover(chave)
+                self._stats["expirados"] += 1
+                item = None
+            if item is not None:
+                self._dados.move_to_end(chave)
+                self._stats["hits"] += 1
+                return True, _copiar(item[0])
+            if self._loja is None or local:
+                self._stats["misses"] += 1
+                return False, None
+            marca = self._relogio
+
+        achado = self._loja.ler(repr(chave))
+        try:
+            valor = desserializar(achado[0]) if achado else None
+        except ValueError:
+            achado = None  # entrada de outra versão ou corrompida: vale como falta
+        with self._lock:
+            self._stats["hits_nivel2" if achado else "misses"] += 1
+        if achado is None:
+            return False, None
+        self._guardar_local(chave, valor, {ast.literal_eval(t) for t in achado[1]}, marca)
+        return True, _copiar(valor)
+
+    def marca(self):
+        with self._lock:
+            return self._relogio
+
+    def guardar(self, chave, valor, tags, marca=None, local=False, tamanho=None):
+        """Guarda o valor; com a loja ligada ele também vai para o nível 2.
+
+        `local=True` mantém o valor só neste processo (ex.: a linha do usuário,
+        que tem o hash da senha). As invalidações das tags continuam valendo
+        entre processos. `tamanho` substitui o `tamanho_estimado` para objetos
+        que ele não sabe medir.
+        """
+        if self._loja is None or local:
+            self._guardar_local(chave, valor, tags, marca, tamanho)
+            return
+        # Aplica o log antes: uma invalidação de outro processo depois da marca recusa o valor aqui
+        self._sincronizar(forcar=True)
+        visto_ate = self._seq
+        tamanho = self._guardar_local(chave, valor, tags, marca, tamanho)
+        if tamanho is None or tamanho > self.valor_max_bytes:
+            return
+        dados = serializar(valor)
+        if dados is None:
+            return
+        gravou = self._loja.gravar(repr(chave), dados, [repr(t) for t in tags], time.time() + self.ttl, visto_ate)
+        if not gravou:
+            # Outro processo invalidou uma das tags no meio: a cópia local também é velha
+            with self._lock:
+                if chave in self._dados:
+                    self._remover(chave)
+                self._stats["recusados"] += 1
+
+    def _guardar_local(self, chave, valor, tags, marca, tamanho=None):
+        """Bytes estimados do valor guardado, ou None se foi recusado."""
+        tamanho = tamanho_estimado(valor) if tamanho is None else tamanho
+        with self._lock:
+            if marca is not None and (marca < self._limpo_em
+                                      or any(self._invalidada_em.get(t, -1) > marca for t in tags)):
+                self._stats["recusados"] += 1
+                return None
+            if tamanho > self.max_bytes:
+                return None
+            if chave in self._dados:
+                self._remover(chave)
+            self._dados[chave] = (_copiar(valor), time.monotonic() + self.ttl, tamanho, frozenset(tags))
+            self._bytes += tamanho
+            for tag in tags:
+                self._por_tag.setdefault(tag, set()).add(chave)
+            while self._bytes > self.max_bytes and self._dados:
+                self._remover(next(iter(self._dados)))
+                self._stats["despejos"] += 1
+        return tamanho
+
+    def invalidar(self, tags):
+        if self._loja is not None:
+            # A loja primeiro: depois daqui nenhuma falta local acha o valor velho no nível 2
+            seqs = self._loja.invalidar([repr(t) for t in tags])
+            with self._lock:
+                self._proprias.update(seqs)
+        with self._lock:
+            self._invalidar_tags(tags)
+
+    def _sincronizar(self, forcar=False):
+        """Aplica no nível 1 as invalidações dos outros processos (no máximo a cada `sincronia_s`)."""
+        agora = time.monotonic()
+        if not forcar and agora - self._sincronizado_em < self.sincronia_s:
+            return
+        seq, linhas, perdeu = self._loja.invalidacoes_desde(self._seq)
+        with self._lock:
+            self._sincronizado_em = agora
+            if seq <= self._seq:
+                return
+            if perdeu:
+                # Ficou para trás do log: não dá para saber o que mudou
+                self._dados.clear()
+                self._por_tag.clear()
+                self._invalidada_em.clear()
+                self._bytes = 0
+                self._relogio += 1
+                self._limpo_em = self._relogio
+            else:
+                self._invalidar_tags({ast.literal_eval(tag) for n, tag in linhas if n not in self._proprias})
+            self._proprias = {n for n in self._proprias if n > seq}
+            self._seq = seq
+
+    def _invalidar_tags(self, tags):
+        # Chamado com o lock
+        self._relogio += 1
+        for tag in tags:
+            self._invalidada_em[tag] = self._relogio
+            self._invalidada_em.move_to_end(tag)
+            for chave in list(self._por_tag.get(tag, ())):
+                self._remover(chave)
+                self._stats["invalidacoes"] += 1
+        # Esquece as invalidações mais antigas; uma marca anterior a elas passa a ser
+        # recusada por inteiro (_limpo_em), já que não dá mais para saber as tags
+        while len(self._invalidada_em) > self.invalidacoes_max:
+            _, relogio = self._invalidada_em.popitem(last=False)
+            self._limpo_em = max(self._limpo_em, relogio)
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+            self._por_tag.clear()
+            self._invalidada_em.clear()
+            self._bytes = 0
+            # Leituras que pegaram a marca antes da limpeza não gravam mais
+            self._relogio += 1
+            self._limpo_em = self._relogio
+
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entradas"] = len(self._dados)
+            stats["bytes"] = self._bytes
+            stats["compartilhado"] = self._loja is not None
+        acertos = stats["hits"] + stats["hits_nivel2"]
+        total = acertos + stats["misses"]
+        stats["taxa_acerto"] = acertos / total if total else 0.0
+        return stats
+
+    def _remover(self, chave):
+        # Chamado com o lock
+        _, _, tamanho, tags = self._dados.pop(chave)
+        self._bytes -= tamanho
+        for tag in tags:
+            chaves = self._por_tag.get(tag)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._por_tag[tag]
+
+
+# --- CACHE DO PROCESSO (compartilhado pelas sessões; as chaves sempre levam o user_id) ---
+
+cache = CacheLRU()
+
+
+def estatisticas_cache():
+    return cache.estatisticas()
@@ -0,0 +1,359 @@
+"""Estado compartilhado entre processos (vários `streamlit run` atrás de um balanceador).
+
+Desligado por padrão. Liga com FINANCAS_COMPARTILHADO_PATH ou no secrets.toml:
+
+    [compartilhado]
+    path = "/var/run/financas/compartilhado.db"   # arquivo visível a todos os processos
+    conexoes_max = 20        # conexões ao banco somando todos os processos
+    sincronia_ms = 100       # atraso máximo para um processo ver a invalidação de outro
+
+Com ele ligado:
+
+- Cache em dois níveis: cada processo mantém o seu CacheLRU (nível 1) e, numa
+  falta, procura o valor gravado por qualquer processo (nível 2) antes de ir ao
+  banco. As invalidações entram num log com número de sequência; cada processo
+  aplica o log no seu nível 1 (a cada `sincronia_ms`, e sempre antes de gravar).
+  Quem escreveu enxerga a escrita na hora; os outros processos, em até
+  `sincronia_ms`.
+- Sessões: cada token de login ganha um id registrado aqui, então qualquer
+  processo reabre a sessão e o "Sair" derruba o token em todos. Sem [auth]
+  segredo configurado, a chave dos tokens também fica aqui (comum a todos).
+- Orçamento de conexões: o pool de cada processo reserva uma vaga antes de abrir
+  uma conexão nova e a devolve ao fechar. Processos que param de dar sinal de
+  vida (crash) saem da conta depois de ORCAMENTO_VIVO_S.
+
+A `LojaSQLite` é a implementação local (um arquivo SQLite em WAL, bom para
+processos na mesma máquina e para os testes de carga). Outra loja (Redis, por
+exemplo) só precisa dos mesmos métodos públicos.
+
+A fila de escrita (services/fila_escrita.py) continua por processo: cada worker
+precisa do seu FINANCAS_FILA_PATH.
+"""
+import atexit
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import streamlit as st
+
+logger = logging.getLogger("financas.compartilhado")
+
+# --- CONFIGURAÇÃO ---
+CONEXOES_MAX = 20              # conexões somando todos os processos
+SINCRONIA_MS = 100
+VALOR_MAX_BYTES = 8 * 1024 * 1024  # valores maiores ficam só no nível 1
+HISTORICO_S = 600.0            # invalidações guardadas; um processo mais atrasado limpa o nível 1 todo
+ORCAMENTO_VIVO_S = 30.0        # sem sinal de vida há mais que isso, o processo sai do orçamento
+LIMPEZA_A_CADA = 200           # escritas entre duas limpezas de expirados
+
+
+def _config(chave, padrao):
+    try:
+        return type(padrao)(st.secrets["compartilhado"].get(chave, padrao))
+    except Exception:
+        return padrao
+
+
+class LojaSQLite:
+    """Cache nível 2, log de invalidações, sessões e orçamento de conexões num arquivo SQLite."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._escritas = 0
+        # Só o dono do processo lê o arquivo (o SQLite cria o -wal e o -shm com o mesmo modo)
+        os.close(os.open(caminho, os.O_CREAT | os.O_RDWR, 0o600))
+        os.chmod(caminho, 0o600)
+        self._db().executescript("""
+            CREATE TABLE IF NOT EXISTS cache_valores (
+                chave TEXT PRIMARY KEY,
+                valor BLOB NOT NULL,
+                tags TEXT NOT NULL,
+                expira_em REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cache_tags (
+                tag TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                PRIMARY KEY (tag, chave)
+            );
+            CREATE TABLE IF NOT EXISTS invalidacoes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                tag TEXT NOT NULL,
+                em REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sessoes (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                expira_em REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS orcamento_conexoes (
+                processo TEXT PRIMARY KEY,
+                abertas INTEGER NOT NULL,
+                visto_em REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS segredos (
+                nome TEXT PRIMARY KEY,
+                valor BLOB NOT NULL
+            );
+        """)
+
+    def _db(self):
+        # Uma conexão por thread: o sqlite3 não divide conexão entre threads com segurança
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.caminho, isolation_level=None, timeout=10.0)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transacao(self):
+        # IMMEDIATE pega a trava de escrita já no início: as conferências dentro da
+        # transação (invalidações, vagas) não mudam até o COMMIT
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    # --- CACHE ---
+
+    def ultima_invalidacao(self):
+        return self._db().execute("SELECT COALESCE(MAX(seq), 0) FROM invalidacoes").fetchone()[0]
+
+    def invalidacoes_desde(self, seq):
+        """(último seq, [(seq, tag)] depois de `seq`, perdeu) — perdeu: o log já não cobre desde `seq`."""
+        linhas = self._db().execute("SELECT seq, tag FROM invalidacoes WHERE seq > ? ORDER BY seq",
+                                    (seq,)).fetchall()
+        if not linhas:
+            return seq, [], False
+        # O seq é contínuo; um buraco logo depois do nosso é trecho do log já apagado
+        return linhas[-1][0], linhas, linhas[0][0] > seq + 1
+
+    def invalidar(self, tags):
+        """Registra as tags no log e apaga os valores que as usam. Devolve os seq gerados."""
+        if not tags:
+            return []
+        agora = time.time()
+        with self._transacao() as db:
+            seqs = [db.execute("INSERT INTO invalidacoes (tag, em) VALUES (?, ?)", (tag, agora)).lastrowid
+                    for tag in tags]
+            marcadores = ", ".join("?" * len(tags))
+            chaves = [c for (c,) in db.execute(
+                f"SELECT DISTINCT chave FROM cache_tags WHERE tag IN ({marcadores})", list(tags))]
+            if chaves:
+                marcadores_c = ", ".join("?" * len(chaves))
+                db.execute(f"DELETE FROM cache_valores WHERE chave IN ({marcadores_c})", chaves)
+                db.execute(f"DELETE FROM cache_tags WHERE chave IN ({marcadores_c})", chaves)
+        self._talvez_limpar()
+        return seqs
+
+    def ler(self, chave):
+        """(bytes, tags) de um valor ainda válido, ou None."""
+        linha = self._db().execute("SELECT valor, tags, expira_em FROM cache_valores WHERE chave = ?",
+                                   (chave,)).fetchone()
+        if linha is None or linha[2] < time.time():
+            return None
+        return linha[0], linha[1].split("\n") if linha[1] else []
+
+    def gravar(self, chave, valor, tags, expira_em, visto_ate):
+        """Grava se nenhuma das tags foi invalidada depois de `visto_ate` (o seq que quem leu já aplicou)."""
+        with self._transacao() as db:
+            if tags:
+                marcadores = ", ".join("?" * len(tags))
+                if db.execute(f"SELECT 1 FROM invalidacoes WHERE seq > ? AND tag IN ({marcadores}) LIMIT 1",
+                              [visto_ate, *tags]).fetchone():
+                    return False
+            db.execute("INSERT OR REPLACE INTO cache_valores (chave, valor, tags, expira_em) VALUES (?, ?, ?, ?)",
+                       (chave, valor, "\n".join(tags), expira_em))
+            db.execute("DELETE FROM cache_tags WHERE chave = ?", (chave,))
+            db.executemany("INSERT INTO cache_tags (tag, chave) VALUES (?, ?)", [(t, chave) for t in tags])
+        self._talvez_limpar()
+        return True
+
+    # --- SESSÕES ---
+
+    def abrir_sessao(self, sessao_id, user_id, expira_em):
+        with self._transacao() as db:
+            db.execute("INSERT OR REPLACE INTO sessoes (id, user_id, expira_em) VALUES (?, ?, ?)",
+                       (sessao_id, user_id, expira_em))
+
+    def sessao_ativa(self, sessao_id, user_id):
+        return self._db().execute("SELECT 1 FROM sessoes WHERE id = ? AND user_id = ? AND expira_em > ?",
+                                  (sessao_id, user_id, time.time())).fetchone() is not None
+
+    def encerrar_sessao(self, sessao_id):
+        with self._transacao() as db:
+            db.execute("DELETE FROM sessoes WHERE id = ?", (sessao_id,))
+
+    def segredo(self, nome, candidato):
+        """O segredo `nome` comum a todos os processos: o primeiro a pedir grava o seu `candidato`."""
+        with self._transacao() as db:
+            db.execute("INSERT OR IGNORE INTO segredos (nome, valor) VALUES (?, ?)", (nome, candidato))
+            return bytes(db.execute("SELECT valor FROM segredos WHERE nome = ?", (nome,)).fetchone()[0])
+
+    # --- ORÇAMENTO DE CONEXÕES ---
+
+    def reservar_conexao(self, processo, limite):
+        agora = time.time()
+        with self._transacao() as db:
+            abertas = db.execute("SELECT COALESCE(SUM(abertas), 0) FROM orcamento_conexoes WHERE visto_em > ?",
+                                 (agora - ORCAMENTO_VIVO_S,)).fetchone()[0]
+            if abertas >= limite:
+                return False
+            db.execute("""
+                INSERT INTO orcamento_conexoes (processo, abertas, visto_em) VALUES (?, 1, ?)
+                ON CONFLICT (processo) DO UPDATE SET abertas = abertas + 1, visto_em = excluded.visto_em
+            """, (processo, agora))
+        return True
+
+    def liberar_conexao(self, processo):
+        with self._transacao() as db:
+            db.execute("UPDATE orcamento_conexoes SET abertas = MAX(abertas - 1, 0), visto_em = ? WHERE processo = ?",
+                       (time.time(), processo))
+
+    def sinal_de_vida(self, processo):
+        with self._transacao() as db:
+            db.execute("UPDATE orcamento_conexoes SET visto_em = ? WHERE processo = ?", (time.time(), processo))
+
+    def sair_do_orcamento(self, processo):
+        with self._transacao() as db:
+            db.execute("DELETE FROM orcamento_conexoes WHERE processo = ?", (processo,))
+
+    def conexoes_abertas(self):
+        """{processo: conexões} dos processos vivos."""
+        return dict(self._db().execute("SELECT processo, abertas FROM orcamento_conexoes WHERE visto_em > ?",
+                                       (time.time() - ORCAMENTO_VIVO_S,)).fetchall())
+
+    # --- MANUTENÇÃO ---
+
+    def _talvez_limpar(self):
+        self._escritas += 1
+        if self._escritas % LIMPEZA_A_CADA == 0:
+            self.limpar_expirados()
+
+    def limpar_expirados(self):
+        agora = time.time()
+        with self._transacao() as db:
+            db.execute("DELETE FROM cache_tags WHERE chave IN (SELECT chave FROM cache_valores WHERE expira_em < ?)",
+                       (agora,))
+            db.execute("DELETE FROM cache_valores WHERE expira_em < ?", (agora,))
+            db.execute("DELETE FROM invalidacoes WHERE em < ?", (agora - HISTORICO_S,))
+            db.execute("DELETE FROM sessoes WHERE expira_em < ?", (agora,))
+            db.execute("DELETE FROM orcamento_conexoes WHERE visto_em < ?", (agora - 4 * ORCAMENTO_VIVO_S,))
+
+    def estatisticas(self):
+        db = self._db()
+        return {
+            "valores": db.execute("SELECT COUNT(*) FROM cache_valores").fetchone()[0],
+            "bytes": db.execute("SELECT COALESCE(SUM(LENGTH(valor)), 0) FROM cache_valores").fetchone()[0],
+            "ultima_invalidacao": self.ultima_invalidacao(),
+            "sessoes": db.execute("SELECT COUNT(*) FROM sessoes WHERE expira_em > ?", (time.time(),)).fetchone()[0],
+            "conexoes_por_processo": self.conexoes_abertas(),
+        }
+
+
+class OrcamentoConexoes:
+    """Vagas do pool deste processo dentro do limite global (ver PoolConexoes)."""
+
+    def __init__(self, loja, limite):
+        self.loja = loja
+        self.limite = limite
+        self.processo = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._parar = threading.Event()
+        threading.Thread(target=self._bater, name="orcamento-conexoes", daemon=True).start()
+        atexit.register(self.sair)
+
+    def reservar(self):
+        return self.loja.reservar_conexao(self.processo, self.limite)
+
+    def liberar(self):
+        self.loja.liberar_conexao(self.processo)
+
+    def sair(self):
+        self._parar.set()
+        try:
+            self.loja.sair_do_orcamento(self.processo)
+        except sqlite3.Error:
+            pass
+
+    def _bater(self):
+        while not self._parar.wait(ORCAMENTO_VIVO_S / 3):
+            try:
+                self.loja.sinal_de_vida(self.processo)
+            except sqlite3.Error as e:
+                logger.warning("Sinal de vida do orçamento de conexões falhou: %s", e)
+
+
+# --- LOJA DO PROCESSO ---
+
+_loja = None
+_orcamento = None
+_conexoes_max = None  # sobrescreve o [compartilhado] conexoes_max (ligar)
+_configurada = None
+_lock = threading.Lock()
+
+
+def _caminho_configurado():
+    if os.environ.get("FINANCAS_COMPARTILHADO_PATH"):
+        return os.environ["FINANCAS_COMPARTILHADO_PATH"]
+    try:
+        return st.secrets["compartilhado"]["path"]
+    except Exception:
+        return None
+
+
+def ativo():
+    global _configurada
+    if _configurada is None:
+        _configurada = _caminho_configurado() is not None
+    return _configurada
+
+
+def get_loja():
+    """A loja compartilhada, ou None no modo de um processo só. Na criação liga o cache nela."""
+    global _loja
+    if _loja is None and ativo():
+        with _lock:
+            if _loja is None:
+                from services.cache import cache
+                loja = LojaSQLite(_caminho_configurado())
+                cache.compartilhar(loja, _config("sincronia_ms", SINCRONIA_MS) / 1000,
+                                   _config("valor_max_bytes", VALOR_MAX_BYTES))
+                _loja = loja
+    return _loja
+
+
+def orcamento_conexoes():
+    """Orçamento do pool deste processo (um só, mesmo que o pool seja recriado), ou None sem a loja."""
+    global _orcamento
+    loja = get_loja()
+    if loja is None:
+        return None
+    with _lock:
+        if _orcamento is None:
+            _orcamento = OrcamentoConexoes(loja, _conexoes_max or _config("conexoes_max", CONEXOES_MAX))
+    return _orcamento
+
+
+def ligar(caminho, conexoes_max=None):
+    """Liga o modo compartilhado em tempo de execução (testes de carga e scripts), antes do pool existir."""
+    global _configurada, _conexoes_max
+    os.environ["FINANCAS_COMPARTILHADO_PATH"] = caminho
+    _configurada = True
+    _conexoes_max = conexoes_max
+    return get_loja()
+
+
+def estatisticas_compartilhado():
+    loja = get_loja()
+    return loja.estatisticas() if loja else {"ativo": False}
@@ -1,101 +1,959 @@
+import io
+from datetime import date
+
 import pandas as pd
 import streamlit as st
-from services.database import get_connection
+from services.database import conexao, dialeto
+from services.cache import cache
+from services.instrumentacao import instrumentado
+from services import busca, fila_escrita, recorrencias, resumo
+from services.autenticacao import (definir_sessoes, gastar_tempo_de_hash, hash_senha, normalizar_email,
+                                   verificar_senha)
+
+# Todas as funções pegam uma conexão emprestada do pool (services.database.conexao):
+# o commit/rollback acontece na saída do `with` e a conexão volta para o pool aberta.
+# As públicas levam @instrumentado (tempo, linhas e bytes por rerun, ver services/instrumentacao.py).
+
+# --- CACHE DE LEITURA ---
+# As leituras ficam em services.cache.cache com tags por usuário:
+#   ("historico", user_id)        -> depende de todos os meses (ler_movimentos, listar_meses)
+#   ("movimentos", user_id)       -> qualquer leitura de movimentos do usuário
+#   ("movimentos", user_id, mes)  -> leituras de um mês só
+#   ("metas", user_id)
+#   ("recorrencias", user_id)     -> regras de recorrência
+#   ("usuarios", email)           -> usuário buscado no login
+# Cada escrita invalida, depois do commit, só o que afetou.
+#
+# --- ESCRITA EM SEGUNDO PLANO ---
+# Os lançamentos avulsos (adicionar, atualizar, status, excluir, meta) passam por
+# _escrever: síncronos por padrão ou, com a fila ligada (services/fila_escrita.py),
+# só enfileirados. O SQL de cada um fica em _gravar_*(cursor, ...), que devolve as
+# tags a invalidar; as escritas em lote e as leituras esperam a fila do usuário.
+
+def _mes_de(data):
+    return data.strftime("%Y-%m") if hasattr(data, "strftime") else str(data)[:7]
+
+def _tags_movimentos(user_id, mes=None):
+    if mes is None:
+        return {("movimentos", user_id), ("historico", user_id)}
+    return {("movimentos", user_id), ("movimentos", user_id, mes)}
+
+def _tags_escrita(user_id, datas):
+    """Tags que uma escrita nas `datas` invalida; sem datas conhecidas, tudo do usuário."""
+    datas = [d for d in datas if d is not None]
+    if not datas:
+        return {("movimentos", user_id)}
+    return {("historico", user_id)} | {("movimentos", user_id, _mes_de(d)) for d in datas}
+
+def _invalidar_movimentos(user_id, datas):
+    cache.invalidar(_tags_escrita(user_id, datas))
+
+def _ler_cache(chave, user_id):
+    # Com a fila de escrita ligada, espera as escritas pendentes do usuário (ler o que escreveu)
+    fila_escrita.aguardar(user_id)
+    return cache.obter(chave)
 
 # --- AUTENTICAÇÃO ---
+# Hash e tokens em services/autenticacao.py. O usuário buscado pelo email fica no
+# cache (tag ("usuarios", email)): um segundo login do mesmo email não vai ao banco.
+# Só no cache deste processo: a linha tem o hash da senha e não vai à loja compartilhada.
 
-def criar_usuario(nome, email, senha):
-    conn = get_connection()
-    if conn:
-        try:
+def _buscar_usuario(email):
+    chave = ("usuario_email", email)
+    achou, usuario = cache.obter(chave, local=True)
+    if achou:
+        return usuario
+    marca = cache.marca()
+    with conexao() as conn:
+        if conn:
             cursor = conn.cursor()
-            cursor.execute("INSERT INTO usuarios (nome, email, senha) VALUES (%s, %s, %s)", (nome, email, senha))
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            st.error(f"Erro ao criar usuário (Email já existe?): {e}")
-            conn.close()
-            return False
+            cursor.execute("SELECT id, nome, senha FROM usuarios WHERE lower(email) = %s ORDER BY id LIMIT 1", (email,))
+            usuario = cursor.fetchone()
+            # Email sem conta não entra no cache: pode ser criada por outro processo
+            if usuario:
+                cache.guardar(chave, tuple(usuario), {("usuarios", email)}, marca, local=True)
+            return usuario
+
+@instrumentado
+def criar_usuario(nome, email, senha):
+    email = normalizar_email(email)
+    senha_hash = hash_senha(senha)  # fora do `with`: o hash é lento de propósito
+    try:
+        with conexao() as conn:
+            if conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1 FROM usuarios WHERE lower(email) = %s", (email,))
+                if cursor.fetchone():
+                    return False
+                cursor.execute("INSERT INTO usuarios (nome, email, senha) VALUES (%s, %s, %s)", (nome, email, senha_hash))
+                cache.invalidar({("usuarios", email)})
+                return True
+    except Exception as e:
+        st.error(f"Erro ao criar usuário (Email já existe?): {e}")
+        return False
 
+@instrumentado
 def autenticar_usuario(email, senha):
-    conn = get_connection()
-    if conn:
-        cursor = conn.cursor()
-        # Busca o usuário pelo email e senha
-        cursor.execute("SELECT id, nome FROM usuarios WHERE email = %s AND senha = %s", (email, senha))
-        usuario = cursor.fetchone()
-        conn.close()
-        return usuario # Retorna uma tupla (id, nome) ou None se falhar
+    """(id, nome) se email e senha conferem, senão None. Senhas antigas são regravadas com o hash atual."""
+    email = normalizar_email(email)
+    usuario = _buscar_usuario(email)
+    if usuario is None:
+        gastar_tempo_de_hash(senha)
+        return None
+    user_id, nome, armazenado = usuario
+    confere, regravar = verificar_senha(senha, armazenado)
+    if not confere:
+        return None
+    if regravar:
+        senha_hash = hash_senha(senha)
+        with conexao() as conn:
+            if conn:
+                conn.cursor().execute("UPDATE usuarios SET senha = %s WHERE id = %s", (senha_hash, user_id))
+        cache.invalidar({("usuarios", email)})
+    return user_id, nome
+
+@instrumentado
+def versao_sessao(user_id):
+    """Versão dos tokens de sessão do usuário (sobe a cada "Sair"); None sem banco."""
+    chave = ("sessao_versao", user_id)
+    achou, versao = cache.obter(chave)
+    if achou:
+        return versao
+    marca = cache.marca()
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT sessao_versao FROM usuarios WHERE id = %s", (user_id,))
+            linha = cursor.fetchone()
+            if linha:
+                cache.guardar(chave, int(linha[0]), {("sessao", user_id)}, marca)
+                return int(linha[0])
+    return None
+
+@instrumentado
+def revogar_sessoes(user_id):
+    """Invalida todos os tokens de sessão já emitidos para o usuário."""
+    with conexao() as conn:
+        if conn:
+            conn.cursor().execute("UPDATE usuarios SET sessao_versao = sessao_versao + 1 WHERE id = %s", (user_id,))
+    cache.invalidar({("sessao", user_id)})
+
+definir_sessoes(versao_sessao, revogar_sessoes)
 
 # --- DADOS FINANCEIROS (Agora com user_id) ---
 
+# --- FORMATO DOS DATAFRAMES DE MOVIMENTOS ---
+# ler_movimentos e ler_movimentos_mes devolvem sempre o mesmo frame compacto:
+#   data            datetime64
+#   mes             int32 AAAAMM (202405), chave de mês pronta para filtro/groupby
+#   categoria, tipo category
+#   valor_centavos  int64 (dinheiro exato: o banco arredonda, nada de float somado)
+#   fixo, pago      bool
+# Para exibir/gravar em reais: valor_centavos / 100.
+
+COLUNAS_MOVIMENTO = ("id, user_id, data, categoria, descricao, tipo, "
+                     "CAST(ROUND(valor * 100) AS BIGINT) AS valor_centavos, fixo, pago")
+COLUNAS_FRAME = ["id", "user_id", "data", "mes", "categoria", "descricao", "tipo", "valor_centavos", "fixo", "pago"]
+
+def _tipar_movimentos(df):
+    df = df.astype({"id": "int64", "user_id": "int32", "categoria": "category", "tipo": "category",
+                    "valor_centavos": "int64"})
+    df["data"] = pd.to_datetime(df["data"], format="ISO8601")
+    # O SQLite devolve 0/1; NULL vira False
+    df["fixo"] = df["fixo"].fillna(False).astype(bool)
+    df["pago"] = df["pago"].fillna(False).astype(bool)
+    df["mes"] = (df["data"].dt.year * 100 + df["data"].dt.month).astype("int32")
+    return df[COLUNAS_FRAME]
+
+def _movimentos_vazio():
+    return _tipar_movimentos(pd.DataFrame(columns=[c for c in COLUNAS_FRAME if c != "mes"]))
+
+@instrumentado
 def ler_movimentos(user_id):
-    conn = get_connection()
-    if conn:
-        # O filtro WHERE user_id = %s é o segredo do Multi-Tenant!
-        query = "SELECT * FROM movimentos WHERE user_id = %s"
-        df = pd.read_sql_query(query, conn, params=(user_id,))
-        conn.close()
+    chave = ("ler_movimentos", user_id)
+    achou, df = _ler_cache(chave, user_id)
+    if achou:
         return df
-    return pd.DataFrame()
+    marca = cache.marca()
+    with conexao() as conn:
+        if conn:
+            # O filtro WHERE user_id = %s é o segredo do Multi-Tenant!
+            query = f"SELECT {COLUNAS_MOVIMENTO} FROM movimentos WHERE user_id = %s"
+            df = _tipar_movimentos(pd.read_sql_query(query, conn, params=(user_id,)))
+            cache.guardar(chave, df, _tags_movimentos(user_id), marca)
+            return df
+    return _movimentos_vazio()
+
+# --- CONSULTAS POR MÊS ---
+# `mes` é sempre "AAAA-MM", o mesmo formato do seletor de período do dashboard.
+# Meses, KPIs e gastos por categoria vêm de resumo_mensal (services/resumo.py),
+# poucas linhas por mês. As leituras de lançamentos usam um intervalo de datas
+# (data >= início AND data < fim) para o banco usar o índice em (user_id, data).
+
+def _limites_mes(mes):
+    ano, m = (int(p) for p in mes.split("-"))
+    inicio = date(ano, m, 1)
+    fim = date(ano + 1, 1, 1) if m == 12 else date(ano, m + 1, 1)
+    return inicio, fim
+
+@instrumentado
+def listar_meses(user_id, categoria=None):
+    """Meses ("AAAA-MM") com lançamentos, do mais recente para o mais antigo."""
+    query = "SELECT DISTINCT mes FROM resumo_mensal WHERE user_id = %s"
+    params = [user_id]
+    if categoria:
+        query += " AND categoria = %s"
+        params.append(categoria)
+    chave = ("listar_meses", user_id, categoria)
+    achou, meses = _ler_cache(chave, user_id)
+    if achou:
+        return meses
+    marca = cache.marca()
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            cursor.execute(query + " ORDER BY mes DESC", params)
+            meses = [linha[0] for linha in cursor.fetchall()]
+            cache.guardar(chave, meses, _tags_movimentos(user_id), marca)
+            return meses
+    return []
+
+@instrumentado
+def resumo_mes(user_id, mes):
+    """KPIs do mês: receitas, despesas, saldo e falta_pagar (despesas não pagas)."""
+    chave = ("resumo_mes", user_id, mes)
+    achou, kpis = _ler_cache(chave, user_id)
+    if achou:
+        return kpis
+    marca = cache.marca()
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT COALESCE(SUM(receitas_centavos), 0), COALESCE(SUM(despesas_centavos), 0),
+                       COALESCE(SUM(pendente_centavos), 0)
+                FROM resumo_mensal
+                WHERE user_id = %s AND mes = %s
+            """, (user_id, mes))
+            receitas, despesas, falta_pagar = (int(v) / 100 for v in cursor.fetchone())
+            kpis = {"receitas": receitas, "despesas": despesas,
+                    "saldo": receitas + despesas, "falta_pagar": falta_pagar}
+            cache.guardar(chave, kpis, _tags_movimentos(user_id, mes), marca)
+            return kpis
+    return {"receitas": 0.0, "despesas": 0.0, "saldo": 0.0, "falta_pagar": 0.0}
+
+@instrumentado
+def gastos_por_categoria(user_id, mes):
+    """Total gasto (positivo) por categoria no mês, maior primeiro."""
+    chave = ("gastos_por_categoria", user_id, mes)
+    achou, df = _ler_cache(chave, user_id)
+    if achou:
+        return df
+    marca = cache.marca()
+    with conexao() as conn:
+        if conn:
+            query = """
+                SELECT categoria, -despesas_centavos / 100.0 AS valor
+                FROM resumo_mensal
+                WHERE user_id = %s AND mes = %s AND despesas_centavos < 0
+                ORDER BY 2 DESC
+            """
+            df = pd.read_sql_query(query, conn, params=(user_id, mes))
+            cache.guardar(chave, df, _tags_movimentos(user_id, mes), marca)
+            return df
+    return pd.DataFrame(columns=["categoria", "valor"])
+
+@instrumentado
+def ler_movimentos_mes(user_id, mes, categoria=None):
+    """Lançamentos de um único mês (para o extrato), no frame compacto descrito acima."""
+    inicio, fim = _limites_mes(mes)
+    query = f"SELECT {COLUNAS_MOVIMENTO} FROM movimentos WHERE user_id = %s AND data >= %s AND data < %s"
+    params = [user_id, inicio, fim]
+    if categoria:
+        query += " AND categoria = %s"
+        params.append(categoria)
+    chave = ("ler_movimentos_mes", user_id, mes, categoria)
+    achou, df = _ler_cache(chave, user_id)
+    if achou:
+        return df
+    marca = cache.marca()
+    with conexao() as conn:
+        if conn:
+            df = _tipar_movimentos(pd.read_sql_query(query + " ORDER BY data, id", conn, params=params))
+            cache.guardar(chave, df, _tags_movimentos(user_id, mes), marca)
+            return df
+    return _movimentos_vazio()
+
+# --- SÉRIES PARA A TELA DE TENDÊNCIAS ---
+
+@instrumentado
+def serie_mensal(user_id):
+    """Histórico inteiro do resumo_mensal: mes (int32 AAAAMM), categoria e os totais em centavos.
+
+    São no máximo (meses x categorias) linhas, então dez anos de dados cabem numa leitura só.
+    """
+    chave = ("serie_mensal", user_id)
+    achou, df = _ler_cache(chave, user_id)
+    if achou:
+        return df
+    marca = cache.marca()
+    with conexao() as conn:
+        if conn:
+            df = pd.read_sql_query("""
+                SELECT mes, categoria, receitas_centavos, despesas_centavos, pendente_centavos, qtd
+                FROM resumo_mensal
+                WHERE user_id = %s
+                ORDER BY mes
+            """, conn, params=(user_id,))
+            df["mes"] = (df["mes"].str.slice(0, 4).astype("int32") * 100
+                         + df["mes"].str.slice(5, 7).astype("int32"))
+            df = df.astype({"categoria": "category", "receitas_centavos": "int64", "despesas_centavos": "int64",
+                            "pendente_centavos": "int64", "qtd": "int32"})
+            cache.guardar(chave, df, _tags_movimentos(user_id), marca)
+            return df
+    return pd.DataFrame(columns=["mes", "categoria", "receitas_centavos", "despesas_centavos",
+                                 "pendente_centavos", "qtd"])
+
+@instrumentado
+def ler_fixos_recentes(user_id):
+    """Fixos avulsos (sem regra de recorrência) do mês mais recente que tem algum.
+
+    Entram na projeção junto com as ocorrências futuras das regras.
+    """
+    chave = ("ler_fixos_recentes", user_id)
+    achou, df = _ler_cache(chave, user_id)
+    if achou:
+        return df
+    marca = cache.marca()
+    ultima = None
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MAX(data) FROM movimentos WHERE user_id = %s AND fixo AND recorrencia_id IS NULL",
+                           (user_id,))
+            ultima = cursor.fetchone()[0]
+            if ultima is None:
+                return _movimentos_vazio()
+            inicio, fim = _limites_mes(_mes_de(ultima))
+            df = _tipar_movimentos(pd.read_sql_query(f"""
+                SELECT {COLUNAS_MOVIMENTO} FROM movimentos
+                WHERE user_id = %s AND data >= %s AND data < %s AND fixo AND recorrencia_id IS NULL
+                ORDER BY data, id
+            """, conn, params=(user_id, inicio, fim)))
+            cache.guardar(chave, df, _tags_movimentos(user_id), marca)
+            return df
+    return _movimentos_vazio()
+
+# --- RELATÓRIO ANUAL ---
+# Soma os meses do ano no resumo_mensal (no máximo 12 linhas por categoria), sem
+# tocar em movimentos. Escritas em outros anos não invalidam o relatório.
+
+COLUNAS_RELATORIO = ["categoria", "receitas", "despesas", "saldo", "pendente", "lancamentos", "meses"]
+
+@instrumentado
+def relatorio_anual(user_id, ano):
+    """Totais do ano por categoria, em reais (despesas e pendente negativos), e em quantos meses ela apareceu."""
+    ano = int(ano)
+    chave = ("relatorio_anual", user_id, ano)
+    achou, df = _ler_cache(chave, user_id)
+    if achou:
+        return df
+    marca = cache.marca()
+    with conexao() as conn:
+        if conn:
+            df = pd.read_sql_query("""
+                SELECT categoria, SUM(receitas_centavos) AS receitas, SUM(despesas_centavos) AS despesas,
+                       SUM(pendente_centavos) AS pendente, SUM(qtd) AS lancamentos, COUNT(*) AS meses
+                FROM resumo_mensal
+                WHERE user_id = %s AND mes >= %s AND mes <= %s
+                GROUP BY categoria
+                ORDER BY categoria
+            """, conn, params=(user_id, f"{ano}-01", f"{ano}-12"))
+            for coluna in ("receitas", "despesas", "pendente"):
+                df[coluna] = df[coluna].astype("int64") / 100
+            df["saldo"] = df["receitas"] + df["despesas"]
+            df = df.astype({"lancamentos": "int64", "meses": "int32"})[COLUNAS_RELATORIO]
+            tags = {("movimentos", user_id)} | {("movimentos", user_id, f"{ano}-{m:02d}") for m in range(1, 13)}
+            cache.guardar(chave, df, tags, marca)
+            return df
+    return pd.DataFrame(columns=COLUNAS_RELATORIO)
+
+# --- EXTRATO PAGINADO ---
+# Paginação por chave (keyset): a próxima página começa depois da (chave, id) da
+# última linha vista, então o custo não cresce com o número da página. A ordem é
+# sempre desempatada pelo id para a chave ser única.
+
+EXTRATO_POR_PAGINA = 50
+ORDENS_EXTRATO = {
+    "data": "data",
+    "valor": "CAST(ROUND(valor * 100) AS BIGINT)",  # compara em centavos, igual ao frame
+    "categoria": "categoria",
+    "descricao": "COALESCE(descricao, '')",
+}
+_COLUNA_CURSOR = {"data": "data", "valor": "valor_centavos", "categoria": "categoria", "descricao": "descricao"}
+
+def _filtro_extrato(user_id, mes, busca):
+    inicio, fim = _limites_mes(mes)
+    where = "user_id = %s AND data >= %s AND data < %s"
+    params = [user_id, inicio, fim]
+    if busca:
+        # ! escapa os curingas digitados; ILIKE vira LIKE no SQLite
+        termo = "%" + busca.replace("!", "!!").replace("%", "!%").replace("_", "!_") + "%"
+        where += " AND (descricao ILIKE %s ESCAPE '!' OR categoria ILIKE %s ESCAPE '!')"
+        params += [termo, termo]
+    return where, params
+
+def _valor_cursor(linha, ordem):
+    valor = linha[_COLUNA_CURSOR[ordem]]
+    if ordem == "data":
+        return valor.date()
+    if ordem == "valor":
+        return int(valor)
+    return valor if isinstance(valor, str) else ""
+
+@instrumentado
+def ler_extrato_pagina(user_id, mes, ordem="data", decrescente=False, busca=None, apos=None,
+                       tamanho=EXTRATO_POR_PAGINA):
+    """Uma página do extrato do mês: (DataFrame, cursor da próxima página ou None).
+
+    `ordem` é uma das chaves de ORDENS_EXTRATO; `busca` filtra descrição/categoria
+    (sem diferenciar maiúsculas); `apos` é o cursor devolvido pela página anterior.
+    """
+    if ordem not in ORDENS_EXTRATO:
+        raise ValueError(f"Ordem inválida: {ordem}")
+    busca = (busca or "").strip()
+    chave = ("ler_extrato_pagina", user_id, mes, ordem, decrescente, busca, apos, tamanho)
+    achou, pagina = _ler_cache(chave, user_id)
+    if achou:
+        return pagina
+    marca = cache.marca()
+    expr = ORDENS_EXTRATO[ordem]
+    sentido, comparacao = ("DESC", "<") if decrescente else ("ASC", ">")
+    where, params = _filtro_extrato(user_id, mes, busca)
+    if apos is not None:
+        where += f" AND ({expr}, id) {comparacao} (%s, %s)"
+        params += list(apos)
+    # Uma linha a mais diz se existe próxima página sem precisar de COUNT
+    query = (f"SELECT {COLUNAS_MOVIMENTO} FROM movimentos WHERE {where} "
+             f"ORDER BY {expr} {sentido}, id {sentido} LIMIT %s")
+    with conexao() as conn:
+        if conn:
+            df = _tipar_movimentos(pd.read_sql_query(query, conn, params=params + [tamanho + 1]))
+            proximo = None
+            if len(df) > tamanho:
+                df = df.iloc[:tamanho]
+                ultima = df.iloc[-1]
+                proximo = (_valor_cursor(ultima, ordem), int(ultima["id"]))
+            pagina = (df, proximo)
+            cache.guardar(chave, pagina, _tags_movimentos(user_id, mes), marca)
+            return pagina
+    return _movimentos_vazio(), None
+
+@instrumentado
+def contar_extrato(user_id, mes, busca=None):
+    """Quantos lançamentos o extrato do mês tem com o filtro `busca`."""
+    busca = (busca or "").strip()
+    chave = ("contar_extrato", user_id, mes, busca)
+    achou, total = _ler_cache(chave, user_id)
+    if achou:
+        return total
+    marca = cache.marca()
+    if busca:
+        where, params = _filtro_extrato(user_id, mes, busca)
+        query = f"SELECT COUNT(*) FROM movimentos WHERE {where}"
+    else:
+        query, params = "SELECT COALESCE(SUM(qtd), 0) FROM resumo_mensal WHERE user_id = %s AND mes = %s", [user_id, mes]
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            total = int(cursor.fetchone()[0])
+            cache.guardar(chave, total, _tags_movimentos(user_id, mes), marca)
+            return total
+    return 0
 
+# --- BUSCA EM TODOS OS MESES ---
+# Índices de trigramas (Postgres) ou FTS5 (SQLite), SQL em services/busca.py.
+# Depende de todos os meses: qualquer escrita do usuário invalida o resultado.
+
+@instrumentado
+def buscar_movimentos(user_id, texto="", de=None, ate=None, valor_min=None, valor_max=None, aproximada=False,
+                      limite=busca.BUSCA_LIMITE):
+    """Lançamentos de qualquer mês cuja descrição/categoria contém as palavras de `texto`.
+
+    `de`/`ate` são datas inclusivas e `valor_min`/`valor_max` valores em reais
+    (em módulo). Os mais recentes primeiro, até `limite` linhas. Com
+    `aproximada`, tolera erros de digitação e ordena pela coluna "semelhanca".
+    """
+    texto = (texto or "").strip()
+    chave = ("buscar_movimentos", user_id, texto, de, ate, valor_min, valor_max, aproximada, limite)
+    achou, df = _ler_cache(chave, user_id)
+    if achou:
+        return df
+    marca = cache.marca()
+    banco = dialeto()
+    with conexao() as conn:
+        if conn:
+            plano = None
+            if banco == "sqlite":
+                plano = busca.planejar(conn.cursor(), texto, aproximada)
+            elif aproximada:
+                busca.ajustar_limiar(conn.cursor())
+            query, params = busca.consulta(banco, COLUNAS_MOVIMENTO, user_id, texto, de, ate, valor_min, valor_max,
+                                           aproximada, limite, plano)
+            bruto = pd.read_sql_query(query, conn, params=params)
+            df = _tipar_movimentos(bruto)
+            if aproximada and texto:
+                if "semelhanca" in bruto:
+                    df["semelhanca"] = bruto["semelhanca"].astype(float)
+                else:
+                    df = busca.ordenar_aproximada(df, texto, limite)
+            cache.guardar(chave, df, _tags_movimentos(user_id), marca)
+            return df
+    return _movimentos_vazio()
+
+def _gravar_adicionar_movimento(cursor, user_id, data, categoria, descricao, tipo, valor, fixo, pago):
+    cursor.execute("""
+        INSERT INTO movimentos (user_id, data, categoria, descricao, tipo, valor, fixo, pago)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, (user_id, data, categoria, descricao, tipo, valor, fixo, pago))
+    resumo.ajustar(cursor, user_id, data, categoria, valor, pago)
+    return _tags_escrita(user_id, [data])
+
+@instrumentado
 def adicionar_movimento(user_id, data, categoria, descricao, tipo, valor, fixo, pago):
-    conn = get_connection()
-    if conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO movimentos (user_id, data, categoria, descricao, tipo, valor, fixo, pago)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (user_id, data, categoria, descricao, tipo, valor, fixo, pago))
-        conn.commit()
-        conn.close()
+    _escrever("adicionar_movimento", user_id, user_id, data, categoria, descricao, tipo, valor, fixo, pago)
+
+# --- INSERÇÃO EM LOTE ---
+# Os dois caminhos em lote (clonagem e importação de extratos) mandam o bloco
+# inteiro por COPY para uma tabela temporária e fazem um único INSERT ... SELECT
+# filtrando o que já existe. Uma transação e poucas idas ao banco por bloco.
+
+COLUNAS_LOTE = ["data", "categoria", "descricao", "tipo", "valor", "fixo", "pago"]
+
+def _copiar_para_stage(cursor, df):
+    """Cria a tabela temporária `lote_stage` e copia `df` (COLUNAS_LOTE + hash_importacao/recorrencia_id/ocorrencia)."""
+    lote = df.reindex(columns=COLUNAS_LOTE + ["hash_importacao", "recorrencia_id", "ocorrencia"])
+    lote["data"] = pd.to_datetime(lote["data"]).dt.strftime("%Y-%m-%d")
+    buffer = io.StringIO()
+    # Nulo vira \N: o campo vazio fica sendo a string vazia (descrição "" não vira NULL)
+    lote.to_csv(buffer, index=False, header=False, na_rep="\\N")
+    buffer.seek(0)
+    cursor.execute("""
+        CREATE TEMP TABLE lote_stage (
+            data DATE, categoria TEXT, descricao TEXT, tipo TEXT, valor NUMERIC,
+            fixo BOOLEAN, pago BOOLEAN, hash_importacao BIGINT, recorrencia_id INTEGER, ocorrencia INTEGER
+        ) ON COMMIT DROP
+    """)
+    cursor.copy_expert("COPY lote_stage FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+
+def _meses_do_lote(df):
+    return pd.to_datetime(df["data"]).dt.strftime("%Y-%m").unique().tolist()
+
+@instrumentado
+def adicionar_movimentos_em_lote(user_id, df):
+    """Insere as linhas de `df` (colunas de COLUNAS_LOTE) numa única transação.
+
+    É idempotente contando as repetições: a n-ésima linha igual do lote (mesma
+    data, categoria, descrição e valor) só entra se o usuário ainda não tem n
+    linhas assim. Clicar duas vezes em "Clonar" não duplica nada, e duas contas
+    fixas iguais no mês de origem continuam duas. Devolve quantas linhas entraram.
+    """
+    if df.empty:
+        return 0
+    # As escritas em lote vão direto ao banco: antes, as avulsas do usuário que estão na fila
+    fila_escrita.aguardar(user_id)
+    lote = df[COLUNAS_LOTE].copy()
+    lote["ocorrencia"] = lote.groupby(["data", "categoria", "descricao", "valor"], dropna=False).cumcount() + 1
+
+    inseridas = 0
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            _copiar_para_stage(cursor, lote)
+            cursor.execute("""
+                INSERT INTO movimentos (user_id, data, categoria, descricao, tipo, valor, fixo, pago)
+                SELECT %s, s.data, s.categoria, s.descricao, s.tipo, s.valor, s.fixo, s.pago
+                FROM lote_stage s
+                WHERE (
+                    SELECT COUNT(*) FROM movimentos m
+                    WHERE m.user_id = %s AND m.data = s.data AND m.categoria = s.categoria AND m.valor = s.valor
+                      AND (m.descricao = s.descricao OR (m.descricao IS NULL AND s.descricao IS NULL))
+                ) < s.ocorrencia
+            """, (user_id, user_id))
+            inseridas = cursor.rowcount
+            if inseridas:
+                resumo.recalcular_meses(cursor, user_id, _meses_do_lote(lote))
+    if inseridas:
+        _invalidar_movimentos(user_id, set(lote["data"]))
+    return inseridas
+
+@instrumentado
+def copiar_movimentos(user_id, df):
+    """Carga rápida via COPY de um bloco normalizado (COLUNAS_LOTE + hash_importacao).
+
+    Só entram as linhas cujo hash ainda não existe para o usuário, então
+    reimportar o mesmo extrato não duplica nada. Devolve quantas linhas entraram.
+    """
+    fila_escrita.aguardar(user_id)
+    lote = df.drop_duplicates(subset=["hash_importacao"])
+
+    inseridas = 0
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            _copiar_para_stage(cursor, lote)
+            cursor.execute("""
+                INSERT INTO movimentos (user_id, data, categoria, descricao, tipo, valor, fixo, pago, hash_importacao)
+                SELECT %s, s.data, s.categoria, s.descricao, s.tipo, s.valor, s.fixo, s.pago, s.hash_importacao
+                FROM lote_stage s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM movimentos m
+                    WHERE m.user_id = %s AND m.hash_importacao = s.hash_importacao
+                )
+            """, (user_id, user_id))
+            inseridas = cursor.rowcount
+            if inseridas:
+                resumo.recalcular_meses(cursor, user_id, _meses_do_lote(lote))
+    if inseridas:
+        _invalidar_movimentos(user_id, set(lote["data"]))
+    return inseridas
+
+@instrumentado
+def clonar_fixos(user_id, mes_origem, meses=1):
+    """Copia os lançamentos fixos de `mes_origem` para `meses` à frente, como pendentes."""
+    df_origem = ler_movimentos_mes(user_id, mes_origem)
+    fixos = df_origem[df_origem['fixo']]
+    if fixos.empty:
+        return 0
+    # DateOffset numa Series inteira: o deslocamento é vetorizado (31/01 -> 28/02)
+    novos = fixos.assign(data=fixos['data'] + pd.DateOffset(months=meses), valor=fixos['valor_centavos'] / 100,
+                         fixo=True, pago=False)
+    return adicionar_movimentos_em_lote(user_id, novos)
+
+# --- RECORRÊNCIAS ---
+# As regras ficam em `recorrencias` e services.recorrencias expande as ocorrências
+# em memória. Só os meses que já chegaram viram linhas em movimentos (fixas,
+# pendentes, com recorrencia_id), em lote, para poderem ser marcadas como pagas;
+# projeções e assinaturas usam as ocorrências futuras sem gravar nada.
+#   ("recorrencias", user_id) -> regras do usuário
+
+COLUNAS_RECORRENCIA = ("id, categoria, descricao, tipo, CAST(ROUND(valor * 100) AS BIGINT) AS valor_centavos, "
+                       "frequencia, intervalo, inicio, fim, materializado_ate")
+
+def _regras_vazio():
+    return pd.DataFrame({"id": pd.Series(dtype="int64"), "categoria": pd.Series(dtype="str"),
+                         "descricao": pd.Series(dtype="str"), "tipo": pd.Series(dtype="str"),
+                         "valor_centavos": pd.Series(dtype="int64"), "frequencia": pd.Series(dtype="str"),
+                         "intervalo": pd.Series(dtype="int64"), "inicio": pd.Series(dtype="datetime64[ns]"),
+                         "fim": pd.Series(dtype="datetime64[ns]"), "materializado_ate": pd.Series(dtype="datetime64[ns]")})
+
+@instrumentado
+def ler_recorrencias(user_id):
+    """Regras do usuário no formato que services.recorrencias espera (datas como datetime64)."""
+    chave = ("ler_recorrencias", user_id)
+    achou, df = _ler_cache(chave, user_id)
+    if achou:
+        return df
+    marca = cache.marca()
+    with conexao() as conn:
+        if conn:
+            df = pd.read_sql_query(f"SELECT {COLUNAS_RECORRENCIA} FROM recorrencias WHERE user_id = %s ORDER BY id",
+                                   conn, params=(user_id,))
+            if df.empty:
+                df = _regras_vazio()
+            else:
+                df = df.astype({"id": "int64", "valor_centavos": "int64", "intervalo": "int64"})
+                for coluna in ("inicio", "fim", "materializado_ate"):
+                    df[coluna] = pd.to_datetime(df[coluna], format="ISO8601")
+            cache.guardar(chave, df, {("recorrencias", user_id)}, marca)
+            return df
+    return _regras_vazio()
+
+def _primeiro_dia(data):
+    return pd.Timestamp(data).to_period("M").to_timestamp()
+
+def _mes_anterior():
+    # Regra nova conta como gravada até o mês passado: os meses que já passaram
+    # não viram pendências (só com retroativo=True)
+    return (_primeiro_dia(date.today()) - pd.DateOffset(months=1)).date()
 
+@instrumentado
+def materializar_recorrencias(user_id, ate=None):
+    """Grava em movimentos as ocorrências das regras até o mês de `ate` (padrão: mês atual).
+
+    Cada regra lembra até que mês já foi gravada (materializado_ate), então a
+    chamada de toda rerun só lê as regras do cache e sai; quando vira o mês, todas
+    as regras atrasadas entram num COPY só. Devolve quantas linhas entraram.
+    """
+    alvo = _primeiro_dia(ate or date.today())
+    regras = ler_recorrencias(user_id)
+    pendentes = regras[(regras["materializado_ate"].isna() | (regras["materializado_ate"] < alvo))
+                       & (regras["inicio"] < alvo + pd.DateOffset(months=1))]
+    if pendentes.empty:
+        return 0
+
+    # Cada regra continua do mês seguinte ao último gravado (ou do início)
+    gravado = pendentes["materializado_ate"].dt.to_period("M").dt.to_timestamp()
+    desde = (gravado + pd.DateOffset(months=1)).fillna(pendentes["inicio"])
+    desde = pd.Series(desde.to_numpy(), index=pendentes["id"].to_numpy())
+    novas = recorrencias.ocorrencias(pendentes, desde.min(), alvo + pd.DateOffset(months=1))
+    novas = novas[novas["data"].to_numpy() >= desde.loc[novas["recorrencia_id"]].to_numpy()]
+    novas = novas.assign(valor=novas["valor_centavos"] / 100, fixo=True, pago=False,
+                         recorrencia_id=novas["recorrencia_id"].astype("Int64"))
+
+    inseridas = 0
+    ids = pendentes["id"].tolist()
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            if not novas.empty:
+                _copiar_para_stage(cursor, novas)
+                # O índice único (recorrencia_id, data) segura duas sessões materializando juntas
+                cursor.execute("""
+                    INSERT INTO movimentos (user_id, data, categoria, descricao, tipo, valor, fixo, pago, recorrencia_id)
+                    SELECT %s, s.data, s.categoria, s.descricao, s.tipo, s.valor, s.fixo, s.pago, s.recorrencia_id
+                    FROM lote_stage s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM movimentos m WHERE m.recorrencia_id = s.recorrencia_id AND m.data = s.data
+                    )
+                    ON CONFLICT (recorrencia_id, data) WHERE recorrencia_id IS NOT NULL DO NOTHING
+                """, (user_id,))
+                inseridas = cursor.rowcount
+                if inseridas:
+                    resumo.recalcular_meses(cursor, user_id, _meses_do_lote(novas))
+            marcadores = ", ".join(["%s"] * len(ids))
+            cursor.execute(f"UPDATE recorrencias SET materializado_ate = %s WHERE user_id = %s AND id IN ({marcadores})",
+                           (alvo.date(), user_id, *ids))
+    cache.invalidar({("recorrencias", user_id)})
+    if inseridas:
+        _invalidar_movimentos(user_id, set(novas["data"]))
+    return inseridas
+
+@instrumentado
+def criar_recorrencia(user_id, inicio, categoria, descricao, tipo, valor, frequencia="mensal", intervalo=1, fim=None,
+                      retroativo=False):
+    """Cria a regra e já grava a ocorrência do mês atual. Devolve o id da regra.
+
+    Com `inicio` no passado, os meses anteriores ao atual só são gravados (como
+    pendentes) com `retroativo=True`.
+    """
+    id_regra = None
+    try:
+        with conexao() as conn:
+            if conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO recorrencias (user_id, categoria, descricao, tipo, valor, frequencia, intervalo, inicio, fim,
+                                              materializado_ate)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
+                """, (user_id, categoria, descricao, tipo, valor, frequencia, intervalo, inicio, fim,
+                      None if retroativo else _mes_anterior()))
+                id_regra = cursor.fetchone()[0]
+    except Exception as e:
+        st.error(f"Erro ao criar recorrência: {e}")
+        return None
+    if id_regra is None:
+        return None
+    cache.invalidar({("recorrencias", user_id)})
+    materializar_recorrencias(user_id)
+    return id_regra
+
+@instrumentado
+def encerrar_recorrencia(id_regra, user_id, fim):
+    """Define o fim da regra e apaga as ocorrências já gravadas depois dele que ainda não foram pagas."""
+    fila_escrita.aguardar(user_id)
+    apagadas = []
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE recorrencias SET fim = %s WHERE id = %s AND user_id = %s", (fim, id_regra, user_id))
+            cursor.execute("""
+                DELETE FROM movimentos WHERE recorrencia_id = %s AND user_id = %s AND data > %s AND NOT pago
+                RETURNING data, categoria, valor, pago
+            """, (id_regra, user_id, fim))
+            apagadas = cursor.fetchall()
+            for linha in apagadas:
+                resumo.ajustar(cursor, user_id, *linha, sinal=-1)
+    cache.invalidar({("recorrencias", user_id)})
+    if apagadas:
+        _invalidar_movimentos(user_id, [linha[0] for linha in apagadas])
+
+@instrumentado
+def excluir_recorrencia(id_regra, user_id):
+    """Apaga a regra; as ocorrências já gravadas ficam em movimentos como lançamentos avulsos."""
+    fila_escrita.aguardar(user_id)
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE movimentos SET recorrencia_id = NULL WHERE recorrencia_id = %s AND user_id = %s",
+                           (id_regra, user_id))
+            cursor.execute("DELETE FROM recorrencias WHERE id = %s AND user_id = %s", (id_regra, user_id))
+    cache.invalidar({("recorrencias", user_id)})
+
+@instrumentado
+def converter_fixos_em_recorrencias(user_id, mes):
+    """Transforma os fixos avulsos de `mes` em regras mensais (o caminho para sair do "Clonar").
+
+    Cada fixo distinto (categoria, descrição, tipo e valor; repetidos no mês
+    viram uma regra só) vira uma regra que começa na data dele; ele e as cópias
+    clonadas depois passam a pertencer à regra, uma linha por data (o índice
+    único (recorrencia_id, data)): entre fixos iguais na mesma data fica o de
+    menor id, e os outros continuam avulsos. A regra conta como gravada até o
+    último mês dessas cópias, ou até o mês passado (meses antigos sem cópia não
+    viram pendências). Três comandos, quantos fixos houver. Devolve quantas
+    regras foram criadas.
+    """
+    fila_escrita.aguardar(user_id)
+    inicio, fim = _limites_mes(mes)
+    criadas = 0
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO recorrencias (user_id, categoria, descricao, tipo, valor, inicio)
+                SELECT user_id, categoria, descricao, tipo, valor, MIN(data) FROM movimentos
+                WHERE user_id = %s AND data >= %s AND data < %s AND fixo AND recorrencia_id IS NULL
+                GROUP BY user_id, categoria, descricao, tipo, valor
+                RETURNING id
+            """, (user_id, inicio, fim))
+            ids = [linha[0] for linha in cursor.fetchall()]
+            criadas = len(ids)
+            if ids:
+                lista = ", ".join(["%s"] * len(ids))
+                regra_do_fixo = f"""
+                    SELECT r.id FROM recorrencias r
+                    WHERE r.id IN ({lista}) AND r.categoria = movimentos.categoria AND r.tipo = movimentos.tipo
+                      AND r.valor = movimentos.valor AND r.inicio <= movimentos.data
+                      AND (r.descricao = movimentos.descricao OR (r.descricao IS NULL AND movimentos.descricao IS NULL))
+                """
+                primeiro_na_data = """
+                    SELECT MIN(d.id) FROM movimentos d
+                    WHERE d.user_id = movimentos.user_id AND d.data = movimentos.data AND d.fixo
+                      AND d.recorrencia_id IS NULL AND d.categoria = movimentos.categoria AND d.tipo = movimentos.tipo
+                      AND d.valor = movimentos.valor
+                      AND (d.descricao = movimentos.descricao OR (d.descricao IS NULL AND movimentos.descricao IS NULL))
+                """
+                cursor.execute(f"""
+                    UPDATE movimentos SET recorrencia_id = ({regra_do_fixo})
+                    WHERE user_id = %s AND fixo AND recorrencia_id IS NULL AND data >= %s AND EXISTS ({regra_do_fixo})
+                      AND id = ({primeiro_na_data})
+                """, (*ids, user_id, inicio, *ids))
+                cursor.execute(f"""
+                    UPDATE recorrencias SET materializado_ate = COALESCE((
+                        SELECT MAX(data) FROM movimentos WHERE recorrencia_id = recorrencias.id AND data > %s
+                    ), %s) WHERE id IN ({lista})
+                """, (_mes_anterior(), _mes_anterior(), *ids))
+    if criadas:
+        cache.invalidar({("recorrencias", user_id), ("movimentos", user_id)})
+        # Meses que ainda não tinham cópia entram agora
+        materializar_recorrencias(user_id)
+    return criadas
+
+def _gravar_atualizar_movimento(cursor, id_mov, user_id, data, categoria, descricao, valor, fixo):
+    # A linha antiga diz de qual mês/categoria o lançamento sai (resumo e cache);
+    # FOR UPDATE segura a linha até o commit para o delta não contar duas vezes
+    cursor.execute("""
+        SELECT data, categoria, valor, pago FROM movimentos WHERE id=%s AND user_id=%s FOR UPDATE
+    """, (id_mov, user_id))
+    linha = cursor.fetchone()
+    if linha is None:
+        return set()
+    data_antiga, categoria_antiga, valor_antigo, pago = linha
+    # Garantimos que o usuário só edita o SEU próprio movimento (AND user_id = ...)
+    cursor.execute("""
+        UPDATE movimentos
+        SET data=%s, categoria=%s, descricao=%s, valor=%s, fixo=%s
+        WHERE id=%s AND user_id=%s
+    """, (data, categoria, descricao, valor, fixo, id_mov, user_id))
+    resumo.ajustar(cursor, user_id, data_antiga, categoria_antiga, valor_antigo, pago, sinal=-1)
+    resumo.ajustar(cursor, user_id, data, categoria, valor, pago)
+    return _tags_escrita(user_id, [data_antiga, data])
+
+@instrumentado
 def atualizar_movimento(id_mov, user_id, data, categoria, descricao, valor, fixo):
-    conn = get_connection()
-    if conn:
-        cursor = conn.cursor()
-        # Garantimos que o usuário só edita o SEU próprio movimento (AND user_id = ...)
-        cursor.execute("""
-            UPDATE movimentos 
-            SET data=%s, categoria=%s, descricao=%s, valor=%s, fixo=%s
-            WHERE id=%s AND user_id=%s
-        """, (data, categoria, descricao, valor, fixo, id_mov, user_id))
-        conn.commit()
-        conn.close()
+    _escrever("atualizar_movimento", user_id, id_mov, user_id, data, categoria, descricao, valor, fixo)
 
+def _gravar_mudar_status_pago(cursor, id_mov, user_id, novo_status):
+    cursor.execute("""
+        SELECT data, categoria, valor, pago FROM movimentos WHERE id=%s AND user_id=%s FOR UPDATE
+    """, (id_mov, user_id))
+    linha = cursor.fetchone()
+    if linha is None:
+        return set()
+    data, categoria, valor, pago = linha
+    if bool(pago) == bool(novo_status):
+        return set()
+    cursor.execute("UPDATE movimentos SET pago=%s WHERE id=%s AND user_id=%s", (novo_status, id_mov, user_id))
+    resumo.ajustar(cursor, user_id, data, categoria, valor, pago, sinal=-1)
+    resumo.ajustar(cursor, user_id, data, categoria, valor, novo_status)
+    return _tags_escrita(user_id, [data])
+
+@instrumentado
 def mudar_status_pago(id_mov, user_id, novo_status):
-    conn = get_connection()
-    if conn:
-        cursor = conn.cursor()
-        cursor.execute("UPDATE movimentos SET pago=%s WHERE id=%s AND user_id=%s", (novo_status, id_mov, user_id))
-        conn.commit()
-        conn.close()
+    _escrever("mudar_status_pago", user_id, id_mov, user_id, novo_status)
+
+def _gravar_excluir_movimento(cursor, id_mov, user_id):
+    cursor.execute("DELETE FROM movimentos WHERE id=%s AND user_id=%s RETURNING data, categoria, valor, pago",
+                   (id_mov, user_id))
+    linha = cursor.fetchone()
+    if linha is None:
+        return set()
+    resumo.ajustar(cursor, user_id, *linha, sinal=-1)
+    return _tags_escrita(user_id, [linha[0]])
 
+@instrumentado
 def excluir_movimento(id_mov, user_id):
-    conn = get_connection()
-    if conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM movimentos WHERE id=%s AND user_id=%s", (id_mov, user_id))
-        conn.commit()
-        conn.close()
+    _escrever("excluir_movimento", user_id, id_mov, user_id)
 
+@instrumentado
 def salvar_meta(user_id, categoria, valor):
-    conn = get_connection()
-    if conn:
-        cursor = conn.cursor()
-        # Agora a meta é única por Categoria E Usuário
-        cursor.execute("""
-            INSERT INTO metas (user_id, categoria, valor_limite) VALUES (%s, %s, %s)
-            ON CONFLICT (categoria, user_id) DO UPDATE SET valor_limite = EXCLUDED.valor_limite
-        """, (user_id, categoria, valor))
-        conn.commit()
-        conn.close()
+    _escrever("salvar_meta", user_id, user_id, categoria, valor)
+
+def _gravar_salvar_meta(cursor, user_id, categoria, valor):
+    # Agora a meta é única por Categoria E Usuário
+    cursor.execute("""
+        INSERT INTO metas (user_id, categoria, valor_limite) VALUES (%s, %s, %s)
+        ON CONFLICT (categoria, user_id) DO UPDATE SET valor_limite = EXCLUDED.valor_limite
+    """, (user_id, categoria, valor))
+    return {("metas", user_id)}
 
+@instrumentado
 def ler_metas(user_id):
-    conn = get_connection()
-    if conn:
-        df = pd.read_sql_query("SELECT * FROM metas WHERE user_id = %s", conn, params=(user_id,))
-        conn.close()
+    chave = ("ler_metas", user_id)
+    achou, df = _ler_cache(chave, user_id)
+    if achou:
         return df
-    return pd.DataFrame()
\ No newline at end of file
+    marca = cache.marca()
+    with conexao() as conn:
+        if conn:
+            df = pd.read_sql_query("SELECT * FROM metas WHERE user_id = %s", conn, params=(user_id,))
+            cache.guardar(chave, df, {("metas", user_id)}, marca)
+            return df
+    return pd.DataFrame()
+
+# --- DESPACHO DAS ESCRITAS AVULSAS (síncrono ou pela fila) ---
+
+_ESCRITAS = {
+    "adicionar_movimento": _gravar_adicionar_movimento,
+    "atualizar_movimento": _gravar_atualizar_movimento,
+    "mudar_status_pago": _gravar_mudar_status_pago,
+    "excluir_movimento": _gravar_excluir_movimento,
+    "salvar_meta": _gravar_salvar_meta,
+}
+
+def _aplicar_escrita(cursor, operacao, args):
+    return _ESCRITAS[operacao](cursor, *args)
+
+def _escrever(operacao, user_id, *args):
+    """Aplica a escrita agora, numa transação própria, ou só a enfileira se a fila estiver ligada."""
+    if fila_escrita.ativa():
+        fila_escrita.enfileirar(operacao, user_id, args)
+        return
+    tags = set()
+    with conexao() as conn:
+        if conn:
+            tags = _aplicar_escrita(conn.cursor(), operacao, args)
+    cache.invalidar(tags)
+
+fila_escrita.definir_aplicador(_aplicar_escrita)
@@ -1,13 +1,316 @@
+import threading
+import time
+from contextlib import contextmanager
+
 import streamlit as st
-import psycopg2
+from services import compartilhado
+from services.backends import backend_configurado
+
+# --- CONFIGURAÇÃO DO POOL (pode ser sobrescrita em [connections.postgresql] no secrets.toml) ---
+POOL_MIN = 1            # conexões mantidas abertas mesmo ociosas
+POOL_MAX = 10           # teto de conexões simultâneas por processo
+POOL_TIMEOUT = 10.0     # segundos esperando uma conexão livre antes de desistir
+POOL_OCIOSO_MAX = 300.0 # conexões acima do mínimo paradas há mais que isso são fechadas
+POOL_PING_APOS = 30.0   # conexões paradas há mais que isso recebem um SELECT 1 antes de sair
+POOL_TENTATIVAS = 3     # tentativas de connect() antes de desistir
+POOL_ESPERA_VAGA = 0.05 # sem vaga no orçamento entre processos, intervalo entre novas consultas
+
+
+def _config(chave, padrao):
+    try:
+        return type(padrao)(st.secrets["connections"]["postgresql"].get(chave, padrao))
+    except Exception:
+        return padrao
+
+
+# --- BACKEND (PostgreSQL/Supabase ou SQLite local, ver services/backends.py) ---
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = backend_configurado()
+    return _backend
+
+
+def dialeto():
+    """"postgresql" ou "sqlite", para os poucos lugares que precisam de SQL específico."""
+    return get_backend().nome
+
+
+def _conectar():
+    return get_backend().conectar()
+
 
 def get_connection():
-    """Estabelece conexão com o Supabase usando os secrets"""
+    """Estabelece conexão com o banco configurado (Supabase por padrão) usando os secrets"""
     try:
-        # Pega a URL do arquivo .streamlit/secrets.toml
-        url = st.secrets["connections"]["postgresql"]["url"]
-        conn = psycopg2.connect(url)
-        return conn
+        return _conectar()
     except Exception as e:
         st.error(f"Erro crítico de conexão: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+class PoolEsgotado(Exception):
+    """Nenhuma conexão ficou livre dentro do timeout do pool."""
+
+
+class PoolConexoes:
+    """Pool de conexões thread-safe compartilhado por todas as sessões do processo.
+
+    As conexões livres ficam numa pilha (a mais recente sai primeiro, então as
+    antigas envelhecem e são recolhidas pelo reaper de ociosas).
+
+    Com um `orcamento` (services/compartilhado.OrcamentoConexoes) cada conexão
+    nova também precisa de uma vaga no limite somado de todos os processos; sem
+    vaga, o checkout espera uma conexão livre daqui ou uma vaga de outro processo.
+    """
+
+    def __init__(self, fabrica, minimo=POOL_MIN, maximo=POOL_MAX, timeout=POOL_TIMEOUT,
+                 ocioso_max=POOL_OCIOSO_MAX, ping_apos=POOL_PING_APOS, tentativas=POOL_TENTATIVAS,
+                 orcamento=None):
+        self._fabrica = fabrica
+        self._orcamento = orcamento
+        self.minimo = minimo
+        self.maximo = max(maximo, 1)
+        self.timeout = timeout
+        self.ocioso_max = ocioso_max
+        self.ping_apos = ping_apos
+        self.tentativas = tentativas
+        self._livres = []  # [(conn, instante_devolucao)]
+        self._total = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,     # conexões entregues
+            "esperas": 0,       # checkouts que precisaram esperar o pool liberar
+            "tempo_espera": 0.0,
+            "conexoes": 0,      # connect() de verdade (handshake TLS)
+            "reaproveitadas": 0,
+            "descartadas": 0,   # falharam no health check ou quebraram em uso
+            "recolhidas": 0,    # fechadas por ociosidade
+            "sem_vaga": 0,      # conexões novas negadas pelo orçamento entre processos
+            "esgotamentos": 0,  # checkouts que desistiram no timeout (PoolEsgotado)
+        }
+
+    # --- API ---
+
+    def obter(self):
+        falhas = 0
+        while True:
+            conn, nova = self._reservar()
+            if nova:
+                try:
+                    conn = self._fabrica()
+                except Exception:
+                    self._liberar_vaga()
+                    falhas += 1
+                    if falhas >= self.tentativas:
+                        raise
+                    time.sleep(0.1 * falhas)
+                    continue
+                with self._cond:
+                    self._stats["conexoes"] += 1
+                    self._stats["checkouts"] += 1
+                return conn
+
+            conn, ocioso = conn
+            if self._saudavel(conn, ocioso):
+                with self._cond:
+                    self._stats["reaproveitadas"] += 1
+                    self._stats["checkouts"] += 1
+                return conn
+            self._fechar(conn)
+            with self._cond:
+                self._stats["descartadas"] += 1
+            self._liberar_vaga()
+
+    def devolver(self, conn, quebrada=False):
+        if quebrada or _fechada(conn):
+            self._fechar(conn)
+            with self._cond:
+                self._stats["descartadas"] += 1
+            self._liberar_vaga()
+            return
+        with self._cond:
+            self._livres.append((conn, time.monotonic()))
+            self._recolher_ociosas()
+            self._cond.notify()
+
+    def estatisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["abertas"] = self._total
+            stats["livres"] = len(self._livres)
+            stats["em_uso"] = self._total - len(self._livres)
+        return stats
+
+    def fechar(self):
+        with self._cond:
+            livres, self._livres = self._livres, []
+            self._total -= len(livres)
+            self._cond.notify_all()
+        for conn, _ in livres:
+            self._fechar(conn)
+        self._devolver_orcamento(len(livres))
+
+    # --- INTERNOS ---
+
+    def _reservar(self):
+        """Devolve ((conn, segundos_ociosa), False) ou (None, True) se couber abrir uma nova."""
+        limite = time.monotonic() + self.timeout
+        with self._cond:
+            esperou = False
+            inicio = time.monotonic()
+            try:
+                while True:
+                    self._recolher_ociosas()
+                    if self._livres:
+                        conn, desde = self._livres.pop()
+                        return (conn, time.monotonic() - desde), False
+                    sem_vaga = False
+                    if self._total < self.maximo:
+                        if self._orcamento is None or self._orcamento.reservar():
+                            self._total += 1
+                            return None, True
+                        sem_vaga = True
+                        self._stats["sem_vaga"] += 1
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._stats["esgotamentos"] += 1
+                        raise PoolEsgotado("Orçamento de conexões entre processos esgotado" if sem_vaga
+                                           else f"Pool esgotado ({self.maximo} conexões em uso)")
+                    if not esperou:
+                        esperou = True
+                        self._stats["esperas"] += 1
+                    # Vaga liberada por outro processo não acorda este: confere de novo em pouco tempo
+                    self._cond.wait(min(restante, POOL_ESPERA_VAGA) if sem_vaga else restante)
+            finally:
+                if esperou:
+                    self._stats["tempo_espera"] += time.monotonic() - inicio
+
+    def _liberar_vaga(self):
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+        self._devolver_orcamento()
+
+    def _devolver_orcamento(self, quantas=1):
+        if self._orcamento is not None:
+            for _ in range(quantas):
+                self._orcamento.liberar()
+
+    def _recolher_ociosas(self):
+        # Chamado com o lock. As mais antigas ficam no início da pilha.
+        agora = time.monotonic()
+        while (self._livres and self._total > self.minimo
+               and agora - self._livres[0][1] > self.ocioso_max):
+            conn, _ = self._livres.pop(0)
+            self._total -= 1
+            self._stats["recolhidas"] += 1
+            self._fechar(conn)
+            self._devolver_orcamento()
+
+    def _saudavel(self, conn, ocioso):
+        if _fechada(conn):
+            return False
+        if ocioso < self.ping_apos:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _fechar(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _fechada(conn):
+    # psycopg2 expõe .closed (0 = aberta); drivers sem o atributo são tratados como abertos
+    return bool(getattr(conn, "closed", 0))
+
+
+# --- POOL DO PROCESSO ---
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexoes(
+                    _conectar,
+                    minimo=_config("pool_min", POOL_MIN),
+                    maximo=_config("pool_max", POOL_MAX),
+                    timeout=_config("pool_timeout", POOL_TIMEOUT),
+                    ocioso_max=_config("pool_ocioso_max", POOL_OCIOSO_MAX),
+                    ping_apos=_config("pool_ping_apos", POOL_PING_APOS),
+                    orcamento=compartilhado.orcamento_conexoes(),
+                )
+    return _pool
+
+
+def fechar_pool(trocar_backend=False):
+    """Fecha as conexões livres e descarta o pool (o próximo uso cria outro).
+
+    Com `trocar_backend=True` a configuração do backend é relida (benchmarks e
+    scripts trocam FINANCAS_BACKEND em tempo de execução).
+    """
+    global _pool, _backend
+    with _pool_lock:
+        if _pool is not None:
+            _pool.fechar()
+            _pool = None
+        if trocar_backend:
+            _backend = None
+
+
+def estatisticas_pool():
+    stats = get_pool().estatisticas()
+    loja = compartilhado.get_loja()
+    if loja is not None:
+        stats["abertas_todos_processos"] = sum(loja.conexoes_abertas().values())
+    return stats
+
+
+@contextmanager
+def conexao():
+    """Empresta uma conexão do pool: commit no fim do bloco, rollback se der erro.
+
+    Entrega None (como o get_connection) quando não há banco, para as funções do
+    crud manterem o `if conn:`.
+    """
+    pool = get_pool()
+    try:
+        conn = pool.obter()
+    except Exception as e:
+        st.error(f"Erro crítico de conexão: {e}")
+        yield None
+        return
+
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        # Se nem o rollback funciona a conexão caiu: não volta para o pool
+        try:
+            conn.rollback()
+            quebrada = False
+        except Exception:
+            quebrada = True
+        pool.devolver(conn, quebrada)
+        raise
+    else:
+        pool.devolver(conn)
@@ -0,0 +1,192 @@
+import io
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from services import fila_escrita
+from services.database import conexao, dialeto
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet é opcional: sem o pyarrow só sai CSV
+    pa = pq = None
+
+# --- EXPORTAÇÃO (CSV / Parquet) ---
+# As linhas saem do banco em blocos de TAMANHO_BLOCO por um cursor do lado do
+# servidor (no Postgres um cursor com nome, que traz itersize linhas por vez em
+# vez do resultado inteiro; no SQLite o cursor já lê sob demanda). Cada bloco é
+# escrito no destino antes do próximo ser buscado: a memória fica proporcional
+# ao bloco, não ao histórico.
+#
+# O CSV usa data ISO e valor com ponto, mas não é um backup para importar de
+# volta: lançamentos digitados não têm hash de importação (voltariam todos
+# duplicados) e a importação não lê fixo/pago.
+# No Parquet cada bloco vira um row group comprimido com zstd, valor como
+# decimal(14, 2) e categoria/tipo como dicionário.
+
+USO = "uso: python -m services.exportacao USER_ID arquivo.csv|arquivo.parquet [ANO]"
+
+TAMANHO_BLOCO = 10_000
+FORMATOS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+COLUNAS_EXPORTACAO = ["data", "categoria", "descricao", "tipo", "valor", "fixo", "pago"]
+
+_CONSULTA = """
+    SELECT data, categoria, descricao, tipo, CAST(ROUND(valor * 100) AS BIGINT), fixo, pago
+    FROM movimentos WHERE user_id = %s {periodo}
+    ORDER BY data, id
+"""
+
+_SCHEMA_PARQUET = pa.schema([
+    ("data", pa.date32()),
+    ("categoria", pa.dictionary(pa.int32(), pa.string())),
+    ("descricao", pa.string()),
+    ("tipo", pa.dictionary(pa.int32(), pa.string())),
+    ("valor", pa.decimal128(14, 2)),
+    ("fixo", pa.bool_()),
+    ("pago", pa.bool_()),
+]) if pa is not None else None
+
+
+def formatos_disponiveis():
+    return [f for f in FORMATOS if f != "parquet" or pa is not None]
+
+
+def _cursor_servidor(conn, tamanho_bloco):
+    if dialeto() == "postgresql":
+        cursor = conn.cursor(name="exportacao_movimentos")
+        cursor.itersize = tamanho_bloco
+        return cursor
+    return conn.cursor()
+
+
+def _reais_texto(centavos):
+    """Centavos -> "1234.56" sem passar por float (o valor exportado é exato)."""
+    absoluto = np.abs(centavos)
+    sinal = np.where(centavos < 0, "-", "")
+    return sinal + (absoluto // 100).astype(str) + "." + (absoluto % 100).astype(str).str.zfill(2)
+
+
+def _bloco(linhas):
+    bruto = pd.DataFrame(linhas, columns=["data", "categoria", "descricao", "tipo", "centavos", "fixo", "pago"])
+    return pd.DataFrame({
+        "data": pd.to_datetime(bruto["data"], format="ISO8601"),
+        "categoria": bruto["categoria"],
+        "descricao": bruto["descricao"].fillna(""),
+        "tipo": bruto["tipo"],
+        "valor": _reais_texto(bruto["centavos"].astype("int64")),
+        # O SQLite devolve 0/1
+        "fixo": bruto["fixo"].fillna(False).astype(bool),
+        "pago": bruto["pago"].fillna(False).astype(bool),
+    })
+
+
+class _EscritorCSV:
+    def __init__(self, destino):
+        self._texto = io.TextIOWrapper(destino, encoding="utf-8", newline="")
+        self._cabecalho = True
+
+    def escrever(self, df):
+        df.to_csv(self._texto, index=False, header=self._cabecalho, date_format="%Y-%m-%d")
+        self._cabecalho = False
+
+    def fechar(self):
+        if self._cabecalho:
+            self._texto.write(",".join(COLUNAS_EXPORTACAO) + "\n")
+        self._texto.flush()
+        self._texto.detach()  # o destino continua aberto para quem o passou
+
+
+class _EscritorParquet:
+    def __init__(self, destino):
+        self._escritor = pq.ParquetWriter(destino, _SCHEMA_PARQUET, compression="zstd")
+
+    def escrever(self, df):
+        tabela = pa.table({
+            "data": pa.array(df["data"].dt.date, pa.date32()),
+            "categoria": pa.array(df["categoria"], pa.string()).dictionary_encode(),
+            "descricao": pa.array(df["descricao"], pa.string()),
+            "tipo": pa.array(df["tipo"], pa.string()).dictionary_encode(),
+            "valor": pa.array(df["valor"], pa.string()).cast(pa.decimal128(14, 2)),
+            "fixo": pa.array(df["fixo"], pa.bool_()),
+            "pago": pa.array(df["pago"], pa.bool_()),
+        })
+        self._escritor.write_table(tabela.cast(_SCHEMA_PARQUET))
+
+    def fechar(self):
+        self._escritor.close()
+
+
+def exportar_movimentos(user_id, destino, formato="csv", ano=None, tamanho_bloco=TAMANHO_BLOCO, progresso=None):
+    """Escreve os lançamentos do usuário (todos, ou só de `ano`) em `destino`, um arquivo binário aberto.
+
+    `progresso(linhas_escritas)` é chamado a cada bloco. Devolve as estatísticas
+    (linhas, bytes, segundos, linhas_por_segundo).
+    """
+    if formato not in formatos_disponiveis():
+        raise ValueError(f"Formato indisponível: {formato} (use {', '.join(formatos_disponiveis())})")
+    # As escritas ainda na fila também entram no arquivo
+    fila_escrita.aguardar(user_id)
+    query, params = _CONSULTA.format(periodo=""), [user_id]
+    if ano:
+        query = _CONSULTA.format(periodo="AND data >= %s AND data < %s")
+        params += [date(int(ano), 1, 1), date(int(ano) + 1, 1, 1)]
+
+    inicio = time.perf_counter()
+    posicao = destino.tell() if destino.seekable() else 0
+    stats = {"linhas": 0}
+    with conexao() as conn:
+        if not conn:
+            return None
+        escritor = _EscritorParquet(destino) if formato == "parquet" else _EscritorCSV(destino)
+        cursor = _cursor_servidor(conn, tamanho_bloco)
+        cursor.execute(query, params)
+        while True:
+            linhas = cursor.fetchmany(tamanho_bloco)
+            if not linhas:
+                break
+            escritor.escrever(_bloco(linhas))
+            stats["linhas"] += len(linhas)
+            if progresso:
+                progresso(stats["linhas"])
+        cursor.close()
+        escritor.fechar()
+
+    stats["segundos"] = time.perf_counter() - inicio
+    stats["bytes"] = destino.tell() - posicao if destino.seekable() else None
+    stats["linhas_por_segundo"] = stats["linhas"] / stats["segundos"] if stats["segundos"] else 0.0
+    return stats
+
+
+def arquivo_exportado(user_id, formato="csv", ano=None):
+    """Conteúdo do arquivo (bytes) para o st.download_button.
+
+    O Streamlit guarda o arquivo pronto em memória para servir o download: só a
+    leitura do banco fica limitada ao bloco. Para históricos enormes, a linha de
+    comando (_main) escreve direto no disco.
+    """
+    destino = io.BytesIO()
+    exportar_movimentos(user_id, destino, formato, ano)
+    return destino.getvalue()
+
+
+def _main(args):
+    if len(args) < 2:
+        print(USO)
+        return 1
+    user_id, caminho = int(args[0]), args[1]
+    formato = "parquet" if caminho.lower().endswith(".parquet") else "csv"
+    with open(caminho, "wb") as destino:
+        stats = exportar_movimentos(user_id, destino, formato, args[2] if len(args) > 2 else None,
+                                    progresso=lambda n: print(f"\r{n:,} linhas", end="", file=sys.stderr))
+    if stats is None:
+        return 1
+    print(f"\n{stats['linhas']:,} linhas, {stats['bytes'] / 1024:,.0f} KB em {stats['segundos']:.1f} s "
+          f"({stats['linhas_por_segundo']:,.0f} linhas/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,430 @@
+"""Fila de escrita em segundo plano (write-behind), opcional.
+
+Ligada com FINANCAS_ESCRITA_ASSINCRONA=1 ou no secrets.toml:
+
+    escrita_assincrona = true
+
+    [fila_escrita]
+    path = "fila_escrita.db"     # ou FINANCAS_FILA_PATH
+
+Com ela ligada, os lançamentos avulsos do crud (adicionar, editar, excluir,
+mudar o status de pago, salvar meta) só gravam o pedido num SQLite local e
+voltam na hora. Uma thread do processo aplica o que estiver na fila em uma
+transação só por lote (enquanto um lote vai ao banco os próximos pedidos se
+acumulam), invalida o cache e dá baixa nos pedidos.
+
+- Ler o que escreveu: as leituras do crud chamam `aguardar(user_id)` antes do
+  cache, então a rerun que vem depois do "Salvar" já enxerga a escrita.
+- Falhas transitórias (conexão caiu, pool esgotado, banco travado) devolvem o
+  lote inteiro à fila com espera crescente; os pedidos seguintes do mesmo
+  usuário esperam atrás, para a ordem não mudar. As outras falhas refazem o
+  lote pedido a pedido, para isolar o pedido ruim: ele sai da fila e fica
+  registrado para a tela avisar (`falhas`).
+- Durável: a fila sobrevive a um restart e é retomada na primeira escrita ou
+  leitura. A baixa acontece depois do commit no banco, então um crash entre os
+  dois reaplica aquele lote (pelo menos uma vez).
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+
+import numpy as np
+import streamlit as st
+
+from services.cache import cache
+from services.database import PoolEsgotado, conexao
+from services.instrumentacao import registrar
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: sem a trava entre processos
+    fcntl = None
+
+logger = logging.getLogger("financas.fila")
+
+# --- CONFIGURAÇÃO ---
+FILA_CAMINHO = "fila_escrita.db"
+FILA_LOTE_MAX = 200         # pedidos por transação
+FILA_TENTATIVAS = 6         # tentativas de um pedido com falha transitória
+FILA_ESPERA_BASE_S = 0.5    # espera antes da 1ª nova tentativa; dobra a cada falha
+FILA_ESPERA_MAX_S = 30.0
+FILA_AGUARDAR_MAX_S = 10.0  # quanto uma leitura espera as escritas do usuário
+FILA_LATENCIAS = 1000       # latências (enfileirar -> commit) guardadas para os percentis
+
+
+
+class SemConexao(Exception):
+    """O pool não entregou conexão (o `conexao()` já avisou na tela)."""
+
+
+def _transitoria(erro):
+    if isinstance(erro, (PoolEsgotado, SemConexao)):
+        return True
+    if isinstance(erro, sqlite3.OperationalError):
+        # Só banco ocupado/travado: "no such column" ou erro de sintaxe não passam com nova tentativa
+        codigo = getattr(erro, "sqlite_errorcode", None)
+        if codigo is not None:
+            return codigo & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+        return "locked" in str(erro) or "busy" in str(erro)
+    # O psycopg2 só é importado pelo backend Postgres; sem ele carregado não há erro dele
+    psycopg2 = sys.modules.get("psycopg2")
+    return psycopg2 is not None and isinstance(erro, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+
+def _json_padrao(valor):
+    # Datas vão como "AAAA-MM-DD", que os dois bancos aceitam numa coluna DATE
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()[:10]
+    if isinstance(valor, np.generic):
+        return valor.item()
+    raise TypeError(f"Argumento não serializável na fila: {valor!r}")
+
+
+class FilaEscrita:
+    """Fila durável (SQLite local) + thread que aplica os pedidos em lotes.
+
+    `aplicar(cursor, operacao, args)` faz a escrita com o cursor da transação do
+    lote e devolve as tags do cache a invalidar (ver crud._aplicar_escrita).
+    """
+
+    def __init__(self, caminho, aplicar, lote_max=FILA_LOTE_MAX, tentativas=FILA_TENTATIVAS,
+                 espera_base=FILA_ESPERA_BASE_S, espera_max=FILA_ESPERA_MAX_S):
+        self.caminho = caminho
+        self._aplicar = aplicar
+        self.lote_max = lote_max
+        self.tentativas = tentativas
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        # Dois processos na mesma fila aplicariam os mesmos pedidos duas vezes
+        self._trava = open(caminho + ".trava", "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._trava.close()
+                raise RuntimeError(f"A fila {caminho} já está em uso por outro processo: "
+                                   "cada processo precisa do seu FINANCAS_FILA_PATH") from None
+        self._db = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None, timeout=10.0)
+        # WAL + NORMAL: um pedido confirmado sobrevive à queda do processo
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS fila (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                operacao TEXT NOT NULL,
+                args TEXT NOT NULL,
+                criado_em REAL NOT NULL,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                proxima_em REAL NOT NULL DEFAULT 0,
+                estado TEXT NOT NULL DEFAULT 'pendente',
+                erro TEXT
+            )
+        """)
+        self._cond = threading.Condition()
+        self._pendentes = {}   # user_id -> pedidos ainda não aplicados
+        self._atrasados = set()  # usuários com pedido esperando nova tentativa
+        self._latencias = deque(maxlen=FILA_LATENCIAS)
+        self._stats = {"enfileirados": 0, "aplicados": 0, "lotes": 0, "maior_lote": 0,
+                       "retentativas": 0, "falhas": 0, "tempo_lotes": 0.0}
+        self._parar = False
+        # Pedidos que sobraram de uma execução anterior
+        for user_id, quantos in self._db.execute(
+                "SELECT user_id, COUNT(*) FROM fila WHERE estado = 'pendente' GROUP BY user_id"):
+            self._pendentes[user_id] = quantos
+        self._thread = threading.Thread(target=self._trabalhar, name="fila-escrita", daemon=True)
+        self._thread.start()
+
+    # --- API ---
+
+    def enfileirar(self, operacao, user_id, args):
+        corpo = json.dumps(list(args), default=_json_padrao)
+        with self._cond:
+            self._db.execute("INSERT INTO fila (user_id, operacao, args, criado_em) VALUES (?, ?, ?, ?)",
+                             (user_id, operacao, corpo, time.time()))
+            self._pendentes[user_id] = self._pendentes.get(user_id, 0) + 1
+            self._stats["enfileirados"] += 1
+            self._cond.notify_all()
+
+    def aguardar(self, user_id, timeout=FILA_AGUARDAR_MAX_S):
+        """Espera a fila aplicar os pedidos do usuário. False se não deu (timeout ou banco fora).
+
+        Com um pedido do usuário esperando nova tentativa não adianta esperar: a
+        leitura segue com o que está no banco.
+        """
+        limite = time.monotonic() + timeout
+        with self._cond:
+            while self._pendentes.get(user_id):
+                restante = limite - time.monotonic()
+                if user_id in self._atrasados or restante <= 0:
+                    return False
+                self._cond.wait(restante)
+        return True
+
+    def falhas(self, user_id):
+        with self._cond:
+            linhas = self._db.execute("""
+                SELECT id, operacao, args, erro, criado_em FROM fila
+                WHERE user_id = ? AND estado = 'falhou' ORDER BY id
+            """, (user_id,)).fetchall()
+        return [{"id": i, "operacao": op, "args": json.loads(a), "erro": erro,
+                 "criado_em": datetime.fromtimestamp(criado)} for i, op, a, erro, criado in linhas]
+
+    def descartar_falhas(self, user_id):
+        with self._cond:
+            self._db.execute("DELETE FROM fila WHERE user_id = ? AND estado = 'falhou'", (user_id,))
+
+    def estatisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["profundidade"] = sum(self._pendentes.values())
+            stats["usuarios_atrasados"] = len(self._atrasados)
+            stats["falhas_registradas"] = self._db.execute(
+                "SELECT COUNT(*) FROM fila WHERE estado = 'falhou'").fetchone()[0]
+            latencias = np.array(self._latencias) * 1000
+        if len(latencias):
+            stats["flush_p50_ms"] = float(np.percentile(latencias, 50))
+            stats["flush_p95_ms"] = float(np.percentile(latencias, 95))
+            stats["flush_max_ms"] = float(latencias.max())
+        return stats
+
+    def parar(self, timeout=5.0):
+        """Tenta esvaziar a fila por até `timeout` s e encerra a thread (o resto fica no arquivo)."""
+        limite = time.monotonic() + timeout
+        with self._cond:
+            if self._parar:
+                return
+            while sum(self._pendentes.values()) > len(self._atrasados) and time.monotonic() < limite:
+                self._cond.wait(limite - time.monotonic())
+            self._parar = True
+            self._cond.notify_all()
+        self._thread.join(timeout=max(limite - time.monotonic(), 0.1))
+        self._db.close()
+        self._trava.close()
+
+    # --- THREAD ---
+
+    def _trabalhar(self):
+        while True:
+            with self._cond:
+                if self._parar:
+                    return
+                lote, proxima = self._proximo_lote()
+                if not lote:
+                    espera = None if proxima is None else max(proxima - time.time(), 0.01)
+                    self._cond.wait(espera)
+                    continue
+            try:
+                self._processar(lote)
+            except Exception:  # a thread não pode morrer; o pedido continua na fila
+                logger.exception("Erro inesperado na fila de escrita")
+                time.sleep(self.espera_base)
+
+    def _proximo_lote(self):
+        """(pedidos prontos em ordem, instante da próxima nova tentativa). Chamado com o lock.
+
+        Um usuário com pedido em espera fica de fora por inteiro, para os pedidos
+        dele não passarem na frente um do outro.
+        """
+        agora = time.time()
+        # Os usuários em espera saem antes do LIMIT: pedidos deles no começo da fila
+        # não seguram os prontos que vêm atrás
+        lote = self._db.execute("""
+            SELECT id, user_id, operacao, args, criado_em, tentativas, proxima_em FROM fila
+            WHERE estado = 'pendente' AND user_id NOT IN (
+                SELECT user_id FROM fila WHERE estado = 'pendente' AND proxima_em > ?
+            )
+            ORDER BY id LIMIT ?
+        """, (agora, self.lote_max)).fetchall()
+        proxima = self._db.execute("SELECT MIN(proxima_em) FROM fila WHERE estado = 'pendente' AND proxima_em > ?",
+                                   (agora,)).fetchone()[0]
+        return lote, proxima
+
+    def _transacao(self, lote):
+        tags = set()
+        with conexao() as conn:
+            if not conn:
+                raise SemConexao("sem conexão com o banco")
+            cursor = conn.cursor()
+            for _, _, operacao, args, *_ in lote:
+                tags |= self._aplicar(cursor, operacao, json.loads(args))
+        return tags
+
+    def _processar(self, lote):
+        inicio = time.perf_counter()
+        try:
+            tags = self._transacao(lote)
+        except Exception as erro:
+            if len(lote) == 1 or _transitoria(erro):
+                # Banco fora ou pool esgotado: refazer um a um só somaria uma espera por pedido
+                self._falhou(lote, erro)
+                return
+            # Um pedido ruim não derruba o lote: refaz um a um para achar qual foi
+            travados = set()
+            for i, pedido in enumerate(lote):
+                if pedido[1] in travados:
+                    continue
+                inicio = time.perf_counter()
+                try:
+                    tags = self._transacao([pedido])
+                except Exception as erro_pedido:
+                    if _transitoria(erro_pedido):
+                        # O banco caiu no meio: o que falta volta junto, com uma espera só
+                        self._falhou([p for p in lote[i:] if p[1] not in travados], erro_pedido)
+                        return
+                    self._falhou([pedido], erro_pedido)
+                    travados.add(pedido[1])
+                    continue
+                self._concluir([pedido], tags, time.perf_counter() - inicio)
+            return
+        self._concluir(lote, tags, time.perf_counter() - inicio)
+
+    def _concluir(self, lote, tags, segundos):
+        # O cache é invalidado antes de liberar quem está em `aguardar`
+        cache.invalidar(tags)
+        agora = time.time()
+        with self._cond:
+            ids = [pedido[0] for pedido in lote]
+            self._db.execute(f"DELETE FROM fila WHERE id IN ({', '.join('?' * len(ids))})", ids)
+            for pedido in lote:
+                user_id = pedido[1]
+                self._pendentes[user_id] -= 1
+                if not self._pendentes[user_id]:
+                    del self._pendentes[user_id]
+                self._atrasados.discard(user_id)
+                self._latencias.append(agora - pedido[4])
+            self._stats["aplicados"] += len(lote)
+            self._stats["lotes"] += 1
+            self._stats["maior_lote"] = max(self._stats["maior_lote"], len(lote))
+            self._stats["tempo_lotes"] += segundos
+            self._cond.notify_all()
+        registrar("fila.lote", segundos, "fila", linhas=len(lote))
+
+    def _falhou(self, pedidos, erro):
+        """Agenda nova tentativa dos pedidos (falha transitória, espera crescente) ou registra a falha de vez."""
+        transitoria = _transitoria(erro)
+        agora = time.time()
+        adiados = definitivos = 0
+        with self._cond:
+            self._db.execute("BEGIN")
+            for id_pedido, user_id, _, _, _, tentativas, _ in pedidos:
+                if transitoria and tentativas + 1 < self.tentativas:
+                    espera = min(self.espera_base * 2 ** tentativas, self.espera_max)
+                    self._db.execute("UPDATE fila SET tentativas = ?, proxima_em = ?, erro = ? WHERE id = ?",
+                                     (tentativas + 1, agora + espera, str(erro), id_pedido))
+                    self._atrasados.add(user_id)
+                    adiados += 1
+                else:
+                    self._db.execute("UPDATE fila SET estado = 'falhou', tentativas = ?, erro = ? WHERE id = ?",
+                                     (tentativas + 1, str(erro), id_pedido))
+                    self._pendentes[user_id] -= 1
+                    if not self._pendentes[user_id]:
+                        del self._pendentes[user_id]
+                    self._atrasados.discard(user_id)
+                    definitivos += 1
+            self._db.execute("COMMIT")
+            self._stats["retentativas"] += adiados
+            self._stats["falhas"] += definitivos
+            self._cond.notify_all()
+        operacoes = ", ".join(sorted({pedido[2] for pedido in pedidos}))
+        logger.warning("Escrita %s (%d pedido(s)) falhou: %s (%d com nova tentativa agendada, %d registrados como falha)",
+                       operacoes, len(pedidos), erro, adiados, definitivos)
+
+
+# --- FILA DO PROCESSO ---
+
+_fila = None
+_ativa = None
+_aplicador = None
+_lock = threading.Lock()
+
+
+def _configurada():
+    if os.environ.get("FINANCAS_ESCRITA_ASSINCRONA", "") not in ("", "0"):
+        return True
+    try:
+        return bool(st.secrets.get("escrita_assincrona", False))
+    except Exception:
+        return False
+
+
+def _caminho_configurado():
+    if os.environ.get("FINANCAS_FILA_PATH"):
+        return os.environ["FINANCAS_FILA_PATH"]
+    try:
+        return st.secrets["fila_escrita"]["path"]
+    except Exception:
+        return FILA_CAMINHO
+
+
+def definir_aplicador(funcao):
+    """O crud registra aqui a função que sabe aplicar cada operação."""
+    global _aplicador
+    _aplicador = funcao
+
+
+def ativa():
+    global _ativa
+    if _ativa is None:
+        _ativa = _configurada()
+    return _ativa
+
+
+def get_fila():
+    global _fila
+    if _fila is None:
+        with _lock:
+            if _fila is None:
+                _fila = FilaEscrita(_caminho_configurado(), _aplicador)
+                atexit.register(_fila.parar)
+    return _fila
+
+
+def ligar(caminho=None):
+    """Liga a fila em tempo de execução (benchmarks e scripts)."""
+    global _ativa
+    if caminho:
+        os.environ["FINANCAS_FILA_PATH"] = caminho
+    _ativa = True
+    return get_fila()
+
+
+def desligar(timeout=5.0):
+    """Esvazia e encerra a fila; as escritas voltam a ser síncronas."""
+    global _fila, _ativa
+    with _lock:
+        fila, _fila = _fila, None
+        _ativa = False
+    if fila is not None:
+        fila.parar(timeout)
+
+
+def enfileirar(operacao, user_id, args):
+    get_fila().enfileirar(operacao, user_id, args)
+
+
+def aguardar(user_id, timeout=FILA_AGUARDAR_MAX_S):
+    """Ler o que escreveu: no-op com a fila desligada."""
+    if not ativa():
+        return True
+    return get_fila().aguardar(user_id, timeout)
+
+
+def falhas(user_id):
+    return get_fila().falhas(user_id) if ativa() else []
+
+
+def descartar_falhas(user_id):
+    if ativa():
+        get_fila().descartar_falhas(user_id)
+
+
+def estatisticas_fila():
+    return get_fila().estatisticas() if ativa() else {"ativa": False}
@@ -0,0 +1,231 @@
+import csv
+import io
+import re
+import time
+import unicodedata
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from services.crud import copiar_movimentos
+
+# --- IMPORTAÇÃO DE EXTRATOS (CSV / OFX) ---
+# Os arquivos são lidos em blocos de TAMANHO_BLOCO linhas: cada bloco vira um
+# DataFrame normalizado nas colunas de movimentos e é gravado com COPY numa
+# transação própria. Memória fica proporcional ao bloco, não ao arquivo.
+
+TAMANHO_BLOCO = 5000
+CATEGORIA_PADRAO = "Outros"
+
+# Formatos de data aceitos no CSV, tentados em ordem em cada valor. Os separadores
+# diferentes (- e /) impedem que um valor case com os dois: um ";" no cabeçalho
+# não diz nada sobre as datas
+FORMATOS_DATA = ["%Y-%m-%d", "%d/%m/%Y"]
+
+# Nomes de coluna aceitos nos CSVs dos bancos (comparados sem acento e em minúsculas)
+ALIASES_CSV = {
+    "data": ["data", "date", "data lancamento", "data do lancamento", "data movimento", "dt"],
+    "descricao": ["descricao", "historico", "lancamento", "memo", "description", "detalhes"],
+    "valor": ["valor", "valor (r$)", "amount", "quantia", "valor r$"],
+    "categoria": ["categoria", "category"],
+}
+
+
+def _normalizar_nome(nome):
+    sem_acento = unicodedata.normalize("NFKD", str(nome)).encode("ascii", "ignore").decode()
+    return sem_acento.strip().lower()
+
+
+@contextmanager
+def _abrir_texto(arquivo):
+    """Embrulha um arquivo binário (ex.: st.file_uploader) ou caminho como texto, detectando UTF-8 ou Latin-1.
+
+    Devolve (texto, binário, tamanho em bytes). Um caminho é aberto e fechado
+    aqui; um arquivo recebido continua aberto para quem o passou.
+    """
+    caminho = isinstance(arquivo, (str, bytes)) or hasattr(arquivo, "__fspath__")
+    binario = open(arquivo, "rb") if caminho else arquivo
+    texto = None
+    try:
+        tamanho = binario.seek(0, io.SEEK_END)
+        binario.seek(0)
+        inicio = binario.read(64 * 1024)
+        binario.seek(0)
+        try:
+            inicio.decode("utf-8")
+            encoding = "utf-8-sig"
+        except UnicodeDecodeError:
+            encoding = "latin-1"
+        texto = io.TextIOWrapper(binario, encoding=encoding, newline="")
+        yield texto, binario, tamanho
+    finally:
+        if texto is not None:
+            texto.detach()
+        if caminho:
+            binario.close()
+
+
+# --- CSV ---
+
+def ler_csv_em_blocos(texto, tamanho_bloco=TAMANHO_BLOCO):
+    """Gera DataFrames com data, descricao, valor, categoria e id_externo.
+
+    Detecta o formato brasileiro (`;` como separador e vírgula decimal) pela
+    primeira linha; as datas são reconhecidas valor a valor (FORMATOS_DATA).
+    `id_externo` fica vazio: o CSV não tem identificador.
+    """
+    cabecalho = texto.readline()
+    brasileiro = cabecalho.count(";") > cabecalho.count(",")
+    sep = ";" if brasileiro else ","
+    nomes = [_normalizar_nome(c) for c in next(csv.reader([cabecalho], delimiter=sep))]
+
+    colunas = {}
+    for destino, aliases in ALIASES_CSV.items():
+        for i, nome in enumerate(nomes):
+            if nome in aliases:
+                colunas[destino] = i
+                break
+    faltando = {"data", "descricao", "valor"} - colunas.keys()
+    if faltando:
+        raise ValueError(f"CSV sem as colunas: {', '.join(sorted(faltando))}")
+
+    leitor = pd.read_csv(texto, sep=sep, header=None, dtype=str, chunksize=tamanho_bloco,
+                         keep_default_na=False, skip_blank_lines=True)
+    for bloco in leitor:
+        valor = bloco[colunas["valor"]].str.replace("R$", "", regex=False).str.strip()
+        if brasileiro:
+            valor = valor.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+        df = pd.DataFrame({
+            "data": _datas(bloco[colunas["data"]]),
+            "descricao": bloco[colunas["descricao"]].str.strip(),
+            "valor": pd.to_numeric(valor, errors="coerce"),
+            "categoria": bloco[colunas["categoria"]].str.strip() if "categoria" in colunas else CATEGORIA_PADRAO,
+            "id_externo": "",
+        })
+        yield df
+
+
+def _datas(valores):
+    """Datas de um bloco: cada valor no primeiro formato de FORMATOS_DATA que o aceita (NaT se nenhum)."""
+    valores = valores.str.strip()
+    datas = pd.Series(pd.NaT, index=valores.index, dtype="datetime64[us]")
+    for formato in FORMATOS_DATA:
+        datas = datas.fillna(pd.to_datetime(valores, format=formato, errors="coerce"))
+    return datas
+
+
+# --- OFX ---
+
+_TAG_OFX = re.compile(r"<(/?)([A-Z0-9.]+)>([^<]*)")
+
+
+def _transacoes_ofx(texto):
+    """Percorre o OFX linha a linha (SGML v1 ou XML v2) gerando um dict por <STMTTRN>."""
+    atual = None
+    for linha in texto:
+        for fecha, tag, valor in _TAG_OFX.findall(linha):
+            if tag == "STMTTRN":
+                if fecha:
+                    if atual is not None:
+                        yield atual
+                    atual = None
+                else:
+                    atual = {}
+            elif atual is not None and not fecha:
+                atual[tag] = valor.strip()
+
+
+def ler_ofx_em_blocos(texto, tamanho_bloco=TAMANHO_BLOCO):
+    bloco = []
+    for trn in _transacoes_ofx(texto):
+        bloco.append(trn)
+        if len(bloco) >= tamanho_bloco:
+            yield _bloco_ofx(bloco)
+            bloco = []
+    if bloco:
+        yield _bloco_ofx(bloco)
+
+
+def _bloco_ofx(transacoes):
+    bruto = pd.DataFrame(transacoes).reindex(columns=["DTPOSTED", "TRNAMT", "MEMO", "NAME", "FITID"])
+    descricao = bruto["MEMO"].where(bruto["MEMO"].fillna("") != "", bruto["NAME"])
+    return pd.DataFrame({
+        # DTPOSTED vem como AAAAMMDD[hhmmss[.xxx]][fuso]
+        "data": pd.to_datetime(bruto["DTPOSTED"].str[:8], format="%Y%m%d", errors="coerce"),
+        "descricao": descricao.fillna("").str.strip(),
+        "valor": pd.to_numeric(bruto["TRNAMT"].str.replace(",", ".", regex=False), errors="coerce"),
+        "categoria": CATEGORIA_PADRAO,
+        "id_externo": bruto["FITID"].fillna(""),
+    })
+
+
+# --- NORMALIZAÇÃO E DEDUPLICAÇÃO ---
+
+def hash_linhas(df, ocorrencias):
+    """Hash de 64 bits (vetorizado) que identifica a transação para deduplicar reimportações.
+
+    Sem id externo (CSV), a n-ésima repetição de (data, valor, descrição) dentro do
+    arquivo entra no hash: dois cafés iguais no mesmo dia continuam sendo dois, mas
+    importar o mesmo arquivo de novo não duplica nada. `ocorrencias` guarda essa
+    contagem entre blocos.
+    """
+    centavos = (df["valor"] * 100).round().astype("int64")
+    chave = pd.DataFrame({"data": df["data"].dt.strftime("%Y-%m-%d"), "centavos": centavos,
+                          "descricao": df["descricao"].astype(str)})
+    base = pd.util.hash_pandas_object(chave, index=False)
+    vistas = base.map(ocorrencias).fillna(0).astype("int64")
+    n = base.groupby(base).cumcount() + vistas
+    for h, qtd in base.value_counts().items():
+        ocorrencias[h] = ocorrencias.get(h, 0) + qtd
+
+    identificador = df["id_externo"].astype(str).where(df["id_externo"] != "", "#" + n.astype(str))
+    chave["id"] = identificador.values
+    return pd.util.hash_pandas_object(chave, index=False).astype(np.int64)
+
+
+def normalizar_bloco(df, ocorrencias):
+    """Descarta linhas sem data/valor e monta as colunas que copiar_movimentos espera."""
+    df = df.dropna(subset=["data", "valor"])
+    df = df[df["valor"] != 0]
+    return pd.DataFrame({
+        "data": df["data"].dt.date,
+        "categoria": df["categoria"],
+        "descricao": df["descricao"],
+        "tipo": np.where(df["valor"] > 0, "Receita", "Despesa"),
+        "valor": df["valor"].round(2),
+        "fixo": False,
+        "pago": True,
+        "hash_importacao": hash_linhas(df, ocorrencias),
+    })
+
+
+def importar_extrato(user_id, arquivo, nome_arquivo, tamanho_bloco=TAMANHO_BLOCO, progresso=None):
+    """Importa um extrato CSV ou OFX em blocos e devolve as estatísticas da carga.
+
+    `arquivo` é um caminho ou um arquivo binário aberto. `progresso(linhas_lidas,
+    fracao)` é chamado a cada bloco, com `fracao` a parte do arquivo já lida (0 a
+    1, ex.: para um st.progress).
+    """
+    inicio = time.perf_counter()
+    stats = {"lidas": 0, "validas": 0, "inseridas": 0}
+    ocorrencias = {}
+    with _abrir_texto(arquivo) as (texto, binario, tamanho):
+        if nome_arquivo.lower().endswith(".ofx"):
+            blocos = ler_ofx_em_blocos(texto, tamanho_bloco)
+        else:
+            blocos = ler_csv_em_blocos(texto, tamanho_bloco)
+        for bloco in blocos:
+            stats["lidas"] += len(bloco)
+            normalizado = normalizar_bloco(bloco, ocorrencias)
+            stats["validas"] += len(normalizado)
+            if not normalizado.empty:
+                stats["inseridas"] += copiar_movimentos(user_id, normalizado)
+            if progresso:
+                # Posição do binário: o que o leitor já consumiu (com o buffer de leitura adiantado)
+                progresso(stats["lidas"], min(binario.tell() / tamanho, 1.0) if tamanho else 1.0)
+
+    stats["segundos"] = time.perf_counter() - inicio
+    stats["duplicadas"] = stats["validas"] - stats["inseridas"]
+    stats["invalidas"] = stats["lidas"] - stats["validas"]
+    stats["linhas_por_segundo"] = stats["lidas"] / stats["segundos"] if stats["segundos"] else 0.0
+    return stats
@@ -0,0 +1,190 @@
+"""Cronometragem do caminho quente: chamadas do crud e etapas nomeadas das telas.
+
+Cada medida entra na rerun atual da sessão do Streamlit (ou da sessão "headless"
+fora dele) e nos totais acumulados da sessão. No fim da rerun sai uma linha de
+log JSON no logger "financas.metricas"; o painel de debug e `exportar_metricas`
+leem os mesmos dados.
+"""
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from services.cache import tamanho_estimado
+
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:  # pragma: no cover - versões antigas do Streamlit
+    get_script_run_ctx = None
+
+logger = logging.getLogger("financas.metricas")
+
+SESSAO_EXPIRA_S = 3600      # sessões sem rerun há mais que isso somem dos totais
+MAX_MEDIDAS_RERUN = 500     # fora do Streamlit (benchmarks, scripts) a "rerun" nunca fecha
+
+_lock = threading.Lock()
+_sessoes = {}
+_local = threading.local()  # profundidade das chamadas do crud (clonar_fixos chama outras)
+
+
+def _id_sessao():
+    if get_script_run_ctx is None:
+        return "headless"
+    try:
+        ctx = get_script_run_ctx(suppress_warning=True)
+        return ctx.session_id if ctx else "headless"
+    except Exception:
+        return "headless"
+
+
+def _sessao(sid):
+    # Chamado com o lock
+    sessao = _sessoes.get(sid)
+    if sessao is None:
+        sessao = _sessoes[sid] = {"reruns": 0, "inicio_rerun": time.perf_counter(), "rerun": [],
+                                  "totais": {}, "ultima_rerun": None, "visto_em": time.time()}
+    return sessao
+
+
+def registrar(nome, segundos, tipo="etapa", linhas=None, bytes_=None, aninhada=False):
+    medida = {"nome": nome, "tipo": tipo, "ms": segundos * 1000, "linhas": linhas, "bytes": bytes_,
+              "aninhada": aninhada}
+    with _lock:
+        sessao = _sessao(_id_sessao())
+        sessao["rerun"].append(medida)
+        if len(sessao["rerun"]) > MAX_MEDIDAS_RERUN:
+            del sessao["rerun"][0]
+        total = sessao["totais"].setdefault(nome, {"tipo": tipo, "chamadas": 0, "ms": 0.0, "max_ms": 0.0,
+                                                   "linhas": 0, "bytes": 0})
+        total["chamadas"] += 1
+        total["ms"] += medida["ms"]
+        total["max_ms"] = max(total["max_ms"], medida["ms"])
+        total["linhas"] += linhas or 0
+        total["bytes"] += bytes_ or 0
+
+
+def _contar(resultado):
+    """(linhas, bytes) de um resultado do crud: DataFrames e listas contam linhas; o resto é 1 registro."""
+    if resultado is None or isinstance(resultado, (bool, int, float)):
+        return None, None
+    if isinstance(resultado, (pd.DataFrame, list)):
+        return len(resultado), tamanho_estimado(resultado)
+    return 1, tamanho_estimado(resultado)
+
+
+def instrumentado(funcao):
+    """Decorator das funções do crud: tempo, linhas e bytes (estimados em memória) devolvidos."""
+    nome = f"crud.{funcao.__name__}"
+
+    @functools.wraps(funcao)
+    def envolvida(*args, **kwargs):
+        aninhada = getattr(_local, "profundidade", 0) > 0
+        _local.profundidade = getattr(_local, "profundidade", 0) + 1
+        inicio = time.perf_counter()
+        try:
+            resultado = funcao(*args, **kwargs)
+        except BaseException:
+            registrar(nome + " (erro)", time.perf_counter() - inicio, "db", aninhada=aninhada)
+            raise
+        finally:
+            _local.profundidade -= 1
+        linhas, tamanho = _contar(resultado)
+        registrar(nome, time.perf_counter() - inicio, "db", linhas, tamanho, aninhada)
+        return resultado
+
+    return envolvida
+
+
+@contextmanager
+def etapa(nome):
+    """Cronometra um trecho de tela: `with etapa("dashboard.grafico"): ...`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(nome, time.perf_counter() - inicio)
+
+
+# --- CICLO DA RERUN ---
+
+def inicio_rerun():
+    agora = time.time()
+    with _lock:
+        for sid in [s for s, dados in _sessoes.items() if agora - dados["visto_em"] > SESSAO_EXPIRA_S]:
+            del _sessoes[sid]
+        sessao = _sessao(_id_sessao())
+        sessao["rerun"] = []
+        sessao["inicio_rerun"] = time.perf_counter()
+        sessao["visto_em"] = agora
+
+
+def fim_rerun(**contexto):
+    """Fecha a rerun atual, guarda o resumo e emite a linha de log estruturada."""
+    sid = _id_sessao()
+    with _lock:
+        sessao = _sessao(sid)
+        sessao["reruns"] += 1
+        medidas = list(sessao["rerun"])
+        # Chamadas aninhadas já estão dentro do tempo da chamada de fora
+        externas = [m for m in medidas if m["tipo"] == "db" and not m["aninhada"]]
+        resumo = {
+            "evento": "rerun",
+            "sessao": sid,
+            **contexto,
+            "total_ms": round((time.perf_counter() - sessao["inicio_rerun"]) * 1000, 2),
+            "db_chamadas": len(externas),
+            "db_ms": round(sum(m["ms"] for m in externas), 2),
+            "linhas": sum(m["linhas"] or 0 for m in externas),
+            "bytes": sum(m["bytes"] or 0 for m in externas),
+            "etapas": {m["nome"]: round(m["ms"], 2) for m in medidas if m["tipo"] == "etapa"},
+        }
+        sessao["ultima_rerun"] = {"resumo": resumo, "medidas": medidas}
+    logger.info(json.dumps(resumo, ensure_ascii=False))
+    return resumo
+
+
+# --- LEITURA / EXPORTAÇÃO ---
+
+def metricas_sessao(sid=None):
+    """Medidas da rerun em andamento, resumo da última fechada e totais da sessão."""
+    with _lock:
+        sessao = _sessao(sid or _id_sessao())
+        return {
+            "reruns": sessao["reruns"],
+            "rerun_atual": list(sessao["rerun"]),
+            "ultima_rerun": sessao["ultima_rerun"],
+            "totais": {nome: dict(t) for nome, t in sessao["totais"].items()},
+        }
+
+
+def exportar_metricas():
+    """Totais de todas as sessões somados por nome (para um exportador/dashboard externo)."""
+    with _lock:
+        agregados = {}
+        for sessao in _sessoes.values():
+            for nome, t in sessao["totais"].items():
+                a = agregados.setdefault(nome, {"tipo": t["tipo"], "chamadas": 0, "ms": 0.0, "max_ms": 0.0,
+                                                "linhas": 0, "bytes": 0})
+                a["chamadas"] += t["chamadas"]
+                a["ms"] += t["ms"]
+                a["max_ms"] = max(a["max_ms"], t["max_ms"])
+                a["linhas"] += t["linhas"]
+                a["bytes"] += t["bytes"]
+        return {"sessoes": len(_sessoes), "operacoes": agregados}
+
+
+def metricas_prometheus():
+    """Os mesmos totais no formato texto do Prometheus."""
+    linhas = []
+    for nome, a in sorted(exportar_metricas()["operacoes"].items()):
+        rotulo = f'{{operacao="{nome}",tipo="{a["tipo"]}"}}'
+        linhas.append(f"financas_chamadas_total{rotulo} {a['chamadas']}")
+        linhas.append(f"financas_duracao_ms_total{rotulo} {a['ms']:.3f}")
+        linhas.append(f"financas_duracao_ms_max{rotulo} {a['max_ms']:.3f}")
+        linhas.append(f"financas_linhas_total{rotulo} {a['linhas']}")
+        linhas.append(f"financas_bytes_total{rotulo} {a['bytes']}")
+    return "\n".join(linhas) + "\n"
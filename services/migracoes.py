@@ -0,0 +1,499 @@
+"""Migrações versionadas do schema multi-usuário.
+
+Uso (a partir da pasta do projeto, com o .streamlit/secrets.toml configurado):
+
+    python -m services.migracoes aplicar        # aplica o que falta
+    python -m services.migracoes status         # lista versões aplicadas/pendentes
+    python -m services.migracoes planos 1       # EXPLAIN das consultas do crud para o user_id 1
+    python -m services.migracoes particionar    # opcional: movimentos particionada por mês
+    python -m services.migracoes particoes      # cria as partições dos próximos meses (ver abaixo)
+
+Com movimentos particionada, as partições mensais precisam ser criadas antes de
+os meses chegarem: o `aplicar` já faz isso, e o `particoes` deve rodar pelo
+menos uma vez por mês (cron/agendador) em instalações que ficam muito tempo sem
+deploy. O que cair num mês sem partição vai para movimentos_padrao e é movido
+para a partição certa quando ela for criada.
+"""
+import json
+import re
+import sys
+from datetime import date
+
+from services import busca
+from services.database import conexao, dialeto
+from services.resumo import preencher as preencher_resumo
+
+# Cada migração roda na sua própria transação e fica registrada em schema_migracoes.
+# Tudo usa IF NOT EXISTS para poder ser aplicado sobre um banco que já existia
+# (as tabelas do Supabase foram criadas à mão antes deste módulo).
+# Os comandos ficam por dialeto; um comando pode ser uma função que recebe o cursor.
+
+def _adotar_sqlite_legado(cursor):
+    """O financas.db antigo tem movimentos/metas de um usuário só (sem user_id): renomeia para *_legado."""
+    for tabela in ("movimentos", "metas"):
+        cursor.execute(f"PRAGMA table_info({tabela})")
+        colunas = [linha[1] for linha in cursor.fetchall()]
+        if colunas and "user_id" not in colunas:
+            cursor.execute(f"ALTER TABLE {tabela} RENAME TO {tabela}_legado")
+
+
+_INDICES = [
+    # Toda leitura filtra user_id e um intervalo de data; os UPDATE/DELETE usam id (PK)
+    "CREATE INDEX IF NOT EXISTS movimentos_user_data_idx ON movimentos (user_id, data)",
+    # O ON CONFLICT (categoria, user_id) do salvar_meta precisa deste índice único
+    "CREATE UNIQUE INDEX IF NOT EXISTS metas_categoria_user_idx ON metas (categoria, user_id)",
+]
+
+# Mesmo índice único com user_id primeiro, que também atende o ler_metas
+# (o ON CONFLICT casa pelo conjunto de colunas, a ordem não importa)
+_INDICES_METAS = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS metas_user_categoria_idx ON metas (user_id, categoria)",
+    "DROP INDEX IF EXISTS metas_categoria_user_idx",
+]
+
+_INDICE_HASH = """
+    CREATE UNIQUE INDEX IF NOT EXISTS movimentos_user_hash_idx
+        ON movimentos (user_id, hash_importacao) WHERE hash_importacao IS NOT NULL
+"""
+
+# Mantida pelo crud a cada escrita (ver services/resumo.py); a PK atende todas as leituras
+_TABELA_RESUMO = """
+    CREATE TABLE IF NOT EXISTS resumo_mensal (
+        user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+        mes CHAR(7) NOT NULL,
+        categoria TEXT NOT NULL,
+        receitas_centavos BIGINT NOT NULL DEFAULT 0,
+        despesas_centavos BIGINT NOT NULL DEFAULT 0,
+        pendente_centavos BIGINT NOT NULL DEFAULT 0,
+        qtd INTEGER NOT NULL DEFAULT 0,
+        qtd_pendentes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, mes, categoria)
+    )
+"""
+
+# materializado_ate: uma data do último mês já gravado em movimentos (ver crud.materializar_recorrencias)
+_TABELA_RECORRENCIAS = """
+    CREATE TABLE IF NOT EXISTS recorrencias (
+        id {id},
+        user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+        categoria TEXT NOT NULL,
+        descricao TEXT,
+        tipo TEXT NOT NULL,
+        valor NUMERIC(12, 2) NOT NULL,
+        frequencia TEXT NOT NULL DEFAULT 'mensal' CHECK (frequencia IN ('mensal', 'anual')),
+        intervalo INTEGER NOT NULL DEFAULT 1 CHECK (intervalo >= 1),
+        inicio DATE NOT NULL,
+        fim DATE,
+        materializado_ate DATE
+    )
+"""
+
+# Uma ocorrência por regra e data: materializar de novo não duplica
+_INDICE_RECORRENCIA = """
+    CREATE UNIQUE INDEX IF NOT EXISTS movimentos_recorrencia_data_idx
+        ON movimentos (recorrencia_id, data) WHERE recorrencia_id IS NOT NULL
+"""
+
+# O login busca lower(email): o UNIQUE de email não atende a expressão
+_INDICE_EMAIL = "CREATE INDEX IF NOT EXISTS usuarios_email_lower_idx ON usuarios (lower(email))"
+
+MIGRACOES = [
+    (1, "tabelas usuarios, movimentos e metas", {
+        "postgresql": [
+            """
+            CREATE TABLE IF NOT EXISTS usuarios (
+                id SERIAL PRIMARY KEY,
+                nome TEXT NOT NULL,
+                email TEXT NOT NULL UNIQUE,
+                senha TEXT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS movimentos (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+                data DATE NOT NULL,
+                categoria TEXT NOT NULL,
+                descricao TEXT,
+                tipo TEXT NOT NULL,
+                valor NUMERIC(12, 2) NOT NULL,
+                fixo BOOLEAN NOT NULL DEFAULT FALSE,
+                pago BOOLEAN NOT NULL DEFAULT TRUE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS metas (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+                categoria TEXT NOT NULL,
+                valor_limite NUMERIC(12, 2) NOT NULL
+            )
+            """,
+        ],
+        "sqlite": [
+            _adotar_sqlite_legado,
+            """
+            CREATE TABLE IF NOT EXISTS usuarios (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT NOT NULL,
+                email TEXT NOT NULL UNIQUE,
+                senha TEXT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS movimentos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+                data DATE NOT NULL,
+                categoria TEXT NOT NULL,
+                descricao TEXT,
+                tipo TEXT NOT NULL,
+                valor NUMERIC NOT NULL,
+                fixo BOOLEAN NOT NULL DEFAULT 0,
+                pago BOOLEAN NOT NULL DEFAULT 1
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS metas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+                categoria TEXT NOT NULL,
+                valor_limite NUMERIC NOT NULL
+            )
+            """,
+        ],
+    }),
+    (2, "índices dos padrões de acesso (user_id + mês, metas únicas por categoria)", {
+        "postgresql": _INDICES,
+        "sqlite": _INDICES,
+    }),
+    (3, "hash_importacao para deduplicar extratos importados", {
+        "postgresql": ["ALTER TABLE movimentos ADD COLUMN IF NOT EXISTS hash_importacao BIGINT", _INDICE_HASH],
+        "sqlite": ["ALTER TABLE movimentos ADD COLUMN hash_importacao INTEGER", _INDICE_HASH],
+    }),
+    (4, "resumo_mensal por usuário, mês e categoria (preenchido a partir de movimentos)", {
+        "postgresql": [_TABELA_RESUMO, preencher_resumo],
+        "sqlite": [_TABELA_RESUMO, preencher_resumo],
+    }),
+    (5, "regras de recorrência e o vínculo das ocorrências gravadas em movimentos", {
+        "postgresql": [
+            _TABELA_RECORRENCIAS.format(id="SERIAL PRIMARY KEY"),
+            "CREATE INDEX IF NOT EXISTS recorrencias_user_idx ON recorrencias (user_id)",
+            "ALTER TABLE movimentos ADD COLUMN IF NOT EXISTS recorrencia_id INTEGER "
+            "REFERENCES recorrencias(id) ON DELETE SET NULL",
+            _INDICE_RECORRENCIA,
+        ],
+        "sqlite": [
+            _TABELA_RECORRENCIAS.format(id="INTEGER PRIMARY KEY AUTOINCREMENT"),
+            "CREATE INDEX IF NOT EXISTS recorrencias_user_idx ON recorrencias (user_id)",
+            "ALTER TABLE movimentos ADD COLUMN recorrencia_id INTEGER REFERENCES recorrencias(id) ON DELETE SET NULL",
+            _INDICE_RECORRENCIA,
+        ],
+    }),
+    (6, "índice do login por email (sem diferenciar maiúsculas)", {
+        "postgresql": [_INDICE_EMAIL],
+        "sqlite": [_INDICE_EMAIL],
+    }),
+    # Trigramas no Postgres, FTS5 mantido por triggers no SQLite (ver services/busca.py)
+    (7, "índice de busca por descrição/categoria em todos os meses", busca.INDICES),
+    (8, "índice único de metas com user_id primeiro (atende também o ler_metas)", {
+        "postgresql": _INDICES_METAS,
+        "sqlite": _INDICES_METAS,
+    }),
+    # Vai nos tokens de sessão; o "Sair" incrementa e derruba os já emitidos (ver services/autenticacao.py)
+    (9, "versão das sessões por usuário", {
+        "postgresql": ["ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS sessao_versao INTEGER NOT NULL DEFAULT 0"],
+        "sqlite": ["ALTER TABLE usuarios ADD COLUMN sessao_versao INTEGER NOT NULL DEFAULT 0"],
+    }),
+]
+
+# Chave do pg_advisory_xact_lock: dois processos não aplicam migrações ao mesmo tempo
+_LOCK_MIGRACOES = 7300191
+
+
+def _garantir_tabela_controle(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migracoes (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT NOT NULL,
+            aplicada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def versoes_aplicadas():
+    with conexao() as conn:
+        if conn:
+            cursor = conn.cursor()
+            _garantir_tabela_controle(cursor)
+            cursor.execute("SELECT versao FROM schema_migracoes ORDER BY versao")
+            return [linha[0] for linha in cursor.fetchall()]
+    return []
+
+
+def aplicar_migracoes():
+    """Aplica, em ordem, as migrações que ainda não constam em schema_migracoes."""
+    aplicadas = []
+    banco = dialeto()
+    for versao, descricao, comandos in MIGRACOES:
+        with conexao() as conn:
+            if not conn:
+                break
+            cursor = conn.cursor()
+            if banco == "postgresql":
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_MIGRACOES,))
+            _garantir_tabela_controle(cursor)
+            cursor.execute("SELECT 1 FROM schema_migracoes WHERE versao = %s", (versao,))
+            if cursor.fetchone():
+                continue
+            for comando in comandos[banco]:
+                if callable(comando):
+                    comando(cursor)
+                else:
+                    cursor.execute(comando)
+            cursor.execute("INSERT INTO schema_migracoes (versao, descricao) VALUES (%s, %s)", (versao, descricao))
+            aplicadas.append(versao)
+    manter_particoes()
+    return aplicadas
+
+
+# --- PARTICIONAMENTO MENSAL (opcional) ---
+# Troca movimentos por uma tabela particionada por RANGE (data), uma partição por mês
+# e uma DEFAULT para o que cair fora. Consultas de um mês passam a ler só uma
+# partição. Custos: a PK vira (id, data) e índices únicos precisam incluir data,
+# por isso o índice de hash_importacao deixa de ser único (a importação já
+# deduplica com NOT EXISTS). Os índices são refeitos a partir dos comandos das
+# migrações já aplicadas (_indices_movimentos) e as chaves estrangeiras a partir
+# do catálogo. Não está na lista MIGRACOES: só roda se pedido.
+
+def _nome_particao(inicio):
+    return f"movimentos_{inicio.year}_{inicio.month:02d}"
+
+
+def _proximo_mes(d):
+    return date(d.year + 1, 1, 1) if d.month == 12 else date(d.year, d.month + 1, 1)
+
+
+def garantir_particoes(cursor, desde, meses_a_frente=12):
+    """Cria as partições mensais de `desde` até `meses_a_frente` meses depois de hoje.
+
+    Se a DEFAULT já tem linhas de um mês sem partição, o Postgres recusa criar a
+    partição: as linhas saem da DEFAULT para uma tabela nova, anexada em seguida.
+    """
+    inicio = date(desde.year, desde.month, 1)
+    hoje = date.today()
+    limite = date(hoje.year + (hoje.month - 1 + meses_a_frente) // 12, (hoje.month - 1 + meses_a_frente) % 12 + 1, 1)
+    while inicio <= limite:
+        fim = _proximo_mes(inicio)
+        nome = _nome_particao(inicio)
+        cursor.execute("SELECT to_regclass(%s)", (nome,))
+        if cursor.fetchone()[0] is None:
+            cursor.execute("SELECT 1 FROM movimentos_padrao WHERE data >= %s AND data < %s LIMIT 1", (inicio, fim))
+            if cursor.fetchone() is None:
+                cursor.execute(f"CREATE TABLE {nome} PARTITION OF movimentos FOR VALUES FROM (%s) TO (%s)",
+                               (inicio, fim))
+            else:
+                cursor.execute(f"CREATE TABLE {nome} (LIKE movimentos INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+                cursor.execute(f"""
+                    WITH movidas AS (DELETE FROM movimentos_padrao WHERE data >= %s AND data < %s RETURNING *)
+                    INSERT INTO {nome} SELECT * FROM movidas
+                """, (inicio, fim))
+                cursor.execute(f"ALTER TABLE movimentos ATTACH PARTITION {nome} FOR VALUES FROM (%s) TO (%s)",
+                               (inicio, fim))
+        inicio = fim
+
+
+def manter_particoes(meses_a_frente=12):
+    """Com movimentos particionada, cria as partições que faltam até `meses_a_frente` meses à frente.
+
+    Devolve False se movimentos não é particionada (nada a fazer).
+    """
+    if dialeto() != "postgresql":
+        return False
+    with conexao() as conn:
+        if not conn:
+            return False
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_MIGRACOES,))
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = 'movimentos'")
+        linha = cursor.fetchone()
+        if linha is None or linha[0] != "p":
+            return False
+        cursor.execute("SELECT LEAST(COALESCE(MIN(data), CURRENT_DATE), CURRENT_DATE) FROM movimentos_padrao")
+        garantir_particoes(cursor, cursor.fetchone()[0], meses_a_frente)
+    return True
+
+
+_INDICE_EM_MOVIMENTOS = re.compile(r"^CREATE (UNIQUE )?INDEX IF NOT EXISTS \w+ ON movimentos (.*)$")
+
+
+def _indices_movimentos(cursor):
+    """Os CREATE INDEX sobre movimentos das migrações já aplicadas (comandos do Postgres).
+
+    Um índice único numa tabela particionada precisa conter a chave de partição
+    (data); os que não contêm são recriados como índices comuns.
+    """
+    cursor.execute("SELECT versao FROM schema_migracoes")
+    feitas = {linha[0] for linha in cursor.fetchall()}
+    comandos = []
+    for versao, _, por_dialeto in MIGRACOES:
+        if versao not in feitas:
+            continue
+        for comando in por_dialeto["postgresql"]:
+            achou = isinstance(comando, str) and _INDICE_EM_MOVIMENTOS.match(" ".join(comando.split()))
+            if not achou:
+                continue
+            comando = achou.group(0)
+            if achou.group(1) and not re.search(r"\bdata\b", achou.group(2)):
+                comando = comando.replace("CREATE UNIQUE INDEX", "CREATE INDEX", 1)
+            comandos.append(comando)
+    return comandos
+
+
+def particionar_movimentos(meses_a_frente=12):
+    if dialeto() != "postgresql":
+        return False
+    with conexao() as conn:
+        if not conn:
+            return False
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_MIGRACOES,))
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = 'movimentos'")
+        if cursor.fetchone()[0] == "p":
+            return False
+        cursor.execute("SELECT COALESCE(MIN(data), CURRENT_DATE) FROM movimentos")
+        desde = cursor.fetchone()[0]
+
+        cursor.execute("ALTER TABLE movimentos RENAME TO movimentos_antiga")
+        cursor.execute("""
+            CREATE TABLE movimentos (
+                LIKE movimentos_antiga INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+                PRIMARY KEY (id, data)
+            ) PARTITION BY RANGE (data)
+        """)
+        # LIKE não copia chaves estrangeiras: recria as da tabela antiga como estão no catálogo
+        cursor.execute("SELECT pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE conrelid = 'movimentos_antiga'::regclass AND contype = 'f'")
+        for (definicao,) in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE movimentos ADD {definicao}")
+        cursor.execute("CREATE TABLE movimentos_padrao PARTITION OF movimentos DEFAULT")
+        garantir_particoes(cursor, desde, meses_a_frente)
+        cursor.execute("INSERT INTO movimentos SELECT * FROM movimentos_antiga")
+        # A sequence do id pertence à tabela antiga; sem isso o DROP a levaria junto
+        cursor.execute("ALTER SEQUENCE movimentos_id_seq OWNED BY movimentos.id")
+        cursor.execute("DROP TABLE movimentos_antiga")
+        # Nem índices: recria os das migrações já aplicadas, mais um por id para os UPDATE/DELETE
+        for comando in _indices_movimentos(cursor):
+            cursor.execute(comando)
+        cursor.execute("CREATE INDEX movimentos_id_idx ON movimentos (id)")
+    return True
+
+
+# --- VERIFICAÇÃO DE PLANOS ---
+# Mesmas consultas (e mesmo formato de parâmetros) que services/crud.py faz.
+# EXPLAIN sem ANALYZE não executa nada, então os UPDATE/DELETE são seguros.
+
+def _consultas_crud(user_id):
+    mes = date.today().replace(day=1)
+    fim = _proximo_mes(mes)
+    return [
+        ("ler_movimentos", "SELECT id, data, categoria, CAST(ROUND(valor * 100) AS BIGINT) FROM movimentos "
+                           "WHERE user_id = %s", (user_id,)),
+        ("listar_meses", "SELECT DISTINCT mes FROM resumo_mensal WHERE user_id = %s ORDER BY mes DESC", (user_id,)),
+        ("resumo_mes", "SELECT SUM(receitas_centavos), SUM(despesas_centavos), SUM(pendente_centavos) "
+                       "FROM resumo_mensal WHERE user_id = %s AND mes = %s", (user_id, mes.strftime("%Y-%m"))),
+        ("gastos_por_categoria", "SELECT categoria, -despesas_centavos FROM resumo_mensal "
+                                 "WHERE user_id = %s AND mes = %s AND despesas_centavos < 0 ORDER BY 2 DESC",
+         (user_id, mes.strftime("%Y-%m"))),
+        ("resumo (lote)", "SELECT categoria, COUNT(*) FROM movimentos WHERE user_id = %s AND data >= %s AND data < %s "
+                          "GROUP BY categoria", (user_id, mes, fim)),
+        ("ler_movimentos_mes", "SELECT * FROM movimentos WHERE user_id = %s AND data >= %s AND data < %s "
+                               "ORDER BY data, id", (user_id, mes, fim)),
+        ("ler_extrato_pagina", "SELECT * FROM movimentos WHERE user_id = %s AND data >= %s AND data < %s "
+                               "AND (data, id) > (%s, %s) ORDER BY data, id LIMIT %s", (user_id, mes, fim, mes, 0, 51)),
+        ("atualizar_movimento", "UPDATE movimentos SET descricao = descricao WHERE id = %s AND user_id = %s", (0, user_id)),
+        ("mudar_status_pago", "UPDATE movimentos SET pago = pago WHERE id = %s AND user_id = %s", (0, user_id)),
+        ("excluir_movimento", "DELETE FROM movimentos WHERE id = %s AND user_id = %s", (0, user_id)),
+        ("copiar_movimentos", "SELECT 1 FROM movimentos WHERE user_id = %s AND hash_importacao = %s", (user_id, 0)),
+        ("materializar_recorrencias", "SELECT 1 FROM movimentos WHERE recorrencia_id = %s AND data = %s", (0, mes)),
+        ("ler_recorrencias", "SELECT * FROM recorrencias WHERE user_id = %s ORDER BY id", (user_id,)),
+        ("ler_metas", "SELECT * FROM metas WHERE user_id = %s", (user_id,)),
+        ("salvar_meta", "SELECT 1 FROM metas WHERE categoria = %s AND user_id = %s", ("Outros", user_id)),
+        ("autenticar_usuario", "SELECT id, nome, senha FROM usuarios WHERE lower(email) = %s", ("",)),
+        ("buscar_movimentos", *busca.consulta(dialeto(), "id", user_id, "mercado")),
+    ]
+
+
+def _nos_do_plano(no):
+    yield no
+    for filho in no.get("Plans", []):
+        yield from _nos_do_plano(filho)
+
+
+def verificar_planos(user_id):
+    """EXPLAIN de cada consulta do crud: quais índices usa e onde há Seq Scan."""
+    relatorio = []
+    with conexao() as conn:
+        if not conn:
+            return relatorio
+        cursor = conn.cursor()
+        if dialeto() == "sqlite":
+            return _verificar_planos_sqlite(cursor, user_id)
+        for nome, sql, params in _consultas_crud(user_id):
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plano = cursor.fetchone()[0]
+            if isinstance(plano, str):
+                plano = json.loads(plano)
+            nos = list(_nos_do_plano(plano[0]["Plan"]))
+            relatorio.append({
+                "consulta": nome,
+                "custo": nos[0].get("Total Cost"),
+                "indices": sorted({n["Index Name"] for n in nos if "Index Name" in n}),
+                "seq_scans": sorted({n["Relation Name"] for n in nos if n["Node Type"] == "Seq Scan"}),
+            })
+    return relatorio
+
+
+def _verificar_planos_sqlite(cursor, user_id):
+    # EXPLAIN QUERY PLAN devolve linhas como "SEARCH movimentos USING INDEX x (...)" ou "SCAN movimentos"
+    relatorio = []
+    for nome, sql, params in _consultas_crud(user_id):
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        detalhes = [linha[-1] for linha in cursor.fetchall()]
+        # Uma tabela FTS5 aparece como "SCAN x VIRTUAL TABLE INDEX ...": é o índice dela
+        relatorio.append({
+            "consulta": nome,
+            "custo": None,
+            "indices": sorted({m.group(1) or m.group(2) for d in detalhes
+                               for m in [re.search(r"USING (?:COVERING )?INDEX (\w+)|SCAN (\w+) VIRTUAL TABLE", d)] if m}),
+            "seq_scans": sorted({d.split()[1] for d in detalhes
+                                 if d.startswith("SCAN ") and "USING" not in d and "VIRTUAL TABLE" not in d}),
+        })
+    return relatorio
+
+
+def _main(args):
+    comando = args[0] if args else "status"
+    if comando == "aplicar":
+        aplicadas = aplicar_migracoes()
+        print(f"Aplicadas: {aplicadas or 'nenhuma (já estava em dia)'}")
+    elif comando == "status":
+        feitas = set(versoes_aplicadas())
+        for versao, descricao, _ in MIGRACOES:
+            print(f"[{'x' if versao in feitas else ' '}] {versao:03d} {descricao}")
+    elif comando == "planos":
+        for item in verificar_planos(int(args[1])):
+            alerta = f"  SEQ SCAN em {', '.join(item['seq_scans'])}" if item["seq_scans"] else ""
+            print(f"{item['consulta']:<22} custo={str(item['custo']):<10} índices={item['indices']}{alerta}")
+    elif comando == "particionar":
+        print("Particionada." if particionar_movimentos() else "Já estava particionada.")
+    elif comando == "particoes":
+        print("Partições em dia." if manter_particoes() else "movimentos não é particionada.")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,96 @@
+"""Motor de recorrências: expande regras (mensal/anual, a cada N, com fim opcional) em ocorrências.
+
+Tudo vetorizado sobre o ordinal do mês (ano * 12 + mês - 1): cada regra vira um
+intervalo de índices k e as ocorrências saem de um np.repeat, sem loop por
+regra nem por mês. As telas usam as ocorrências futuras direto (nada é gravado);
+só os meses que já chegaram são gravados em movimentos, em lote, pelo crud
+(materializar_recorrencias), para poderem ser marcados como pagos.
+"""
+import numpy as np
+import pandas as pd
+
+FREQUENCIAS = {"mensal": 1, "anual": 12}  # meses por unidade
+COLUNAS_OCORRENCIA = ["recorrencia_id", "data", "mes", "categoria", "descricao", "tipo", "valor_centavos"]
+
+
+def _ordinal(datas):
+    # datetime64[M] conta meses desde 1970-01
+    return np.asarray(datas, dtype="datetime64[M]").astype("int64") + 1970 * 12
+
+
+def passo_meses(regras):
+    """Meses entre duas ocorrências de cada regra."""
+    return regras["frequencia"].map(FREQUENCIAS).to_numpy(dtype="int64") * regras["intervalo"].to_numpy(dtype="int64")
+
+
+def ocorrencias(regras, inicio, fim):
+    """Ocorrências das `regras` com data em [inicio, fim).
+
+    `regras` é o frame de crud.ler_recorrencias (id, inicio, fim, frequencia,
+    intervalo, categoria, descricao, tipo, valor_centavos). O dia do mês vem do
+    início da regra; em meses mais curtos cai no último dia (31/01 -> 28/02).
+    """
+    inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+    if regras.empty or fim <= inicio:
+        return pd.DataFrame(columns=COLUNAS_OCORRENCIA)
+
+    comeco = regras["inicio"].to_numpy(dtype="datetime64[D]")
+    termino = regras["fim"].to_numpy(dtype="datetime64[D]")
+    sem_fim = np.isnat(termino)
+    o0 = _ordinal(comeco)
+    passo = passo_meses(regras)
+    janela_ini, janela_fim = _ordinal(inicio.to_datetime64()), _ordinal((fim - pd.Timedelta(days=1)).to_datetime64())
+    # Último mês possível de cada regra: o fim da janela ou o fim da regra, o que vier antes
+    ultimo = np.where(sem_fim, janela_fim, np.minimum(janela_fim, _ordinal(np.where(sem_fim, comeco, termino))))
+
+    k_min = np.maximum(0, -((o0 - janela_ini) // passo))  # ceil((janela_ini - o0) / passo)
+    k_max = np.floor_divide(ultimo - o0, passo)
+    quantos = np.clip(k_max - k_min + 1, 0, None)
+    if quantos.sum() == 0:
+        return pd.DataFrame(columns=COLUNAS_OCORRENCIA)
+
+    regra = np.repeat(np.arange(len(regras)), quantos)
+    k = k_min[regra] + np.arange(quantos.sum()) - np.repeat(np.cumsum(quantos) - quantos, quantos)
+    ordinal = o0[regra] + k * passo[regra]
+
+    mes64 = (ordinal - 1970 * 12).astype("datetime64[M]")
+    primeiro_dia = mes64.astype("datetime64[D]")
+    dias_no_mes = ((mes64 + 1).astype("datetime64[D]") - primeiro_dia).astype("int64")
+    dia_regra = (comeco - comeco.astype("datetime64[M]").astype("datetime64[D]")).astype("int64") + 1
+    datas = primeiro_dia + (np.minimum(dia_regra[regra], dias_no_mes) - 1)
+
+    # O mês certo pode ter o dia fora da janela (janela no meio do mês) ou depois do fim da regra
+    dentro = (datas >= inicio.to_datetime64()) & (datas < fim.to_datetime64())
+    dentro &= sem_fim[regra] | (datas <= termino[regra])
+    ordem = np.flatnonzero(dentro)
+    ordem = ordem[np.lexsort((regras["id"].to_numpy()[regra][ordem], datas[ordem]))]
+    regra, ordinal = regra[ordem], ordinal[ordem]
+    return pd.DataFrame({
+        "recorrencia_id": regras["id"].to_numpy()[regra],
+        "data": datas[ordem].astype("datetime64[ns]"),
+        "mes": ((ordinal // 12) * 100 + ordinal % 12 + 1).astype("int32"),
+        "categoria": regras["categoria"].array.take(regra),
+        "descricao": regras["descricao"].array.take(regra),
+        "tipo": regras["tipo"].array.take(regra),
+        "valor_centavos": regras["valor_centavos"].to_numpy(dtype="int64")[regra],
+    })
+
+
+def custo_mensal(regras, hoje=None):
+    """Valor mensal equivalente (centavos) de cada regra ainda ativa: anual conta 1/12, a cada N meses 1/N."""
+    hoje = pd.Timestamp(hoje or pd.Timestamp.today().normalize())
+    ativa = regras["fim"].isna() | (pd.DatetimeIndex(regras["fim"]) >= hoje)
+    return pd.Series(np.where(ativa, regras["valor_centavos"].to_numpy(dtype="int64") / passo_meses(regras), 0.0),
+                     index=regras.index)
+
+
+def proximas(regras, hoje=None):
+    """Data da próxima ocorrência (a partir de hoje) de cada regra; NaT se já terminou."""
+    hoje = pd.Timestamp(hoje or pd.Timestamp.today().normalize())
+    if regras.empty:
+        return pd.Series(dtype="datetime64[ns]")
+    # Uma janela de um passo inteiro (o maior) sempre contém a próxima ocorrência
+    horizonte = hoje + pd.DateOffset(months=int(passo_meses(regras).max()) + 1)
+    futuras = ocorrencias(regras, hoje, horizonte)
+    primeira = futuras.groupby("recorrencia_id")["data"].min()
+    return regras["id"].map(primeira)
@@ -0,0 +1,182 @@
+"""Resumo mensal pré-calculado: uma linha por (user_id, mes, categoria).
+
+Guarda receitas, despesas e despesas pendentes em centavos, mais as contagens,
+para o cabeçalho do dashboard, as metas e as assinaturas lerem poucas linhas em
+vez de somar movimentos. O crud mantém o resumo na mesma transação de cada
+escrita: os lançamentos avulsos aplicam um delta, os lotes recalculam os meses
+que tocaram.
+
+Se alguma coisa escrever em movimentos por fora do crud:
+
+    python -m services.resumo verificar [USER_ID]     # lista divergências
+    python -m services.resumo reconstruir [USER_ID]   # recalcula do zero
+"""
+import sys
+from datetime import date
+
+import pandas as pd
+
+from services.cache import cache
+from services.database import conexao, dialeto
+
+# Mesmo arredondamento do crud (COLUNAS_MOVIMENTO): o banco converte para centavos
+_CENTAVOS = "CAST(ROUND(valor * 100) AS BIGINT)"
+
+_COLUNAS = "user_id, mes, categoria, receitas_centavos, despesas_centavos, pendente_centavos, qtd, qtd_pendentes"
+
+_AGREGADO = f"""
+    SELECT user_id, to_char(data, 'YYYY-MM') AS mes, categoria,
+           SUM(CASE WHEN valor > 0 THEN {_CENTAVOS} ELSE 0 END),
+           SUM(CASE WHEN valor < 0 THEN {_CENTAVOS} ELSE 0 END),
+           SUM(CASE WHEN valor < 0 AND NOT pago THEN {_CENTAVOS} ELSE 0 END),
+           COUNT(*),
+           SUM(CASE WHEN valor < 0 AND NOT pago THEN 1 ELSE 0 END)
+    FROM movimentos
+"""
+
+# O WHERE 1 = 1 antes do ON CONFLICT é exigido pelo SQLite em INSERT ... SELECT
+_DELTA = f"""
+    INSERT INTO resumo_mensal ({_COLUNAS})
+    SELECT %s, %s, %s,
+           %s * CASE WHEN c > 0 THEN c ELSE 0 END,
+           %s * CASE WHEN c < 0 THEN c ELSE 0 END,
+           %s * CASE WHEN c < 0 AND NOT %s THEN c ELSE 0 END,
+           %s,
+           %s * CASE WHEN c < 0 AND NOT %s THEN 1 ELSE 0 END
+    FROM (SELECT CAST(ROUND(%s * 100) AS BIGINT) AS c) v
+    WHERE 1 = 1
+    ON CONFLICT (user_id, mes, categoria) DO UPDATE SET
+        receitas_centavos = resumo_mensal.receitas_centavos + EXCLUDED.receitas_centavos,
+        despesas_centavos = resumo_mensal.despesas_centavos + EXCLUDED.despesas_centavos,
+        pendente_centavos = resumo_mensal.pendente_centavos + EXCLUDED.pendente_centavos,
+        qtd = resumo_mensal.qtd + EXCLUDED.qtd,
+        qtd_pendentes = resumo_mensal.qtd_pendentes + EXCLUDED.qtd_pendentes
+"""
+
+
+def _mes(data):
+    return data.strftime("%Y-%m") if hasattr(data, "strftime") else str(data)[:7]
+
+
+def _limites(mes):
+    ano, m = (int(p) for p in mes.split("-"))
+    return date(ano, m, 1), (date(ano + 1, 1, 1) if m == 12 else date(ano, m + 1, 1))
+
+
+# --- MANUTENÇÃO (chamada pelo crud, com o cursor da transação da escrita) ---
+
+def _travar(cursor, user_id):
+    """Postgres: uma manutenção do resumo do usuário por vez, até o fim da transação.
+
+    Sem a trava, um recálculo (DELETE + INSERT) e o delta de uma escrita avulsa
+    no mesmo mês, em transações concorrentes, podem perder o delta ou contá-lo
+    duas vezes. Quem pega a trava depois já enxerga o commit de quem a soltou.
+    (No SQLite as transações de escrita já são em série.)
+    """
+    if dialeto() == "postgresql":
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('resumo'), %s)", (user_id,))
+
+
+def ajustar(cursor, user_id, data, categoria, valor, pago, sinal=1):
+    """Soma (sinal=1) ou tira (sinal=-1) um lançamento do resumo do mês dele.
+
+    Os centavos são calculados pelo banco a partir de `valor`, com a mesma
+    expressão do agregado, então o delta bate com o que `verificar` recalcula.
+    """
+    mes = _mes(data)
+    _travar(cursor, user_id)
+    cursor.execute(_DELTA, (user_id, mes, categoria, sinal, sinal, sinal, bool(pago), sinal, sinal, bool(pago), valor))
+    if sinal < 0:
+        cursor.execute("DELETE FROM resumo_mensal WHERE user_id = %s AND mes = %s AND categoria = %s AND qtd <= 0",
+                       (user_id, mes, categoria))
+
+
+def recalcular_meses(cursor, user_id, meses):
+    """Refaz as linhas dos meses ("AAAA-MM") do usuário a partir de movimentos (usado nos lotes).
+
+    Recalcula o intervalo do primeiro ao último mês de uma vez: dois comandos por
+    lote, mesmo que um extrato cubra anos.
+    """
+    if not meses:
+        return
+    primeiro, ultimo = min(meses), max(meses)
+    inicio, fim = _limites(primeiro)[0], _limites(ultimo)[1]
+    _travar(cursor, user_id)
+    cursor.execute("DELETE FROM resumo_mensal WHERE user_id = %s AND mes >= %s AND mes <= %s",
+                   (user_id, primeiro, ultimo))
+    cursor.execute(f"INSERT INTO resumo_mensal ({_COLUNAS}) {_AGREGADO} "
+                   "WHERE user_id = %s AND data >= %s AND data < %s GROUP BY user_id, mes, categoria",
+                   (user_id, inicio, fim))
+
+
+def preencher(cursor, user_id=None):
+    """Apaga e recalcula o resumo inteiro (ou de um usuário). Usado pela migração e por `reconstruir`."""
+    if user_id is None:
+        cursor.execute("DELETE FROM resumo_mensal")
+        cursor.execute(f"INSERT INTO resumo_mensal ({_COLUNAS}) {_AGREGADO} GROUP BY user_id, mes, categoria")
+    else:
+        _travar(cursor, user_id)
+        cursor.execute("DELETE FROM resumo_mensal WHERE user_id = %s", (user_id,))
+        cursor.execute(f"INSERT INTO resumo_mensal ({_COLUNAS}) {_AGREGADO} "
+                       "WHERE user_id = %s GROUP BY user_id, mes, categoria", (user_id,))
+
+
+# --- VERIFICAÇÃO / RECONSTRUÇÃO ---
+
+def reconstruir(user_id=None):
+    with conexao() as conn:
+        if not conn:
+            return False
+        preencher(conn.cursor(), user_id)
+    # Todas as leituras por mês vêm do resumo
+    cache.limpar()
+    return True
+
+
+def verificar(user_id=None):
+    """Compara o resumo com o agregado de movimentos. Devolve as linhas divergentes (vazio = ok)."""
+    filtro, params = ("WHERE user_id = %s", (user_id,)) if user_id is not None else ("", ())
+    colunas = _COLUNAS.split(", ")
+    with conexao() as conn:
+        if not conn:
+            return None
+        cursor = conn.cursor()
+        cursor.execute(f"{_AGREGADO} {filtro} GROUP BY user_id, mes, categoria", params)
+        esperado = pd.DataFrame(cursor.fetchall(), columns=colunas)
+        cursor.execute(f"SELECT {_COLUNAS} FROM resumo_mensal {filtro}", params)
+        atual = pd.DataFrame(cursor.fetchall(), columns=colunas)
+
+    chave = ["user_id", "mes", "categoria"]
+    valores = colunas[3:]
+    juntos = esperado.merge(atual, on=chave, how="outer", suffixes=("_esperado", "_resumo"), indicator=True)
+    for coluna in valores:
+        for lado in ("_esperado", "_resumo"):
+            juntos[coluna + lado] = juntos[coluna + lado].fillna(0).astype("int64")
+    diferente = juntos["_merge"] != "both"
+    for coluna in valores:
+        diferente |= juntos[coluna + "_esperado"] != juntos[coluna + "_resumo"]
+    return juntos[diferente].drop(columns="_merge").reset_index(drop=True)
+
+
+def _main(args):
+    comando = args[0] if args else ""
+    user_id = int(args[1]) if len(args) > 1 else None
+    if comando == "verificar":
+        divergencias = verificar(user_id)
+        if divergencias is None:
+            return 1
+        if divergencias.empty:
+            print("Resumo em dia.")
+            return 0
+        print(divergencias.to_string(index=False))
+        print(f"{len(divergencias)} linha(s) divergente(s); rode `reconstruir`.")
+        return 2
+    if comando == "reconstruir":
+        print("Resumo reconstruído." if reconstruir(user_id) else "Falha ao reconstruir.")
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
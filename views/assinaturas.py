@@ -1,28 +1,72 @@
-import streamlit as st
 import pandas as pd
+import streamlit as st
+from services.crud import listar_meses, ler_movimentos_mes, gastos_por_categoria, ler_recorrencias
+from services.instrumentacao import etapa
+from services.recorrencias import custo_mensal, ocorrencias, proximas
+
+CATEGORIA_ASSINATURAS = "Assinaturas/Streaming"
+
+def resumo_assinaturas(df_gastos):
+    """Mensalidade total e custo anual estimado (ambos positivos), a partir de gastos_por_categoria."""
+    custo = float(df_gastos.loc[df_gastos['categoria'] == CATEGORIA_ASSINATURAS, 'valor'].sum())
+    return custo, custo * 12
 
-def show_assinaturas(df_bruto):
+def resumo_recorrentes(regras, hoje=None):
+    """Mensalidade, custo dos próximos 12 meses (positivos) e a tabela das regras ativas.
+
+    O anual soma as ocorrências de verdade da janela (uma anual entra uma vez,
+    uma regra que termina antes só até o fim), em vez de mensal * 12. Só as
+    despesas entram no custo; na tabela os valores aparecem sem sinal.
+    """
+    hoje = pd.Timestamp(hoje or pd.Timestamp.today().normalize())
+    despesas = regras[regras["valor_centavos"] < 0]
+    mensal = custo_mensal(despesas, hoje)
+    futuras = ocorrencias(despesas, hoje, hoje + pd.DateOffset(months=12))
+    tabela = regras.assign(valor=regras["valor_centavos"].abs() / 100, proxima=proximas(regras, hoje))
+    tabela = tabela[tabela["proxima"].notna()][["descricao", "valor", "frequencia", "intervalo", "proxima"]]
+    return -float(mensal.sum()) / 100, -float(futuras["valor_centavos"].sum()) / 100, tabela
+
+def show_assinaturas(user_id):
     st.title("📺 Assinaturas")
-    
-    if df_bruto.empty:
+
+    with etapa("assinaturas.meses"):
+        regras = ler_recorrencias(user_id)
+        regras = regras[regras["categoria"] == CATEGORIA_ASSINATURAS]
+        tem_dados = bool(listar_meses(user_id))
+        meses_subs = listar_meses(user_id, CATEGORIA_ASSINATURAS) if tem_dados and regras.empty else []
+
+    # Com regras cadastradas o custo vem delas; sem regras, do último mês com lançamentos
+    if not regras.empty:
+        with etapa("assinaturas.render"):
+            mensal, anual, tabela = resumo_recorrentes(regras)
+
+            st.metric("Mensalidade Total", f"R$ {mensal:,.2f}")
+            st.metric("Custo nos Próximos 12 Meses", f"R$ {anual:,.2f}")
+
+            st.dataframe(tabela, use_container_width=True, hide_index=True,
+                         column_config={"proxima": st.column_config.DateColumn("Próxima cobrança", format="DD/MM/YYYY")})
+        return
+
+    if not tem_dados:
         st.warning("Sem dados.")
         return
 
-    df_subs = df_bruto[df_bruto['categoria'] == "Assinaturas/Streaming"].copy()
-    
-    if not df_subs.empty:
-        df_subs['data'] = pd.to_datetime(df_subs['data'])
-        df_subs['mes_ano'] = df_subs['data'].dt.strftime('%Y-%m')
-        
+    if meses_subs:
         # Pega o último mês com dados
-        ultimo_mes = sorted(df_subs['mes_ano'].unique())[-1]
-        df_atual = df_subs[df_subs['mes_ano'] == ultimo_mes]
-        
-        custo = df_atual['valor'].sum()
-        
-        st.metric("Mensalidade Total", f"R$ {abs(custo):,.2f}")
-        st.metric("Custo Anual Estimado", f"R$ {abs(custo)*12:,.2f}")
-        
-        st.dataframe(df_atual[["descricao", "valor", "data"]], use_container_width=True)
+        ultimo_mes = meses_subs[0]
+        with etapa("assinaturas.consultas"):
+            df_gastos = gastos_por_categoria(user_id, ultimo_mes)
+            df_atual = ler_movimentos_mes(user_id, ultimo_mes, CATEGORIA_ASSINATURAS)
+
+        with etapa("assinaturas.render"):
+            mensal, anual = resumo_assinaturas(df_gastos)
+
+            st.metric("Mensalidade Total", f"R$ {mensal:,.2f}")
+            st.metric("Custo Anual Estimado", f"R$ {anual:,.2f}")
+
+            st.dataframe(df_atual.assign(valor=df_atual["valor_centavos"] / 100)[["descricao", "valor", "data"]],
+                         use_container_width=True)
+            st.caption("Cadastre as assinaturas como recorrências (no Dashboard, em \"🔁 Recorrências\" na barra "
+                       "lateral) para ver a próxima cobrança de cada uma.")
     else:
-        st.info("Nenhuma conta 'Assinaturas/Streaming' encontrada.")
\ No newline at end of file
+        st.info("Nenhuma conta 'Assinaturas/Streaming' encontrada.")
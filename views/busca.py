@@ -0,0 +1,64 @@
+import streamlit as st
+from views.dashboard import colorir_valores, preparar_extrato
+from views.styles import apply_custom_style
+from services.busca import BUSCA_LIMITE
+from services.crud import buscar_movimentos, mudar_status_pago, excluir_movimento
+from services.instrumentacao import etapa
+
+def show_busca(user_id):
+    with etapa("busca.estilo"):
+        apply_custom_style()
+
+    st.markdown("## 🔎 Buscar Lançamentos")
+    st.caption("Em todos os meses, pela descrição ou categoria")
+
+    # --- FILTROS ---
+    c_texto, c_aprox = st.columns([3, 1])
+    texto = c_texto.text_input("Buscar", placeholder="Ex.: mercado, aluguel, netflix", key="busca_texto")
+    aproximada = c_aprox.toggle("Aproximada", key="busca_aproximada", help="Tolera erros de digitação")
+    c_de, c_ate, c_min, c_max = st.columns(4)
+    de = c_de.date_input("De", value=None, format="DD/MM/YYYY", key="busca_de")
+    ate = c_ate.date_input("Até", value=None, format="DD/MM/YYYY", key="busca_ate")
+    valor_min = c_min.number_input("Valor mínimo (R$)", min_value=0.0, value=None, step=10.0, key="busca_valor_min")
+    valor_max = c_max.number_input("Valor máximo (R$)", min_value=0.0, value=None, step=10.0, key="busca_valor_max")
+
+    if not texto.strip() and de is None and ate is None and valor_min is None and valor_max is None:
+        st.info("Digite o que procura ou escolha um período/faixa de valor.")
+        return
+
+    with etapa("busca.consulta"):
+        df = buscar_movimentos(user_id, texto, de, ate, valor_min, valor_max, aproximada)
+    if df.empty:
+        st.warning("Nenhum lançamento encontrado.")
+        return
+
+    # --- RESULTADOS ---
+    with etapa("busca.render"):
+        df_show, rotulos = preparar_extrato(df)
+        df_show["Data"] = df_show["data"].dt.strftime("%d/%m/%Y")
+        st.dataframe(
+            df_show[["Data", "categoria", "descricao", "Valor_Visual", "Status"]].style.apply(colorir_valores,
+                                                                                             subset=['Valor_Visual']),
+            hide_index=True,
+            use_container_width=True,
+        )
+        if len(df) >= BUSCA_LIMITE:
+            st.caption(f"Mostrando os primeiros {BUSCA_LIMITE}; refine a busca para ver outros.")
+        else:
+            st.caption(f"{len(df)} lançamento(s)")
+
+    # O seletor guarda o id; o rótulo só é montado para exibir
+    rotulo_por_id = dict(zip(df["id"].tolist(), rotulos))
+    with st.expander("⚡ Gerenciar Lançamento"):
+        id_sel = st.selectbox("Selecione o item:", options=list(rotulo_por_id), format_func=rotulo_por_id.get,
+                              key="busca_item")
+        item_atual = df[df["id"] == id_sel].iloc[0]
+        c_status, c_excluir = st.columns(2)
+        if c_status.button("🔄 Alternar Status (Pago/Pendente)", key="busca_status"):
+            mudar_status_pago(id_sel, user_id, not item_atual["pago"])
+            st.success("Status alterado!")
+            st.rerun()
+        if c_excluir.button("🗑️ Excluir Registro", key="busca_excluir", type="primary"):
+            excluir_movimento(id_sel, user_id)
+            st.success("Excluído!")
+            st.rerun()
@@ -1,47 +1,130 @@
-import streamlit as st
+import math
+from datetime import date
+
+import numpy as np
 import pandas as pd
-import plotly.express as px
+import streamlit as st
+from views.figuras import figura_em_cache
 from views.styles import apply_custom_style
-from services.crud import adicionar_movimento, mudar_status_pago, atualizar_movimento, excluir_movimento, salvar_meta, ler_metas
+from services.instrumentacao import etapa
+from services.recorrencias import FREQUENCIAS
+from services.crud import (mudar_status_pago, atualizar_movimento, excluir_movimento, salvar_meta, ler_metas,
+                           listar_meses, resumo_mes, gastos_por_categoria, ler_extrato_pagina, contar_extrato,
+                           EXTRATO_POR_PAGINA, criar_recorrencia, ler_recorrencias, encerrar_recorrencia,
+                           excluir_recorrencia, converter_fixos_em_recorrencias)
 
 # Função auxiliar para formatar dinheiro BR
 def formatar_real(valor):
     return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
 
-# Função para colorir a tabela (Pandas Styler)
-def colorir_valores(val):
-    color = '#ef4444' if "-" in val else '#16a34a'
-    return f'color: {color}; font-weight: bold'
+# Mesmo formato do formatar_real para uma Series de centavos, sem loop em Python
+def formatar_centavos(centavos):
+    absoluto = centavos.abs()
+    inteiros = (absoluto // 100).astype(str).str.replace(r"\B(?=(\d{3})+(?!\d))", ".", regex=True)
+    fracao = (absoluto % 100).astype(str).str.zfill(2)
+    sinal = np.where(centavos < 0, "R$ -", "R$ ")
+    return sinal + inteiros + "," + fracao
+
+# Função para colorir a tabela (Pandas Styler.apply: uma chamada por coluna)
+def colorir_valores(coluna):
+    cores = np.where(coluna.str.contains("-", regex=False), '#ef4444', '#16a34a')
+    return [f'color: {cor}; font-weight: bold' for cor in cores]
+
+ORDENAR_POR = {"Data": "data", "Valor": "valor", "Categoria": "categoria", "Descrição": "descricao"}
+
+# --- PREPARAÇÃO DE DADOS (sem Streamlit, usada também pelos benchmarks) ---
+
+def calcular_metas(df_metas, df_gastos):
+    """Lista (categoria, teto, gasto, percentual) de cada meta contra os gastos do mês."""
+    if df_metas.empty:
+        return []
+    gastos_por_cat = df_gastos.set_index("categoria")["valor"].astype(float)
+    teto = df_metas["valor_limite"].astype(float).to_numpy()
+    gasto = df_metas["categoria"].map(gastos_por_cat).fillna(0.0).to_numpy()
+    perc = np.where(teto > 0, np.minimum(gasto / np.where(teto > 0, teto, 1), 1.0), 0.0)
+    return list(zip(df_metas["categoria"], teto.tolist(), gasto.tolist(), perc.tolist()))
+
+def montar_grafico_gastos(df_gastos):
+    # plotly.express custa ~80 ms de import: só entra quando o primeiro gráfico é montado
+    import plotly.express as px
+    total_abs = df_gastos["valor"].sum()
+    fig = px.pie(df_gastos, values='valor', names='categoria', hole=0.65, color_discrete_sequence=px.colors.qualitative.Pastel)
+    fig.add_annotation(text=f"<b>R$ {total_abs:,.0f}</b>", x=0.5, y=0.5, showarrow=False, font_size=18, font_color="#555")
+    fig.update_traces(textposition='outside', textinfo='percent+label')
+    fig.update_layout(showlegend=False, margin=dict(t=20, b=20, l=20, r=20), height=350)
+    return fig
+
+def preparar_extrato(df_pagina):
+    """Colunas de exibição do extrato e os rótulos do seletor "Gerenciar Lançamento".
+
+    Recebe só a página visível; tudo é feito coluna a coluna.
+    """
+    df_show = df_pagina.copy()
+    df_show['Vencimento'] = df_show['data'].dt.strftime('%d/%m')
+    df_show['Status'] = np.where(df_show['pago'], "✅", "🕒")
+    df_show['Valor_Visual'] = formatar_centavos(df_show['valor_centavos'])
+    opcoes = (df_show['id'].astype(str) + " - " + df_show['descricao'].fillna("").astype(str)
+              + " (" + df_show['Valor_Visual'] + ")").tolist()
+    return df_show, opcoes
 
-def show_dashboard(user_id, df_bruto, lista_categorias):
-    apply_custom_style()
+def show_dashboard(user_id, lista_categorias):
+    with etapa("dashboard.estilo"):
+        apply_custom_style()
 
     st.markdown("## 📊 Painel Financeiro")
     st.caption("Visão geral estratégica das suas contas")
 
-    if df_bruto.empty:
+    # Só a lista de meses vem do histórico todo; o resto é carregado por mês
+    with etapa("dashboard.meses"):
+        lista_meses = listar_meses(user_id)
+    if not lista_meses:
         st.info("Bem-vindo! Use o menu lateral para adicionar sua primeira movimentação.")
         return
 
-    # Preparação de Dados
-    df_bruto['data'] = pd.to_datetime(df_bruto['data'])
-    df_bruto['mes_ano'] = df_bruto['data'].dt.strftime('%Y-%m')
-    lista_meses = sorted(df_bruto['mes_ano'].unique(), reverse=True)
-
     # --- SIDEBAR ---
-    with st.sidebar.expander("🛠️ Clonar Mês Anterior"):
-        if lista_meses:
-            mes_origem = st.selectbox("Copiar de:", lista_meses)
-            if st.button("Clonar Pendências"):
-                fixos = df_bruto[(df_bruto['mes_ano'] == mes_origem) & (df_bruto['fixo'] == True)]
-                if not fixos.empty:
-                    for _, row in fixos.iterrows():
-                        nova_data = row['data'] + pd.DateOffset(months=1)
-                        adicionar_movimento(user_id, nova_data.date(), row['categoria'], row['descricao'], row['tipo'], row['valor'], True, False)
-                    st.success("Gerado!")
+    # As regras geram sozinhas os lançamentos de cada mês (app.py materializa a cada rerun)
+    with st.sidebar.expander("🔁 Recorrências"):
+        with st.form("form_recorrencia"):
+            inicio_rec = st.date_input("Primeira cobrança", date.today(), key="rec_inicio")
+            cat_rec = st.selectbox("Categoria", lista_categorias, key="rec_categoria")
+            desc_rec = st.text_input("Descrição", key="rec_descricao")
+            tipo_rec = st.radio("Tipo", ["Despesa", "Receita"], horizontal=True, key="rec_tipo")
+            valor_rec = st.number_input("Valor", min_value=0.0, step=0.01, key="rec_valor")
+            col_freq, col_int = st.columns(2)
+            freq_rec = col_freq.selectbox("Repete", list(FREQUENCIAS), key="rec_frequencia")
+            intervalo_rec = col_int.number_input("A cada", min_value=1, value=1, step=1, key="rec_intervalo")
+            fim_rec = st.date_input("Até (opcional)", value=None, key="rec_fim")
+            if st.form_submit_button("Criar Recorrência"):
+                valor_final = -valor_rec if tipo_rec == "Despesa" else valor_rec
+                if criar_recorrencia(user_id, inicio_rec, cat_rec, desc_rec, tipo_rec, valor_final, freq_rec,
+                                     int(intervalo_rec), fim_rec):
+                    st.success("Criada!")
                     st.rerun()
-                else:
-                    st.warning("Nada fixo.")
+
+        regras = ler_recorrencias(user_id)
+        ativas = regras[regras["fim"].isna() | (regras["fim"] >= pd.Timestamp(date.today()))]
+        if not ativas.empty:
+            rotulos = (ativas["id"].astype(str) + " - " + ativas["descricao"].fillna("").astype(str) + " ("
+                       + formatar_centavos(ativas["valor_centavos"]) + " " + ativas["frequencia"].astype(str) + ")")
+            escolhida = st.selectbox("Regra", rotulos.tolist(), key="rec_escolhida")
+            id_regra = int(escolhida.split(" - ")[0])
+            col_enc, col_exc = st.columns(2)
+            if col_enc.button("Encerrar", key="rec_encerrar", use_container_width=True):
+                encerrar_recorrencia(id_regra, user_id, date.today())
+                st.rerun()
+            if col_exc.button("Excluir", key="rec_excluir", use_container_width=True):
+                excluir_recorrencia(id_regra, user_id)
+                st.rerun()
+
+        # Migração dos fixos antigos (clonados mês a mês) para regras
+        mes_fixos = st.selectbox("Fixos de:", lista_meses, key="rec_mes_fixos")
+        if st.button("Transformar em recorrências", key="rec_converter"):
+            criadas = converter_fixos_em_recorrencias(user_id, mes_fixos)
+            if criadas:
+                st.success(f"{criadas} recorrência(s) criada(s)!")
+                st.rerun()
+            else:
+                st.warning("Nenhum fixo avulso nesse mês.")
 
     with st.sidebar.expander("🎯 Definir Metas"):
         cat_meta = st.selectbox("Categoria", [c for c in lista_categorias if "Receita" not in c])
@@ -56,13 +139,14 @@ def show_dashboard(user_id, df_bruto, lista_categorias):
     with col_filtro:
         mes_selecionado = st.selectbox("📅 Período:", lista_meses)
     
-    df_mes = df_bruto[df_bruto['mes_ano'] == mes_selecionado].copy()
-
-    # --- CÁLCULOS ---
-    receitas = df_mes[df_mes["valor"] > 0]["valor"].sum()
-    despesas = df_mes[df_mes["valor"] < 0]["valor"].sum()
-    saldo = receitas + despesas
-    falta_pagar = df_mes[(df_mes["valor"] < 0) & (df_mes["pago"] == False)]["valor"].sum()
+    # --- CÁLCULOS (somados no banco) ---
+    with etapa("dashboard.consultas"):
+        kpis = resumo_mes(user_id, mes_selecionado)
+        receitas = kpis["receitas"]
+        despesas = kpis["despesas"]
+        saldo = kpis["saldo"]
+        falta_pagar = kpis["falta_pagar"]
+        df_gastos = gastos_por_categoria(user_id, mes_selecionado)
 
     # --- CARDS DE KPI ---
     st.markdown("<br>", unsafe_allow_html=True) 
@@ -101,34 +185,25 @@ def show_dashboard(user_id, df_bruto, lista_categorias):
     st.divider()
 
     # --- METAS ---
-    df_metas = ler_metas(user_id)
-    if not df_metas.empty:
-        st.subheader("🎯 Metas do Mês")
-        gastos_cat = df_mes[df_mes["valor"] < 0].copy()
-        gastos_cat["valor"] = gastos_cat["valor"].abs()
-        gastos_por_cat = gastos_cat.groupby("categoria")["valor"].sum()
+    with etapa("dashboard.metas"):
+        df_metas = ler_metas(user_id)
+        if not df_metas.empty:
+            st.subheader("🎯 Metas do Mês")
         
-        cols_meta = st.columns(3)
-        idx = 0
-        for _, row in df_metas.iterrows():
-            cat = row['categoria']
-            teto = row['valor_limite']
-            gasto = gastos_por_cat.get(cat, 0.0)
-            perc = min(gasto / teto, 1.0) if teto > 0 else 0
-            
-            with cols_meta[idx % 3]:
-                st.markdown(f"**{cat}**")
-                if perc >= 1.0:
-                    st.error(f"🚨 {formatar_real(gasto)} / {formatar_real(teto)}")
-                    st.progress(1.0)
-                elif perc > 0.8:
-                    st.warning(f"⚠️ {formatar_real(gasto)}")
-                    st.progress(perc)
-                else:
-                    st.caption(f"{formatar_real(gasto)} de {formatar_real(teto)}")
-                    st.progress(perc)
-            idx += 1
-        st.divider()
+            cols_meta = st.columns(3)
+            for idx, (cat, teto, gasto, perc) in enumerate(calcular_metas(df_metas, df_gastos)):
+                with cols_meta[idx % 3]:
+                    st.markdown(f"**{cat}**")
+                    if perc >= 1.0:
+                        st.error(f"🚨 {formatar_real(gasto)} / {formatar_real(teto)}")
+                        st.progress(1.0)
+                    elif perc > 0.8:
+                        st.warning(f"⚠️ {formatar_real(gasto)}")
+                        st.progress(perc)
+                    else:
+                        st.caption(f"{formatar_real(gasto)} de {formatar_real(teto)}")
+                        st.progress(perc)
+            st.divider()
 
     # --- ÁREA PRINCIPAL ---
     col_graf, col_tab = st.columns([1, 2])
@@ -136,46 +211,60 @@ def show_dashboard(user_id, df_bruto, lista_categorias):
     with col_graf:
         with st.container(border=True):
             st.subheader("Gastos")
-            df_desp = df_mes[df_mes["valor"] < 0].copy()
-            if not df_desp.empty:
-                df_desp["abs_valor"] = df_desp["valor"].abs()
-                total_abs = df_desp["abs_valor"].sum()
-                
-                fig = px.pie(df_desp, values='abs_valor', names='categoria', hole=0.65, color_discrete_sequence=px.colors.qualitative.Pastel)
-                fig.add_annotation(text=f"<b>R$ {total_abs:,.0f}</b>", x=0.5, y=0.5, showarrow=False, font_size=18, font_color="#555")
-                fig.update_traces(textposition='outside', textinfo='percent+label')
-                fig.update_layout(showlegend=False, margin=dict(t=20, b=20, l=20, r=20), height=350)
-                st.plotly_chart(fig, use_container_width=True)
+            if not df_gastos.empty:
+                with etapa("dashboard.grafico"):
+                    st.plotly_chart(figura_em_cache(montar_grafico_gastos, df_gastos), use_container_width=True)
             else:
                 st.info("Sem dados.")
 
     with col_tab:
         with st.container(border=True):
             st.subheader("Extrato Detalhado")
-            df_show = df_mes.copy()
-            df_show['Vencimento'] = df_show['data'].dt.strftime('%d/%m')
-            df_show['Status'] = df_show['pago'].apply(lambda x: "✅" if x else "🕒")
-            df_show['Valor_Visual'] = df_show['valor'].apply(formatar_real)
+            c_busca, c_ordem, c_sentido = st.columns([2, 1, 1])
+            busca = c_busca.text_input("🔎 Buscar", placeholder="Descrição ou categoria", key="extrato_busca")
+            ordem = c_ordem.selectbox("Ordenar por", list(ORDENAR_POR), key="extrato_ordem")
+            decrescente = c_sentido.toggle("Decrescente", key="extrato_decrescente")
+
+            # Cursores das páginas já vistas (o da primeira é None); mudar o filtro volta ao início
+            filtro = (mes_selecionado, ordem, decrescente, busca)
+            if st.session_state.get("extrato_filtro") != filtro:
+                st.session_state["extrato_filtro"] = filtro
+                st.session_state["extrato_cursores"] = [None]
+            cursores = st.session_state["extrato_cursores"]
 
-            cols_show = ["id", "Vencimento", "categoria", "descricao", "Valor_Visual", "Status"]
+            with etapa("dashboard.extrato"):
+                df_pagina, proximo = ler_extrato_pagina(user_id, mes_selecionado, ORDENAR_POR[ordem], decrescente,
+                                                        busca, cursores[-1])
+                total = contar_extrato(user_id, mes_selecionado, busca)
+                df_show, opcoes = preparar_extrato(df_pagina)
+
+                cols_show = ["id", "Vencimento", "categoria", "descricao", "Valor_Visual", "Status"]
             
-            st.dataframe(
-                df_show[cols_show].style.map(colorir_valores, subset=['Valor_Visual']),
-                hide_index=True,
-                use_container_width=True,
-                height=350
-            )
+                st.dataframe(
+                    df_show[cols_show].style.apply(colorir_valores, subset=['Valor_Visual']),
+                    hide_index=True,
+                    use_container_width=True,
+                    height=350
+                )
+
+            c_ant, c_pag, c_prox = st.columns([1, 2, 1])
+            if c_ant.button("◀ Anterior", disabled=len(cursores) == 1, key="extrato_anterior"):
+                cursores.pop()
+                st.rerun()
+            c_pag.caption(f"Página {len(cursores)} de {max(math.ceil(total / EXTRATO_POR_PAGINA), 1)} · {total} lançamentos")
+            if c_prox.button("Próxima ▶", disabled=proximo is None, key="extrato_proxima"):
+                cursores.append(proximo)
+                st.rerun()
 
             # --- AQUI ESTÁ A CORREÇÃO: ABAS PARA GERENCIAR ---
             with st.expander("⚡ Gerenciar Lançamento (Editar / Excluir)"):
                 if not df_show.empty:
                     # Seletor do Item
-                    opcoes = df_show.apply(lambda x: f"{x['id']} - {x['descricao']} ({x['Valor_Visual']})", axis=1)
                     item_sel = st.selectbox("Selecione o item para alterar:", options=opcoes)
                     
                     if item_sel:
                         id_sel = int(item_sel.split(" -")[0])
-                        item_atual = df_mes[df_mes['id'] == id_sel].iloc[0]
+                        item_atual = df_pagina[df_pagina['id'] == id_sel].iloc[0]
 
                         # Criamos abas para separar ações rápidas da edição completa
                         tab_acoes, tab_editar = st.tabs(["⚡ Ações Rápidas", "📝 Editar Dados"])
@@ -199,7 +288,7 @@ def show_dashboard(user_id, df_bruto, lista_categorias):
                             with st.form(key="form_editar"):
                                 c1, c2 = st.columns(2)
                                 n_desc = c1.text_input("Descrição", value=item_atual['descricao'])
-                                n_val = c2.number_input("Valor (Positivo=Receita / Negativo=Despesa)", value=float(item_atual['valor']), step=0.01)
+                                n_val = c2.number_input("Valor (Positivo=Receita / Negativo=Despesa)", value=item_atual['valor_centavos'] / 100, step=0.01)
                                 
                                 c3, c4 = st.columns(2)
                                 # Lógica para garantir que a categoria atual esteja na lista
@@ -207,7 +296,7 @@ def show_dashboard(user_id, df_bruto, lista_categorias):
                                 n_cat = c3.selectbox("Categoria", lista_categorias, index=idx_cat)
                                 n_dat = c4.date_input("Data Vencimento", value=item_atual['data'])
                                 
-                                n_fix = st.checkbox("É uma conta fixa mensal?", value=item_atual['fixo'])
+                                n_fix = st.checkbox("É uma conta fixa mensal?", value=bool(item_atual['fixo']))
                                 
                                 if st.form_submit_button("💾 Salvar Alterações"):
                                     atualizar_movimento(id_sel, user_id, n_dat, n_cat, n_desc, n_val, n_fix)
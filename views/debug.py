@@ -0,0 +1,56 @@
+import json
+import os
+
+import pandas as pd
+import streamlit as st
+from services.cache import estatisticas_cache
+from services.compartilhado import estatisticas_compartilhado
+from services.database import estatisticas_pool
+from services.fila_escrita import estatisticas_fila
+from services.instrumentacao import metricas_sessao, exportar_metricas, metricas_prometheus
+
+def debug_ativo():
+    """Liga com FINANCAS_DEBUG=1 ou `debug = true` no secrets.toml.
+
+    Só pela configuração do servidor: o painel mostra pool, cache, fila e as
+    métricas de todas as sessões, nada que um visitante possa ligar pela URL.
+    """
+    if os.environ.get("FINANCAS_DEBUG", "") not in ("", "0"):
+        return True
+    try:
+        return bool(st.secrets.get("debug", False))
+    except Exception:
+        return False
+
+
+def show_painel_debug():
+    """Painel lateral com os tempos da rerun atual, totais da sessão, pool, cache, fila e estado compartilhado."""
+    metricas = metricas_sessao()
+    with st.sidebar.expander("🐞 Desempenho (debug)", expanded=True):
+        medidas = pd.DataFrame(metricas["rerun_atual"])
+        if not medidas.empty:
+            db = medidas[(medidas["tipo"] == "db") & ~medidas["aninhada"]]
+            st.caption(f"Rerun atual: {len(db)} chamadas ao banco, {db['ms'].sum():.1f} ms, "
+                       f"{int(db['linhas'].fillna(0).sum())} linhas")
+            st.dataframe(medidas[["nome", "ms", "linhas", "bytes"]].round(2), hide_index=True,
+                         use_container_width=True)
+
+        ultima = metricas["ultima_rerun"]
+        if ultima:
+            st.caption(f"Rerun anterior: {ultima['resumo']['total_ms']:.0f} ms no total")
+
+        totais = pd.DataFrame.from_dict(metricas["totais"], orient="index")
+        if not totais.empty:
+            st.markdown(f"**Sessão** ({metricas['reruns']} reruns)")
+            totais["media_ms"] = totais["ms"] / totais["chamadas"]
+            st.dataframe(totais[["chamadas", "media_ms", "max_ms", "linhas"]].round(2).sort_values("media_ms", ascending=False),
+                         use_container_width=True)
+
+        st.markdown("**Pool / Cache / Fila de escrita / Compartilhado**")
+        st.json({"pool": estatisticas_pool(), "cache": estatisticas_cache(), "fila": estatisticas_fila(),
+                 "compartilhado": estatisticas_compartilhado()}, expanded=False)
+
+        c1, c2 = st.columns(2)
+        c1.download_button("JSON", json.dumps(exportar_metricas(), ensure_ascii=False, indent=2),
+                           file_name="metricas.json", mime="application/json")
+        c2.download_button("Prometheus", metricas_prometheus(), file_name="metricas.prom", mime="text/plain")
@@ -0,0 +1,39 @@
+"""Figuras do plotly memorizadas pelo conteúdo dos dados.
+
+Montar um gráfico custa dezenas de ms (o px.pie do dashboard ~30 ms) e os dados
+por trás (gastos agregados do mês, séries mensais) quase nunca mudam de uma
+rerun para a outra. A chave é um hash do conteúdo: dado novo é chave nova, não
+há tag para invalidar, e a figura velha sai pelo TTL/LRU do cache do processo.
+Como a chave é o próprio dado, duas sessões com os mesmos números dividem a
+figura sem ver nada uma da outra.
+
+As figuras ficam só no cache deste processo (não são dados que a loja
+compartilhada aceite) e contam no teto de bytes pelo tamanho do JSON delas.
+"""
+import hashlib
+
+import pandas as pd
+from pandas.util import hash_pandas_object
+
+from services.cache import cache
+
+
+def _assinatura(valor):
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        colunas = tuple(map(str, valor.columns)) if isinstance(valor, pd.DataFrame) else str(valor.name)
+        hashes = hash_pandas_object(valor, index=True).to_numpy()
+        return colunas, hashlib.blake2b(hashes.tobytes(), digest_size=16).digest()
+    return valor
+
+
+def figura_em_cache(montar, *dados):
+    """montar(*dados), reaproveitando a figura se os dados forem iguais aos de uma chamada anterior.
+
+    A figura é compartilhada: quem recebe só pode desenhá-la (st.plotly_chart não a altera).
+    """
+    chave = ("figura", montar.__module__, montar.__name__) + tuple(_assinatura(d) for d in dados)
+    achou, figura = cache.obter(chave, local=True)
+    if not achou:
+        figura = montar(*dados)
+        cache.guardar(chave, figura, (), local=True, tamanho=len(figura.to_json()))
+    return figura
@@ -0,0 +1,80 @@
+import pandas as pd
+import streamlit as st
+from views.dashboard import formatar_real
+from views.styles import apply_custom_style
+from services.crud import listar_meses, relatorio_anual
+from services.exportacao import FORMATOS, arquivo_exportado, formatos_disponiveis
+from services.instrumentacao import etapa
+
+# --- PREPARAÇÃO DE DADOS (sem Streamlit, usada também pelos benchmarks) ---
+
+def anos_com_dados(lista_meses):
+    """Anos ("AAAA") dos meses com lançamentos, do mais recente para o mais antigo."""
+    return sorted({mes[:4] for mes in lista_meses}, reverse=True)
+
+def relatorio_com_total(df_relatorio):
+    """O relatório anual com uma linha "Total" no fim (os meses do total são os do ano inteiro)."""
+    if df_relatorio.empty:
+        return df_relatorio
+    total = df_relatorio.drop(columns=["categoria", "meses"]).sum()
+    linha = pd.DataFrame([{"categoria": "Total", **total.to_dict(), "meses": int(df_relatorio["meses"].max())}])
+    linha["lancamentos"] = linha["lancamentos"].astype(df_relatorio["lancamentos"].dtype)
+    return pd.concat([df_relatorio, linha], ignore_index=True)
+
+def show_relatorios(user_id):
+    with etapa("relatorios.estilo"):
+        apply_custom_style()
+
+    st.markdown("## 🧾 Relatórios e Exportação")
+
+    with etapa("relatorios.meses"):
+        anos = anos_com_dados(listar_meses(user_id))
+    if not anos:
+        st.info("Sem lançamentos para relatar ainda.")
+        return
+
+    # --- RELATÓRIO ANUAL (somado do resumo mensal) ---
+    ano = st.selectbox("Ano", anos, key="relatorio_ano")
+    with etapa("relatorios.consulta"):
+        df_relatorio = relatorio_anual(user_id, ano)
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Receitas", formatar_real(df_relatorio["receitas"].sum()))
+    c2.metric("Despesas", formatar_real(df_relatorio["despesas"].sum()))
+    c3.metric("Saldo", formatar_real(df_relatorio["saldo"].sum()))
+
+    tabela = relatorio_com_total(df_relatorio)
+    st.dataframe(
+        tabela,
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "categoria": "Categoria",
+            "receitas": st.column_config.NumberColumn("Receitas (R$)", format="%.2f"),
+            "despesas": st.column_config.NumberColumn("Despesas (R$)", format="%.2f"),
+            "saldo": st.column_config.NumberColumn("Saldo (R$)", format="%.2f"),
+            "pendente": st.column_config.NumberColumn("A pagar (R$)", format="%.2f"),
+            "lancamentos": "Lançamentos",
+            "meses": "Meses",
+        },
+    )
+    st.download_button("⬇️ Relatório de " + ano + " (CSV)", tabela.to_csv(index=False).encode("utf-8"),
+                       file_name=f"relatorio-{ano}.csv", mime="text/csv", on_click="ignore",
+                       key="relatorio_baixar")
+
+    st.divider()
+
+    # --- EXPORTAÇÃO DOS LANÇAMENTOS ---
+    # O arquivo só é gerado quando o botão é clicado (numa thread à parte), lendo o banco em blocos
+    st.subheader("📤 Exportar Lançamentos")
+    c_formato, c_periodo = st.columns(2)
+    formato = c_formato.radio("Formato", formatos_disponiveis(), horizontal=True, key="exportar_formato",
+                              format_func=str.upper)
+    periodo = c_periodo.radio("Período", ["Todo o histórico", f"Só {ano}"], horizontal=True, key="exportar_periodo")
+    ano_exportado = None if periodo == "Todo o histórico" else ano
+    if "parquet" not in formatos_disponiveis():
+        st.caption("Para exportar em Parquet, instale o pyarrow.")
+
+    nome = f"lancamentos-{ano_exportado or 'completo'}.{formato}"
+    st.download_button(f"⬇️ Baixar {nome}", lambda: arquivo_exportado(user_id, formato, ano_exportado),
+                       file_name=nome, mime=FORMATOS[formato], on_click="ignore", key="exportar_baixar")
@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+from views.figuras import figura_em_cache
+from views.styles import apply_custom_style
+from views.dashboard import formatar_real
+from services.instrumentacao import etapa
+from services import recorrencias
+from services.crud import serie_mensal, ler_fixos_recentes, ler_recorrencias
+
+JANELA_MESES = 12
+
+# --- PREPARAÇÃO DE DADOS (sem Streamlit, usada também pelos benchmarks) ---
+# Os meses andam como inteiros: a chave AAAAMM do banco vira um ordinal
+# (ano * 12 + mês - 1), onde "mês seguinte" é só +1. Tudo é coluna inteira.
+
+def ordinal_mes(chave):
+    chave = np.asarray(chave)
+    return (chave // 100) * 12 + chave % 100 - 1
+
+def datas_do_ordinal(ordinal):
+    """Primeiro dia de cada mês, para o eixo dos gráficos."""
+    ordinal = np.asarray(ordinal)
+    return pd.to_datetime(pd.DataFrame({"year": ordinal // 12, "month": ordinal % 12 + 1, "day": 1}))
+
+def montar_series(df_serie, janela=JANELA_MESES):
+    """Série mensal completa (meses sem lançamento entram zerados), em reais.
+
+    Colunas: receitas, despesas (negativas), saldo, saldo_acumulado e as médias
+    móveis de `janela` meses de receitas, despesas e saldo.
+    """
+    colunas = ["receitas", "despesas", "saldo", "saldo_acumulado",
+               "receitas_media", "despesas_media", "saldo_media"]
+    if df_serie.empty:
+        return pd.DataFrame(columns=colunas, index=pd.Index([], name="ordinal"))
+    ordinal = ordinal_mes(df_serie["mes"].to_numpy())
+    inicio = ordinal.min()
+    posicao = ordinal - inicio
+    # bincount soma por mês direto nos arrays (o groupby faria o mesmo com mais overhead)
+    tamanho = posicao.max() + 1
+    receitas = np.bincount(posicao, weights=df_serie["receitas_centavos"].to_numpy(), minlength=tamanho) / 100
+    despesas = np.bincount(posicao, weights=df_serie["despesas_centavos"].to_numpy(), minlength=tamanho) / 100
+
+    series = pd.DataFrame({"receitas": receitas, "despesas": despesas},
+                          index=pd.Index(np.arange(inicio, inicio + tamanho), name="ordinal"))
+    series["saldo"] = series["receitas"] + series["despesas"]
+    series["saldo_acumulado"] = series["saldo"].cumsum()
+    medias = series[["receitas", "despesas", "saldo"]].rolling(janela, min_periods=1).mean()
+    series[["receitas_media", "despesas_media", "saldo_media"]] = medias.to_numpy()
+    return series[colunas]
+
+def gastos_categoria_moveis(df_serie, janela=JANELA_MESES):
+    """Gasto (positivo) por categoria e mês, suavizado pela soma móvel de `janela` meses.
+
+    Devolve uma tabela mês x categoria; categorias sem despesa ficam de fora.
+    """
+    if df_serie.empty:
+        return pd.DataFrame()
+    despesas = df_serie[df_serie["despesas_centavos"] < 0]
+    if despesas.empty:
+        return pd.DataFrame()
+    tabela = despesas.pivot_table(index="mes", columns="categoria", values="despesas_centavos",
+                                  aggfunc="sum", fill_value=0, observed=True)
+    ordinal = ordinal_mes(tabela.index.to_numpy())
+    tabela.index = pd.Index(ordinal, name="ordinal")
+    tabela = tabela.reindex(np.arange(ordinal.min(), ordinal.max() + 1), fill_value=0)
+    return -tabela.rolling(janela, min_periods=1).sum() / 100
+
+def projetar_fixos(df_fixos, series, meses, regras=None):
+    """Projeta `meses` à frente: as ocorrências das regras de recorrência mês a mês
+    (anuais só no mês delas, regras com fim param) mais os fixos avulsos do último
+    mês que os tem, repetidos todo mês.
+
+    Devolve por mês futuro: compromissos (despesas fixas), receitas_fixas,
+    saldo_fixo e o saldo_acumulado continuando a série histórica.
+    """
+    hoje = pd.Timestamp.today()
+    ultimo = series.index.max() if not series.empty else ordinal_mes(hoje.year * 100 + hoje.month)
+    saldo_atual = series["saldo_acumulado"].iloc[-1] if not series.empty else 0.0
+    centavos = df_fixos["valor_centavos"].to_numpy() if not df_fixos.empty else np.zeros(0, dtype="int64")
+    compromissos = np.full(meses, -centavos[centavos < 0].sum() / 100)
+    receitas_fixas = np.full(meses, centavos[centavos > 0].sum() / 100)
+
+    futuro = np.arange(ultimo + 1, ultimo + 1 + meses)
+    if regras is not None and not regras.empty and meses:
+        inicio, fim = datas_do_ordinal([ultimo + 1, ultimo + 1 + meses])
+        virtuais = recorrencias.ocorrencias(regras, inicio, fim)
+        posicao = ordinal_mes(virtuais["mes"].to_numpy()) - (ultimo + 1)
+        valor = virtuais["valor_centavos"].to_numpy(dtype="int64")
+        compromissos -= np.bincount(posicao, weights=np.minimum(valor, 0), minlength=meses) / 100
+        receitas_fixas += np.bincount(posicao, weights=np.maximum(valor, 0), minlength=meses) / 100
+
+    saldo_fixo = receitas_fixas - compromissos
+    return pd.DataFrame({
+        "compromissos": compromissos,
+        "receitas_fixas": receitas_fixas,
+        "saldo_fixo": saldo_fixo,
+        "saldo_acumulado": saldo_atual + np.cumsum(saldo_fixo),
+    }, index=pd.Index(futuro, name="ordinal"))
+
+def montar_grafico_saldo(series, projecao):
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=datas_do_ordinal(series.index), y=series["saldo_acumulado"],
+                             name="Saldo acumulado", mode="lines", line=dict(color="#3b82f6", width=3)))
+    if not projecao.empty:
+        # A projeção começa no último ponto real para a linha não ficar solta
+        x = np.r_[series.index[-1:], projecao.index] if not series.empty else projecao.index
+        y = np.r_[series["saldo_acumulado"].iloc[-1:], projecao["saldo_acumulado"]] if not series.empty \
+            else projecao["saldo_acumulado"]
+        fig.add_trace(go.Scatter(x=datas_do_ordinal(x), y=y, name="Projeção (recorrências e fixos)", mode="lines",
+                                 line=dict(color="#3b82f6", width=2, dash="dash")))
+    fig.update_layout(margin=dict(t=20, b=20, l=20, r=20), height=320, hovermode="x unified",
+                      legend=dict(orientation="h", y=-0.15))
+    return fig
+
+def montar_grafico_fluxo(series):
+    x = datas_do_ordinal(series.index)
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=x, y=series["receitas"], name="Receitas", marker_color="#86efac"))
+    fig.add_trace(go.Bar(x=x, y=series["despesas"], name="Despesas", marker_color="#fca5a5"))
+    fig.add_trace(go.Scatter(x=x, y=series["saldo_media"], name=f"Saldo (média {JANELA_MESES}m)",
+                             mode="lines", line=dict(color="#1e293b", width=2)))
+    fig.update_layout(barmode="relative", margin=dict(t=20, b=20, l=20, r=20), height=320,
+                      hovermode="x unified", legend=dict(orientation="h", y=-0.15))
+    return fig
+
+def montar_grafico_categorias(tabela):
+    x = datas_do_ordinal(tabela.index)
+    fig = go.Figure()
+    for categoria in tabela.columns:
+        fig.add_trace(go.Scatter(x=x, y=tabela[categoria], name=str(categoria), mode="lines"))
+    fig.update_layout(margin=dict(t=20, b=20, l=20, r=20), height=320, hovermode="x unified",
+                      legend=dict(orientation="h", y=-0.15))
+    return fig
+
+def show_tendencias(user_id):
+    with etapa("tendencias.estilo"):
+        apply_custom_style()
+
+    st.markdown("## 📈 Tendências")
+    st.caption(f"Evolução mês a mês, médias de {JANELA_MESES} meses e projeção das recorrências e fixos")
+
+    with etapa("tendencias.consultas"):
+        df_serie = serie_mensal(user_id)
+        df_fixos = ler_fixos_recentes(user_id)
+        regras = ler_recorrencias(user_id)
+    if df_serie.empty:
+        st.info("Sem dados ainda. Os gráficos aparecem depois dos primeiros lançamentos.")
+        return
+
+    col_periodo, col_proj = st.columns([3, 1])
+    anos = sorted({int(m) // 100 for m in df_serie["mes"].unique()})
+    with col_periodo:
+        if len(anos) > 1:
+            desde, ate = st.select_slider("Período", options=anos, value=(max(anos[0], anos[-1] - 4), anos[-1]))
+        else:
+            desde = ate = anos[0]
+    with col_proj:
+        meses_proj = st.number_input("Projetar (meses)", min_value=0, max_value=60, value=6, step=1)
+
+    with etapa("tendencias.calculo"):
+        # As médias móveis usam o histórico todo; o período só recorta o que aparece
+        series = montar_series(df_serie)
+        tabela_cat = gastos_categoria_moveis(df_serie)
+        projecao = projetar_fixos(df_fixos, series, int(meses_proj), regras)
+        visivel = (series.index >= desde * 12) & (series.index < (ate + 1) * 12)
+        series_vis = series[visivel]
+        tabela_vis = tabela_cat[(tabela_cat.index >= desde * 12) & (tabela_cat.index < (ate + 1) * 12)] \
+            if not tabela_cat.empty else tabela_cat
+
+    ultimo = series.iloc[-1]
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Saldo acumulado", formatar_real(ultimo["saldo_acumulado"]))
+    c2.metric(f"Receita média ({JANELA_MESES}m)", formatar_real(ultimo["receitas_media"]))
+    c3.metric(f"Despesa média ({JANELA_MESES}m)", formatar_real(-ultimo["despesas_media"]))
+    if not projecao.empty:
+        c4.metric(f"Saldo em {len(projecao)} meses (fixos)", formatar_real(projecao["saldo_acumulado"].iloc[-1]),
+                  delta=formatar_real(projecao["saldo_fixo"].iloc[0]) + "/mês")
+
+    with etapa("tendencias.graficos"):
+        with st.container(border=True):
+            st.subheader("Saldo acumulado")
+            st.plotly_chart(figura_em_cache(montar_grafico_saldo, series_vis, projecao), use_container_width=True)
+
+        col_fluxo, col_cat = st.columns(2)
+        with col_fluxo:
+            with st.container(border=True):
+                st.subheader("Receitas x Despesas")
+                st.plotly_chart(figura_em_cache(montar_grafico_fluxo, series_vis), use_container_width=True)
+        with col_cat:
+            with st.container(border=True):
+                st.subheader(f"Gastos por categoria ({JANELA_MESES}m)")
+                if tabela_vis.empty:
+                    st.info("Sem despesas no período.")
+                else:
+                    st.plotly_chart(figura_em_cache(montar_grafico_categorias, tabela_vis), use_container_width=True)
+
+    with st.expander("📌 Usados na projeção"):
+        if regras.empty and df_fixos.empty:
+            st.caption("Nenhuma recorrência ou lançamento fixo cadastrado.")
+        if not regras.empty:
+            st.caption("Recorrências")
+            st.dataframe(regras.assign(valor=regras["valor_centavos"] / 100)
+                         [["descricao", "categoria", "valor", "frequencia", "intervalo", "inicio", "fim"]],
+                         hide_index=True, use_container_width=True)
+        if not df_fixos.empty:
+            st.caption("Fixos avulsos (repetidos todo mês)")
+            st.dataframe(df_fixos.assign(valor=df_fixos["valor_centavos"] / 100)[["descricao", "categoria", "valor"]],
+                         hide_index=True, use_container_width=True)